@@ -12,6 +12,7 @@ from inventaire.models import (
     MaterielOrdinateur,
     MaterielEffecteur,
     LicenceLogiciel,
+    StatistiquesZone,
 )
 
 
@@ -120,8 +121,10 @@ class SystemeIndustrielAdmin(admin.ModelAdmin):
         "display_nom_ville",
         "display_nom_quartier",
         "domaine_metier",
+        "display_criticite",
         "display_description",
     ]
+    list_select_related = ["localisation", "domaine_metier"]
     list_filter = [
         "localisation__zone_usid",
         "localisation__nom_ville",
@@ -146,6 +149,10 @@ class SystemeIndustrielAdmin(admin.ModelAdmin):
     def display_nom_quartier(self, obj):
         return obj.localisation.nom_quartier
 
+    @admin.display(description="Criticité", ordering="criticite_calculee")
+    def display_criticite(self, obj):
+        return obj.criticite_calculee
+
     @admin.display(description="Description / commentaire")
     def display_description(self, obj):
         if len(obj.description) < 40:
@@ -153,6 +160,10 @@ class SystemeIndustrielAdmin(admin.ModelAdmin):
         else:
             return obj.description[:35] + "[...]"
 
+    def get_queryset(self, request):
+        """Calcule la criticité de tous les systèmes affichés en une seule requête"""
+        return super().get_queryset(request).avec_criticite()
+
     def save_model(self, request, obj, form, change):
         """Ajoute l'id de l'utilisateur effectuant l'enregistrement"""
         obj.fiche_utilisateur = request.user
@@ -235,3 +246,24 @@ class LicenceLogicielAdmin(admin.ModelAdmin):
         "editeur",
         "logiciel",
     ]
+
+
+@admin.register(StatistiquesZone)
+class StatistiquesZoneAdmin(admin.ModelAdmin):
+    list_display = ["zone_usid", "date_calcul", "a_jour", "total_systemes", "total_contrats"]
+    list_filter = ["a_jour"]
+    ordering = ["zone_usid"]
+    readonly_fields = [
+        "zone_usid",
+        "date_calcul",
+        "a_jour",
+        "total_systemes",
+        "total_contrats",
+        "homologations_expirant",
+        "licences_expirant",
+        "repartitions",
+    ]
+
+    def has_add_permission(self, request):
+        """Les statistiques ne sont créées que par la tâche périodique"""
+        return False
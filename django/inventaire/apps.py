@@ -6,3 +6,7 @@ from django.apps import AppConfig
 class InventaireConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "inventaire"
+
+    def ready(self):
+        # connexion des récepteurs de signaux
+        from inventaire import signals  # noqa: F401
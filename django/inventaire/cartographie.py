@@ -0,0 +1,233 @@
+"""Graphe des interconnexions d'un site, pour sa cartographie
+
+Le graphe d'un site est chargé en un nombre constant de requêtes, quel que soit le nombre de systèmes : les
+localisations du site, les interconnexions partant de ses systèmes, puis ses systèmes et leurs voisins. Une
+interconnexion et sa symétrique ne forment qu'un lien non orienté, dédoublonné avec un ensemble.
+
+Les rendus GoJS et Mermaid sont produits à partir du même graphe en mémoire, puis conservés en cache par site et
+par moteur. Chaque site possède un numéro de version qui est changé par les signaux à chaque modification d'un de
+ses systèmes, d'une de ses localisations ou d'une interconnexion : un système apparaissant aussi sur la
+cartographie des sites de ses voisins, ceux-ci sont invalidés avec lui.
+"""
+
+import logging
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from hashlib import md5
+from json import dumps
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q, QuerySet
+
+from inventaire.models import Interconnexion, Localisation, SystemeIndustriel
+
+logger = logging.getLogger(__name__)
+
+# les moteurs de rendu de la cartographie, tels que choisis dans le formulaire
+MOTEUR_MERMAID = 0
+MOTEUR_GOJS = 1
+
+# un site : sa zone d'USID, sa ville et son quartier
+Site = tuple[str, str, str]
+
+
+@dataclass(frozen=True)
+class Noeud:
+    """Un système industriel de la cartographie"""
+
+    pk: int
+    nom: str
+
+
+@dataclass
+class Lieu:
+    """Une localisation de la cartographie et ses systèmes, 'local' si elle fait partie du site"""
+
+    pk: int
+    nom: str
+    local: bool
+    noeuds: list[Noeud] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class Lien:
+    """Une interconnexion non orientée entre deux systèmes"""
+
+    source: int
+    cible: int
+    liaison: str
+
+
+@dataclass
+class GrapheSite:
+    """Les systèmes d'un site, leurs voisins des autres localisations et les liens entre eux"""
+
+    titre: str
+    site: str
+    lieux: list[Lieu]
+    liens: list[Lien]
+
+
+def construit_graphe(localisations: QuerySet[Localisation]) -> GrapheSite | None:
+    """Charge le graphe des localisations d'un site, None si le site n'a aucune localisation
+
+    Les systèmes à la corbeille et les voisins sans localisation ne sont pas représentés, ni leurs liens.
+    """
+    localisations_site = list(localisations)
+    if not localisations_site:
+        return None
+    pks_site = [k.pk for k in localisations_site]
+
+    # les interconnexions partant des systèmes du site, vers des systèmes représentables
+    interconnexions = Interconnexion.objects.filter(
+        systeme_from__localisation__in=pks_site,
+        systeme_from__fiche_corbeille=False,
+        systeme_to__fiche_corbeille=False,
+        systeme_to__localisation__isnull=False,
+    )
+    aretes = list(interconnexions.order_by("pk").values_list("systeme_from", "systeme_to", "type_liaison"))
+
+    # les systèmes du site et leurs voisins, avec leur localisation, en une seule requête
+    systemes = (
+        SystemeIndustriel.objects.filter(
+            Q(localisation__in=pks_site) | Q(pk__in=interconnexions.values("systeme_to")),
+            fiche_corbeille=False,
+            localisation__isnull=False,
+        )
+        .select_related("localisation")
+        .only("pk", "nom", "localisation")
+        .order_by("nom", "pk")
+    )
+    locales = set(pks_site)
+    lieux = {}
+    for systeme in systemes:
+        lieu = lieux.get(systeme.localisation_id)
+        if lieu is None:
+            lieu = lieux[systeme.localisation_id] = Lieu(
+                pk=systeme.localisation_id,
+                nom=str(systeme.localisation),
+                local=systeme.localisation_id in locales,
+            )
+        lieu.noeuds.append(Noeud(pk=systeme.pk, nom=systeme.nom))
+
+    # une interconnexion et sa symétrique ne donnent qu'un seul lien
+    vus = set()
+    liens = []
+    for source, cible, type_liaison in aretes:
+        clef = (min(source, cible), max(source, cible))
+        if clef not in vus:
+            vus.add(clef)
+            liens.append(Lien(source=source, cible=cible, liaison=Interconnexion.Liaison(type_liaison).label))
+
+    premiere = localisations_site[0]
+    site = f"{premiere.nom_ville} - {premiere.nom_quartier}"
+    return GrapheSite(
+        titre=f"{premiere.get_zone_usid_display()} - {site}",
+        site=site,
+        lieux=sorted(lieux.values(), key=lambda k: (not k.local, k.nom)),
+        liens=liens,
+    )
+
+
+def rendu_gojs(graphe: GrapheSite) -> str:
+    """Le modèle GoJS ('GraphLinksModel') du graphe, en json"""
+    noeuds = [{"key": "base", "text": graphe.titre, "color": "#fcecea", "isGroup": True}]
+    for lieu in graphe.lieux:
+        groupe = {
+            "key": f"loc_{lieu.pk}",
+            "text": lieu.nom,
+            "color": "DarkRed" if lieu.local else "RoyalBlue",
+            "isGroup": True,
+        }
+        if lieu.local:
+            groupe["group"] = "base"
+        noeuds.append(groupe)
+        couleur = "LightCoral" if lieu.local else "SkyBlue"
+        noeuds.extend(
+            {"key": noeud.pk, "text": noeud.nom, "color": couleur, "group": f"loc_{lieu.pk}"} for noeud in lieu.noeuds
+        )
+    liens = [{"from": k.source, "to": k.cible, "text": k.liaison} for k in graphe.liens]
+    return dumps({"class": "GraphLinksModel", "nodeDataArray": noeuds, "linkDataArray": liens})
+
+
+def rendu_mermaid(graphe: GrapheSite) -> str:
+    """Le graphe au format MermaidJS, les localisations du site étant regroupées dans un même sous-graphe"""
+    lignes_locales = ["graph TB", f"subgraph C[{graphe.site}]"]
+    lignes_distantes = []
+    styles = ["style C fill:#fcecea, stroke: DarkRed"]
+    for lieu in graphe.lieux:
+        if lieu.local:
+            lignes, groupe, boite, bordure = lignes_locales, "LightCoral", "MistyRose", "DarkRed"
+        else:
+            lignes, groupe, boite, bordure = lignes_distantes, "LightBlue", "LightCyan", "RoyalBlue"
+        lignes.append(f"subgraph B{lieu.pk}[{lieu.nom}]")
+        styles.append(f"style B{lieu.pk} fill: {groupe}, stroke: {bordure}")
+        for noeud in lieu.noeuds:
+            lignes.append(f'A{noeud.pk}("{noeud.nom}")')
+            styles.append(f"style A{noeud.pk} fill: {boite}, stroke: {bordure}")
+        lignes.append("end")
+    liens = [f"A{k.source} <-- {k.liaison} --> A{k.cible}" for k in graphe.liens]
+    return "\n".join(lignes_locales + ["end"] + lignes_distantes + liens + styles)
+
+
+_RENDUS = {MOTEUR_MERMAID: rendu_mermaid, MOTEUR_GOJS: rendu_gojs}
+
+
+def _clef_version(site: Site) -> str:
+    """Clef du cache de la version de la cartographie d'un site"""
+    empreinte = md5(":".join(site).encode("utf-8"))
+    return f"inventaire:cartographie:version:{empreinte.hexdigest()}"
+
+
+def invalide_cartographies(sites: Iterable[Site]) -> None:
+    """Invalide les cartographies en cache des sites donnés, pour tous les moteurs"""
+    cache.set_many({_clef_version(k): uuid4().hex for k in set(sites)}, timeout=None)
+
+
+def sites_systemes(systemes: Iterable[int] | QuerySet, voisins=True) -> set[Site]:
+    """Les sites des systèmes donnés (clefs primaires), et si 'voisins' ceux des systèmes qui leur sont connectés"""
+    filtre = Q(systemes__in=systemes)
+    if voisins:
+        filtre |= Q(systemes__in=Interconnexion.objects.filter(systeme_from__in=systemes).values("systeme_to"))
+    return set(
+        Localisation.objects.filter(filtre).values_list("zone_usid", "nom_ville", "nom_quartier").distinct().order_by()
+    )
+
+
+def sites_zones(zones: Iterable[str]) -> set[Site]:
+    """Tous les sites des zones données, et les sites voisins de leurs systèmes"""
+    zones = set(zones)
+    sites = sites_systemes(SystemeIndustriel.objects.filter(localisation__zone_usid__in=zones).values("pk"))
+    sites.update(Localisation.objects.filter(zone_usid__in=zones).values_list("zone_usid", "nom_ville", "nom_quartier"))
+    return sites
+
+
+def invalide_cartographies_zones(zones: Iterable[str]) -> None:
+    """Invalide les cartographies de tous les sites des zones données, et des sites voisins de leurs systèmes"""
+    invalide_cartographies(sites_zones(zones))
+
+
+def dessin_site(site: Site, moteur: int) -> tuple[str, str] | None:
+    """Le titre et le dessin de la cartographie d'un site avec le moteur donné, None si le site n'existe pas
+
+    Le dessin est conservé en cache sous la version du site, initialisée si elle est absente du cache : tant que le
+    site n'est pas modifié, la cartographie est obtenue sans aucune requête.
+    """
+    clef_version = _clef_version(site)
+    version = cache.get(clef_version)
+    if version is None:
+        version = uuid4().hex
+        cache.set(clef_version, version, timeout=None)
+    clef = f"inventaire:cartographie:{version}:{moteur}"
+
+    resultat = cache.get(clef)
+    if resultat is None:
+        zone, ville, quartier = site
+        graphe = construit_graphe(Localisation.objects.filter(zone_usid=zone, nom_ville=ville, nom_quartier=quartier))
+        if graphe is None:
+            return None
+        resultat = (graphe.titre, _RENDUS[moteur](graphe))
+        cache.set(clef, resultat, settings.CACHE_CARTOGRAPHIE_DUREE)
+    return resultat
@@ -1,8 +1,12 @@
 """Définition des formulaires de l'inventaire"""
 
 from django import forms
+from django.conf import settings
 from django.contrib.auth.forms import AuthenticationForm
+from django.db import transaction
 
+from inventaire.cartographie import invalide_cartographies, sites_systemes
+from inventaire.graphe import FORMAT_JSON, FORMAT_NDJSON
 from inventaire.widgets import (
     BulmaGridCheckboxSelectMultiple,
     QuartierCheckboxSelectMultiple,
@@ -20,7 +24,7 @@ from inventaire.models import (
     SystemeIndustriel,
     ZoneUsid,
 )
-from inventaire.utils import restreint_zone, ModeRestriction
+from inventaire.utils import invalidations_differees, restreint_zone, ModeRestriction
 
 
 # la connection (déconnection directe avec la vue de contrib.auth)
@@ -79,6 +83,13 @@ class SystemeIndustrielRechercheForm(forms.Form):
         required=False,
         widget=forms.SelectDateWidget,
     )
+    s_criticite = forms.IntegerField(
+        label="Criticité minimale",
+        required=False,
+        min_value=0,
+        max_value=100,
+        widget=forms.NumberInput(attrs={"class": "input is-info"}),
+    )
     # recherche par équipements de type ordinateurs/serveurs
     o_fonction = forms.MultipleChoiceField(
         label="Fonction principale",
@@ -690,6 +701,43 @@ class ImporteExcelForm(forms.Form):
         label="nettoyer la zone avant d'importer le fichier",
         required=False,
     )
+    annule_si_erreur = forms.BooleanField(
+        label="annuler tout l'import à la moindre erreur",
+        required=False,
+    )
+    differentiel = forms.BooleanField(
+        label="n'enregistrer que les différences avec la zone (ce qui est absent du fichier est supprimé)",
+        required=False,
+    )
+    dry_run = forms.BooleanField(
+        label="simuler l'import sans rien enregistrer",
+        required=False,
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get("nettoie") and cleaned_data.get("differentiel"):
+            self.add_error(
+                "differentiel",
+                forms.ValidationError(
+                    "le nettoyage de la zone et l'import différentiel ne peuvent pas être combinés",
+                    code="invalid_nettoie_differentiel",
+                ),
+            )
+        return cleaned_data
+
+
+class ImporteLotExcelForm(ImporteExcelForm):
+    """Import d'un lot de fichiers excel, un par zone, dans une archive zip (fonctionnalité temporaire)"""
+
+    zone = None
+    fichier = forms.FileField(
+        label="archive zip des fichiers excel",
+        required=True,
+        widget=forms.FileInput(
+            attrs={"class": "file-input", "accept": ".zip"},
+        ),
+    )
 
 
 # les api pour les requêtes AJAX
@@ -756,11 +804,107 @@ class ApiListeFonctionsMetierForm(forms.Form):
         self.fields["domaine"].choices = self._obtient_tous_domaines  # pas d'appel de la fonction
 
 
+class ApiParcoursForm(forms.Form):
+    """Formulaire pour l'API qui parcourt les interconnexions à partir d'un système, à plusieurs sauts"""
+
+    profondeur = forms.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=settings.PARCOURS_PROFONDEUR_MAX,
+    )
+    limite = forms.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=settings.PARCOURS_LIMITE_MAX,
+    )
+    reseau = forms.TypedMultipleChoiceField(
+        required=False,
+        choices=Interconnexion.Reseau,
+        coerce=int,
+    )
+
+    def clean(self):
+        """Les valeurs maximales sont utilisées par défaut, et aucun filtre si aucun réseau n'est demandé"""
+        cleaned_data = super().clean()
+        cleaned_data["profondeur"] = cleaned_data.get("profondeur") or settings.PARCOURS_PROFONDEUR_MAX
+        cleaned_data["limite"] = cleaned_data.get("limite") or settings.PARCOURS_LIMITE_MAX
+        cleaned_data["reseau"] = cleaned_data.get("reseau") or None
+        return cleaned_data
+
+
+class ApiGrapheForm(forms.Form):
+    """Formulaire pour l'API qui exporte le graphe des interconnexions"""
+
+    usid = forms.MultipleChoiceField(
+        required=False,
+        choices=ZoneUsid,
+    )
+    format = forms.ChoiceField(
+        required=False,
+        choices=((FORMAT_NDJSON, "NDJSON"), (FORMAT_JSON, "json")),
+    )
+
+    def clean(self):
+        """Le format NDJSON est utilisé par défaut"""
+        cleaned_data = super().clean()
+        cleaned_data["format"] = cleaned_data.get("format") or FORMAT_NDJSON
+        return cleaned_data
+
+
+class BaseInterconnexionFormset(forms.BaseInlineFormSet):
+    """Sous-formulaires des interconnexions, enregistrées en masse avec leurs symétriques
+
+    Les suppressions (et les anciens liens des interconnexions dont le système connecté a changé) sont faites en
+    une requête, puis les créations et modifications en une requête par lot, quel que soit le nombre de liens.
+    L'enregistrement en masse n'envoyant pas de signaux, les cartographies des sites du système et de ses voisins,
+    avant et après modification, sont invalidées ici, une seule fois (la suppression ne les invalide donc pas).
+    """
+
+    def save(self, commit=True):
+        if not commit:
+            return super().save(commit=False)
+
+        self.new_objects = []
+        self.changed_objects = []
+        self.deleted_objects = []
+        a_supprimer = []
+        a_enregistrer = []
+        for form in self.initial_forms:
+            interconnexion = form.instance
+            if interconnexion.pk is None:
+                continue
+            if self.can_delete and self._should_delete_form(form):
+                self.deleted_objects.append(interconnexion)
+                a_supprimer.append(interconnexion.pk)
+            elif form.has_changed():
+                if "systeme_to" in form.changed_data:
+                    a_supprimer.append(interconnexion.pk)
+                self.changed_objects.append((interconnexion, form.changed_data))
+                a_enregistrer.append(interconnexion)
+        for form in self.extra_forms:
+            if form.has_changed() and not (self.can_delete and self._should_delete_form(form)):
+                self.new_objects.append(form.instance)
+                a_enregistrer.append(form.instance)
+
+        # le système modifié peut avoir été créé après la validation des sous-formulaires
+        for interconnexion in a_enregistrer:
+            setattr(interconnexion, self.fk.name, self.instance)
+        sites = sites_systemes([self.instance.pk])
+        with transaction.atomic():
+            if a_supprimer:
+                with invalidations_differees():
+                    Interconnexion.objects.filter(pk__in=a_supprimer).delete()
+            Interconnexion.objects.relie(a_enregistrer)
+        invalide_cartographies(sites | sites_systemes([self.instance.pk]))
+        return self.new_objects + [k for k, _ in self.changed_objects]
+
+
 # création des sous-formulaires liés (formsets) des systèmes
 InterconnexionFormset = forms.inlineformset_factory(
     SystemeIndustriel,
     Interconnexion,
     form=SystemeIndustrielModificationInterconnexionForm,
+    formset=BaseInterconnexionFormset,
     extra=1,
     can_delete=True,
     fk_name="systeme_from",
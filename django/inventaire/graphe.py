@@ -0,0 +1,109 @@
+"""Export du réseau des interconnexions des systèmes industriels, en flux
+
+Les systèmes (noeuds) puis les interconnexions (liens) des zones données sont lus avec des curseurs côté serveur
+('iterator'), par lots de taille fixe, et sérialisés au fil de l'eau : la mémoire utilisée ne dépend pas de la
+taille du réseau exporté. Une interconnexion et sa symétrique ne forment qu'un seul lien, celui partant du système
+de plus petite clef primaire.
+
+Deux formats sont proposés : NDJSON, un objet json par ligne précédé de son type, et un unique document json
+'{"noeuds": [...], "liens": [...]}' produit par morceaux.
+"""
+
+import logging
+from collections.abc import Iterable, Iterator
+from json import dumps
+
+from django.db.models import F
+
+from inventaire.models import Interconnexion, SystemeIndustriel
+
+logger = logging.getLogger(__name__)
+
+FORMAT_NDJSON = "ndjson"
+FORMAT_JSON = "json"
+
+
+def noeuds(zones: Iterable[str], taille_lot: int) -> Iterator[dict]:
+    """Les systèmes des zones données, hors corbeille, avec leur localisation, leur domaine et leur criticité"""
+    systemes = (
+        SystemeIndustriel.objects.filter(localisation__zone_usid__in=zones, fiche_corbeille=False)
+        .order_by("pk")
+        .values_list(
+            "pk",
+            "nom",
+            "indice_criticite",
+            "domaine_metier__nom",
+            "localisation__zone_usid",
+            "localisation__nom_ville",
+            "localisation__nom_quartier",
+            "localisation__zone_quartier",
+        )
+    )
+    for pk, nom, criticite, domaine, zone, ville, quartier, zone_quartier in systemes.iterator(chunk_size=taille_lot):
+        yield {
+            "id": pk,
+            "nom": nom,
+            "criticite": criticite,
+            "domaine": domaine,
+            "localisation": {"zone_usid": zone, "ville": ville, "quartier": quartier, "zone_quartier": zone_quartier},
+        }
+
+
+def liens(zones: Iterable[str], taille_lot: int) -> Iterator[dict]:
+    """Les interconnexions entre deux systèmes exportés, une seule par paire de systèmes"""
+    interconnexions = (
+        Interconnexion.objects.filter(
+            systeme_from__lt=F("systeme_to"),
+            systeme_from__localisation__zone_usid__in=zones,
+            systeme_from__fiche_corbeille=False,
+            systeme_to__localisation__zone_usid__in=zones,
+            systeme_to__fiche_corbeille=False,
+        )
+        .order_by("pk")
+        .values_list("systeme_from", "systeme_to", "type_reseau", "type_liaison", "protocole")
+    )
+    for source, cible, reseau, liaison, protocole in interconnexions.iterator(chunk_size=taille_lot):
+        yield {
+            "source": source,
+            "cible": cible,
+            "type_reseau": Interconnexion.Reseau(reseau).label,
+            "type_liaison": Interconnexion.Liaison(liaison).label,
+            "protocole": protocole,
+        }
+
+
+def _par_lots(lignes: Iterable[str], taille_lot: int) -> Iterator[str]:
+    """Regroupe les lignes en morceaux de 'taille_lot' lignes, pour ne pas envoyer un morceau par objet"""
+    lot = []
+    for ligne in lignes:
+        lot.append(ligne)
+        if len(lot) >= taille_lot:
+            yield "".join(lot)
+            lot = []
+    if lot:
+        yield "".join(lot)
+
+
+def _lignes_ndjson(zones: list[str], taille_lot: int) -> Iterator[str]:
+    for noeud in noeuds(zones, taille_lot):
+        yield dumps({"type": "noeud", **noeud}) + "\n"
+    for lien in liens(zones, taille_lot):
+        yield dumps({"type": "lien", **lien}) + "\n"
+
+
+def _lignes_json(zones: list[str], taille_lot: int) -> Iterator[str]:
+    yield '{"noeuds": ['
+    for k, noeud in enumerate(noeuds(zones, taille_lot)):
+        yield ("," if k else "") + dumps(noeud)
+    yield '], "liens": ['
+    for k, lien in enumerate(liens(zones, taille_lot)):
+        yield ("," if k else "") + dumps(lien)
+    yield "]}\n"
+
+
+def exporte_graphe(zones: Iterable[str], format_export: str, taille_lot: int) -> Iterator[str]:
+    """Le graphe des zones données, au format NDJSON ou json, en morceaux d'au plus 'taille_lot' objets"""
+    zones = list(zones)
+    logger.info("export du graphe des interconnexions : %s" % ", ".join(zones))
+    lignes = _lignes_ndjson(zones, taille_lot) if format_export == FORMAT_NDJSON else _lignes_json(zones, taille_lot)
+    return _par_lots(lignes, taille_lot)
@@ -0,0 +1,233 @@
+"""Lecture en flux des onglets d'un fichier excel (xlsx)
+
+Un fichier xlsx est une archive zip de fichiers xml. Les lignes d'un onglet sont lues au fil de l'eau avec
+'iterparse', sans fichier intermédiaire ni chargement de tout l'onglet en mémoire. La table des chaînes partagées et
+les styles de dates sont lus une seule fois, à l'ouverture, puis servent à tous les onglets.
+"""
+
+import logging
+import re
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from pathlib import Path, PurePosixPath
+from xml.etree.ElementTree import iterparse
+from zipfile import ZipFile
+
+logger = logging.getLogger(__name__)
+
+# les formats de nombre prédéfinis par excel qui affichent une date
+FORMATS_DATE_PREDEFINIS = frozenset((14, 15, 16, 17, 22, 27, 30, 36, 50, 57))
+# dans un format personnalisé, les textes entre guillemets, crochets ou échappés n'indiquent pas une date
+_TEXTE_FORMAT = re.compile(r'"[^"]*"|\[[^]]*\]|\\.')
+_ORIGINE_1900 = datetime(1899, 12, 30)
+_ORIGINE_1904 = datetime(1904, 1, 1)
+_COLONNE = re.compile(r"^([A-Z]+)")
+# la dimension d'un onglet : sa première cellule, éventuellement suivie de sa dernière ('A1:Q250')
+_DIMENSION = re.compile(r"^\$?[A-Z]+\$?(\d+)(?::\$?[A-Z]+\$?(\d+))?$")
+
+
+class LecteurExcelError(Exception):
+    pass
+
+
+def _nom_local(balise: str) -> str:
+    """Nom d'une balise xml sans son espace de nom (les fichiers 'strict' n'utilisent pas le même)"""
+    return balise.rpartition("}")[2]
+
+
+def _attribut(element, nom: str) -> str | None:
+    """Valeur d'un attribut quel que soit son espace de nom"""
+    for clef, valeur in element.attrib.items():
+        if _nom_local(clef) == nom:
+            return valeur
+    return None
+
+
+def index_colonne(reference: str) -> int:
+    """Index (à partir de 0) de la colonne d'une référence de cellule ('A1' -> 0, 'AA3' -> 26)"""
+    lettres = _COLONNE.match(reference)
+    if lettres is None:
+        raise LecteurExcelError("la référence de cellule '%s' est invalide" % reference)
+    index = 0
+    for lettre in lettres.group(1):
+        index = index * 26 + ord(lettre) - ord("A") + 1
+    return index - 1
+
+
+class ClasseurExcel:
+    """Un fichier excel ouvert, dont les onglets sont lus ligne par ligne
+
+    Chaque ligne est une liste de chaînes de caractères, comme celles d'un fichier csv : les cellules vides entre deux
+    cellules sont des chaînes vides et les lignes absentes du fichier sont des listes vides, la numérotation des
+    lignes est donc celle d'excel. Les dates sont écrites avec 'format_date'.
+    """
+
+    def __init__(self, chemin: Path | str, format_date: str = "%d/%m/%Y"):
+        self.format_date = format_date
+        self._zip = ZipFile(chemin)
+        try:
+            self.onglets, self._origine_dates = self._lit_classeur()
+            self._chaines = self._lit_chaines_partagees()
+            self._styles_dates = self._lit_styles_dates()
+        except Exception:
+            self._zip.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        self._zip.close()
+
+    def _chemin_relation(self, cible: str) -> str:
+        """Chemin dans l'archive d'une cible du classeur (relative à 'xl/' ou absolue)"""
+        if cible.startswith("/"):
+            return cible[1:]
+        return str(PurePosixPath("xl") / cible)
+
+    def _lit_classeur(self) -> tuple[dict[str, str], datetime]:
+        """Les chemins des onglets dans l'archive, par nom, et l'origine des dates du classeur"""
+        relations = {}
+        with self._zip.open("xl/_rels/workbook.xml.rels") as f:
+            for _, element in iterparse(f):
+                if _nom_local(element.tag) == "Relationship":
+                    relations[element.get("Id")] = self._chemin_relation(element.get("Target"))
+
+        onglets = {}
+        origine = _ORIGINE_1900
+        with self._zip.open("xl/workbook.xml") as f:
+            for _, element in iterparse(f):
+                nom = _nom_local(element.tag)
+                if nom == "sheet":
+                    onglets[element.get("name")] = relations.get(_attribut(element, "id"))
+                elif nom == "workbookPr" and element.get("date1904") in ("1", "true"):
+                    origine = _ORIGINE_1904
+        return onglets, origine
+
+    def _lit_chaines_partagees(self) -> list[str]:
+        """La table des chaînes partagées, lue une seule fois pour tous les onglets"""
+        if "xl/sharedStrings.xml" not in self._zip.namelist():
+            return []
+        chaines = []
+        with self._zip.open("xl/sharedStrings.xml") as f:
+            for _, element in iterparse(f):
+                if _nom_local(element.tag) == "si":
+                    chaines.append(self._texte(element))
+                    element.clear()
+        return chaines
+
+    def _lit_styles_dates(self) -> frozenset[int]:
+        """Les index des styles de cellule ('cellXfs') dont le format de nombre affiche une date"""
+        if "xl/styles.xml" not in self._zip.namelist():
+            return frozenset()
+        formats_dates = set(FORMATS_DATE_PREDEFINIS)
+        styles = []
+        with self._zip.open("xl/styles.xml") as f:
+            for _, element in iterparse(f):
+                nom = _nom_local(element.tag)
+                if nom == "numFmt":
+                    code = _TEXTE_FORMAT.sub("", element.get("formatCode", "")).lower()
+                    if "d" in code or "y" in code:
+                        formats_dates.add(int(element.get("numFmtId")))
+                elif nom == "cellXfs":
+                    styles = [int(k.get("numFmtId", 0)) for k in element if _nom_local(k.tag) == "xf"]
+        return frozenset(k for k, format_nombre in enumerate(styles) if format_nombre in formats_dates)
+
+    @staticmethod
+    def _texte(element) -> str:
+        """Le texte d'une chaîne (simple ou enrichie), sans les indications phonétiques"""
+        morceaux = []
+        for enfant in element:
+            nom = _nom_local(enfant.tag)
+            if nom == "t":
+                morceaux.append(enfant.text or "")
+            elif nom == "r":
+                morceaux.extend(k.text or "" for k in enfant if _nom_local(k.tag) == "t")
+        return "".join(morceaux)
+
+    def _valeur(self, cellule) -> str:
+        """La valeur d'une cellule, sous forme de texte"""
+        type_cellule = cellule.get("t", "n")
+        if type_cellule == "inlineStr":
+            for enfant in cellule:
+                if _nom_local(enfant.tag) == "is":
+                    return self._texte(enfant)
+            return ""
+
+        valeur = None
+        for enfant in cellule:
+            if _nom_local(enfant.tag) == "v":
+                valeur = enfant.text or ""
+        if valeur is None:
+            return ""
+        if type_cellule == "s":
+            try:
+                return self._chaines[int(valeur)]
+            except (IndexError, ValueError):
+                raise LecteurExcelError("la chaîne partagée '%s' n'existe pas" % valeur)
+        if type_cellule == "b":
+            return "TRUE" if valeur == "1" else "FALSE"
+        if type_cellule == "n" and int(cellule.get("s", 0)) in self._styles_dates:
+            try:
+                return (self._origine_dates + timedelta(days=float(valeur))).strftime(self.format_date)
+            except (ValueError, OverflowError):
+                return valeur
+        return valeur
+
+    def _chemin_onglet(self, onglet: str) -> str:
+        chemin = self.onglets.get(onglet)
+        if chemin is None or chemin not in self._zip.namelist():
+            raise LecteurExcelError("l'onglet '%s' est absent du fichier excel" % onglet)
+        return chemin
+
+    def nombre_lignes(self, onglet: str) -> int | None:
+        """Numéro de la dernière ligne d'un onglet d'après sa dimension, None si le fichier ne l'indique pas
+
+        Seul le début de l'onglet est lu, la dimension étant écrite avant les lignes.
+        """
+        with self._zip.open(self._chemin_onglet(onglet)) as f:
+            for _, element in iterparse(f, events=("start",)):
+                nom = _nom_local(element.tag)
+                if nom == "dimension":
+                    dimension = _DIMENSION.match(element.get("ref", "").upper())
+                    if dimension is None:
+                        return None
+                    return int(dimension.group(2) or dimension.group(1))
+                if nom == "sheetData":
+                    return None
+        return None
+
+    def lignes(self, onglet: str) -> Iterator[list[str]]:
+        """Parcourt les lignes d'un onglet, de la première à la dernière renseignée
+
+        L'onglet est vérifié dès l'appel, la lecture ne commence qu'au parcours.
+        """
+        return self._parcourt(self._chemin_onglet(onglet))
+
+    def _parcourt(self, chemin: str) -> Iterator[list[str]]:
+        numero_precedent = 0
+        with self._zip.open(chemin) as f:
+            for _, element in iterparse(f):
+                if _nom_local(element.tag) != "row":
+                    continue
+                numero = int(element.get("r", numero_precedent + 1))
+                # les lignes vides ne sont pas enregistrées dans le fichier
+                for _ in range(numero_precedent + 1, numero):
+                    yield []
+                numero_precedent = numero
+
+                ligne = []
+                for cellule in element:
+                    if _nom_local(cellule.tag) != "c":
+                        continue
+                    reference = cellule.get("r")
+                    if reference is not None:
+                        # les cellules vides ne sont pas enregistrées non plus
+                        ligne.extend([""] * (index_colonne(reference) - len(ligne)))
+                    ligne.append(self._valeur(cellule))
+                # libère la mémoire de la ligne déjà lue
+                element.clear()
+                yield ligne
@@ -0,0 +1,202 @@
+"""Commandes administrateurs personnalisées pour l'inventaire
+
+Permet de comparer les plans d'exécution (EXPLAIN) et les durées de la recherche des systèmes industriels
+entre des filtres par jointures dédoublonnées (DISTINCT) et des filtres par sous-requêtes corrélées (EXISTS),
+sur un jeu de données synthétique qui est supprimé à la fin de la commande
+"""
+
+import logging
+from datetime import date
+from functools import partial
+from statistics import median
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from inventaire.models import (
+    DomaineMetier,
+    LicenceLogiciel,
+    Localisation,
+    MaterielEffecteur,
+    MaterielOrdinateur,
+    SystemeIndustriel,
+    ZoneUsid,
+)
+from inventaire.views import SystemesRechercheView
+
+
+logger = logging.getLogger(__name__)
+
+# les scénarios de recherche : (nom, critères du formulaire de recherche)
+SCENARIOS = (
+    ("marque ou modèle d'ordinateur", {"o_marque_modele": "dell"}),
+    (
+        "type d'effecteur et éditeur de licence",
+        {"e_type": [MaterielEffecteur.Type.AUTOMATE], "l_editeur_logiciel": "siemens"},
+    ),
+    ("date de fin de licence", {"l_fin": date(2025, 1, 1)}),
+)
+
+
+def _requete(criteres: dict, jointures: bool):
+    """La requête de la page de recherche pour ces critères, par jointures dédoublonnées ou par sous-requêtes"""
+    query = (
+        SystemeIndustriel.objects.filter(fiche_corbeille=False)
+        .recherche(criteres, jointures=jointures)
+        .select_related("localisation", "domaine_metier")
+        .order_by(*SystemesRechercheView.ordre_curseur)
+    )
+    return query.distinct() if jointures else query
+
+
+class Command(BaseCommand):
+    """Commande de comparaison des stratégies de filtrage de la recherche des systèmes industriels"""
+
+    help = (
+        "Permet de comparer les plans d'exécution et les durées de la recherche des S2I (jointures + DISTINCT"
+        " contre sous-requêtes EXISTS) sur un jeu de données synthétique, annulé à la fin de la commande"
+    )
+
+    def add_arguments(self, parser):
+        """Arguments pris par la commande"""
+        parser.add_argument(
+            "--genere",
+            action="store",
+            dest="genere",
+            type=int,
+            default=1000,
+            help="nombre de systèmes industriels synthétiques à générer",
+        )
+        parser.add_argument(
+            "--repetitions",
+            action="store",
+            dest="repetitions",
+            type=int,
+            default=5,
+            help="nombre d'exécutions de chaque requête pour mesurer la durée médiane",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            dest="force",
+            help="autorise la commande hors du mode DEBUG, le jeu de données étant écrit dans la base de donnée",
+        )
+
+    @staticmethod
+    def _genere(nombre: int) -> None:
+        """Génère 'nombre' systèmes avec 2 ordinateurs, 3 effecteurs et 2 licences chacun"""
+        domaine = DomaineMetier.objects.create(code="ZZZ", nom="Domaine synthétique", coeff_criticite=1)
+        zones = list(ZoneUsid)
+        localisations = Localisation.objects.bulk_create(
+            [
+                Localisation(
+                    zone_usid=zones[k % len(zones)],
+                    nom_ville=f"Ville {k % 20}",
+                    nom_quartier=f"Quartier {k}",
+                    protection=Localisation.Protection.TM,
+                    sensibilite=Localisation.Sensibilite.MOINDRE,
+                )
+                for k in range(max(1, nombre // 50))
+            ]
+        )
+        for debut in range(0, nombre, 5000):
+            systemes = SystemeIndustriel.objects.bulk_create(
+                [
+                    SystemeIndustriel(
+                        localisation=localisations[k % len(localisations)],
+                        nom=f"Système synthétique {k}",
+                        environnement=SystemeIndustriel.Environnement.AUTRE,
+                        domaine_metier=domaine,
+                    )
+                    for k in range(debut, min(debut + 5000, nombre))
+                ]
+            )
+            MaterielOrdinateur.objects.bulk_create(
+                MaterielOrdinateur(
+                    systeme=systeme,
+                    fonction=MaterielOrdinateur.Fonction.MAINT,
+                    marque="Dell" if (systeme.pk + i) % 3 == 0 else "HP",
+                    modele=f"Modèle {i}",
+                    os_famille=MaterielOrdinateur.FamilleOs.WIN_P_10,
+                )
+                for systeme in systemes
+                for i in range(2)
+            )
+            MaterielEffecteur.objects.bulk_create(
+                MaterielEffecteur(
+                    systeme=systeme,
+                    type=MaterielEffecteur.Type.AUTOMATE if i == 0 else MaterielEffecteur.Type.CAPTEUR,
+                    marque="Schneider",
+                    modele=f"Modèle {i}",
+                    nombre=1,
+                )
+                for systeme in systemes
+                for i in range(3)
+            )
+            LicenceLogiciel.objects.bulk_create(
+                LicenceLogiciel(
+                    systeme=systeme,
+                    editeur="Siemens" if i == 0 else "Microsoft",
+                    logiciel=f"Logiciel {i}",
+                    version="1.0",
+                    licence="0000-0000",
+                    date_fin=date(2024 + (systeme.pk + i) % 3, 1, 1),
+                )
+                for systeme in systemes
+                for i in range(2)
+            )
+            logger.info("%d systèmes générés" % min(debut + 5000, nombre))
+
+    @staticmethod
+    def _duree(fonction, repetitions: int) -> float:
+        """Durée médiane (en ms) de l'exécution de la fonction"""
+        durees = []
+        for _ in range(repetitions):
+            debut = perf_counter()
+            fonction()
+            durees.append((perf_counter() - debut) * 1000)
+        return median(durees)
+
+    def handle(self, *args, **options):
+        """Action réalisée par la commande"""
+        if options["verbosity"] == 0:
+            logger.setLevel(logging.ERROR)
+        elif options["verbosity"] == 1:
+            logger.setLevel(logging.WARNING)
+        elif options["verbosity"] == 2:
+            logger.setLevel(logging.INFO)
+        else:
+            logger.setLevel(logging.DEBUG)
+
+        # le jeu de données est écrit puis annulé dans la base de donnée : pas sur un serveur en production par mégarde
+        if not settings.DEBUG and not options["force"]:
+            raise CommandError("commande réservée au mode DEBUG, utiliser '--force' pour la lancer malgré tout")
+
+        # EXPLAIN ANALYZE n'est disponible qu'avec postgresql
+        options_explain = {"analyze": True} if connection.vendor == "postgresql" else {}
+
+        with transaction.atomic():
+            self._genere(options["genere"])
+            if connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+            self.stdout.write(self.style.SUCCESS("%d systèmes synthétiques générés" % options["genere"]))
+
+            for nom, criteres in SCENARIOS:
+                self.stdout.write(self.style.MIGRATE_HEADING("scénario : %s" % nom))
+                for strategie, jointures in (("jointures + DISTINCT", True), ("EXISTS", False)):
+                    requete = partial(_requete, criteres, jointures)
+                    duree_compte = self._duree(lambda: requete().count(), options["repetitions"])
+                    duree_page = self._duree(lambda: list(requete()[:50]), options["repetitions"])
+                    self.stdout.write(
+                        "%s : %d résultats, COUNT %.1f ms, première page %.1f ms"
+                        % (strategie, requete().count(), duree_compte, duree_page)
+                    )
+                    if options["verbosity"] >= 2:
+                        self.stdout.write(requete()[:50].explain(**options_explain))
+
+            # rien n'est conservé dans la base de données
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS("jeu de données synthétique supprimé"))
@@ -1,18 +1,22 @@
 """Commandes administrateurs personnalisées pour l'inventaire
 
-Permet d'importer les systèmes depuis un fichier excel (version excel 2.X)
+Permet d'importer les systèmes depuis un fichier excel (version excel 2.X), ou depuis un lot de fichiers excel (un
+dossier ou une archive zip) contenant un fichier par zone d'USID
 """
 
-from base64 import b64encode
+from functools import partial
 from time import sleep
 
 from celery.result import AsyncResult
 from celery.states import PENDING, SUCCESS, ALL_STATES
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 
 from inventaire.models import ZoneUsid
+from inventaire.stockage import enregistre_fichier_import, enregistre_lot_import, ville_zone
 from inventaire.tasks import importe_excel
-from inventaire.utils import CeleryResult, CeleryResultStatus, CeleryResultMessageType
+from inventaire.tasks.importe_lot import avancement_lot, lance_import_lot
+from inventaire.utils import CeleryResult, CeleryResultStatus, CeleryResultMessageType, PolitiqueImport
 
 
 class Command(BaseCommand):
@@ -20,6 +24,7 @@ class Command(BaseCommand):
 
     help = "Permet d'importer les données csv des S2I"
     zone_usid = None
+    taille_morceau = 1024 * 1024  # lecture du fichier excel par morceaux de 1 Mo
 
     def add_arguments(self, parser):
         """Arguments pris par la commande"""
@@ -30,7 +35,6 @@ class Command(BaseCommand):
             dest="zone_usid",
             choices=["AMS", "BGA", "CBG", "EVX", "OAN", "RVC", "TRS"],
             help="l'USID concerné par le fichier excel",
-            required=True,
         )
         parser.add_argument(
             "-f",
@@ -38,14 +42,46 @@ class Command(BaseCommand):
             action="store",
             dest="fichier_excel",
             help="fichier excel d'une zone",
-            required=True,
         )
         parser.add_argument(
+            "--lot",
+            action="store",
+            dest="lot",
+            help="dossier ou archive zip contenant un fichier excel par zone, remplace les options -z et -f",
+        )
+        parser.add_argument(
+            "--concurrence",
+            action="store",
+            type=int,
+            dest="concurrence",
+            default=settings.IMPORT_LOT_CONCURRENCE,
+            help="le nombre de zones importées en même temps lors d'un import par lot",
+        )
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument(
             "--nettoie",
             action="store_true",
             dest="nettoie",
             help="supprime tous ce qui est déjà enregistré pour cette zone",
         )
+        mode.add_argument(
+            "--differentiel",
+            action="store_true",
+            dest="differentiel",
+            help="n'enregistre que les différences avec la zone, ce qui est absent du fichier est supprimé",
+        )
+        parser.add_argument(
+            "--annule-si-erreur",
+            action="store_true",
+            dest="annule_si_erreur",
+            help="n'enregistre rien si une seule ligne du fichier est en erreur",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            dest="dry_run",
+            help="valide le fichier et affiche le compte-rendu sans rien enregistrer",
+        )
         parser.add_argument(
             "--no-input",
             action="store_true",
@@ -55,13 +91,8 @@ class Command(BaseCommand):
 
     def _verifie_excel(self, nom_fichier: str, no_input: bool) -> bool:
         # vérification de la cohérence avec la zone d'USID donnée
-        label_usid = getattr(ZoneUsid, self.zone_usid).label
-        if "'" in label_usid:
-            ville_usid = label_usid[label_usid.rfind("'") + 1:]
-        elif "-" in label_usid:
-            ville_usid = label_usid[label_usid.rfind("-") + 1:]
-        else:
-            ville_usid = label_usid[label_usid.rfind(" ") + 1:]
+        label_usid = self.zone_usid.label
+        ville_usid = ville_zone(self.zone_usid)
 
         if not ville_usid.lower() in nom_fichier.lower():
             self.stdout.write(
@@ -80,26 +111,59 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         """Action réalisée par la commande"""
+        politique = PolitiqueImport.ANNULE if options["annule_si_erreur"] else PolitiqueImport.GARDE_VALIDES
+        options_import = {
+            "verbosity": options["verbosity"],
+            "nettoie": options["nettoie"],
+            "politique": politique,
+            "dry_run": options["dry_run"],
+            "differentiel": options["differentiel"],
+        }
+
+        if options["lot"]:
+            if options["zone_usid"] or options["fichier_excel"]:
+                raise CommandError("l'option --lot ne peut pas être combinée avec les options -z et -f")
+            if options["concurrence"] < 1:
+                raise CommandError("l'option --concurrence doit être au moins 1")
+            # copie des fichiers du lot dans le dossier partagé avec celery
+            try:
+                fichiers = enregistre_lot_import(options["lot"])
+            except (OSError, ValueError) as e:
+                raise CommandError(str(e))
+            self.stdout.write("zones du lot : %s" % ", ".join(k.label for k in fichiers))
+
+            # lancement des taches asynchrones
+            task = lance_import_lot(fichiers, options["concurrence"], **options_import)
+            self.stdout.write(self.style.SUCCESS("task started with id: %s" % task.id))
+            self._affiche_resultat(task, lot=True)
+            return None
+
+        if not options["zone_usid"] or not options["fichier_excel"]:
+            raise CommandError("les options -z et -f sont obligatoires, sauf pour un import par lot (--lot)")
+
         # conversion de la zone d'USID
         self.zone_usid = getattr(ZoneUsid, options["zone_usid"], None)
 
-        # vérification du fichier excel puis décodage
+        # vérification du fichier excel puis copie dans le dossier partagé avec celery
         if not self._verifie_excel(options["fichier_excel"], options["no_input"]):
             return None
         with open(options["fichier_excel"], "rb") as f:
-            encoded_excel = b64encode(f.read())
+            nom_fichier = enregistre_fichier_import(iter(partial(f.read, self.taille_morceau), b""))
 
         # lancement de la tache asynchrone
-        task = importe_excel.delay(
-            self.zone_usid,
-            encoded_excel,
-            verbosity=options["verbosity"],
-            nettoie=options["nettoie"],
-        )
+        task = importe_excel.delay(self.zone_usid, nom_fichier, **options_import)
         self.stdout.write(self.style.SUCCESS("task started with id: %s" % task.id))
+        self._affiche_resultat(task)
 
-        # attente puis affichage du resultat global
+    def _affiche_resultat(self, task: AsyncResult, lot: bool = False) -> None:
+        """Attend la fin de la tâche puis affiche son résultat global et ses détails"""
+        avancement = None
         while not task.ready():
+            # affichage de l'avancement d'un lot à chaque zone terminée
+            if lot and (nouvel_avancement := avancement_lot(task.id)) != avancement:
+                avancement = nouvel_avancement
+                if avancement is not None:
+                    self.stdout.write("%d / %d zones importées" % avancement)
             sleep(1)
         if task.failed():
             self.stderr.write(
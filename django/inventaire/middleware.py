@@ -0,0 +1,20 @@
+"""Définition des intergiciels (middlewares) de l'inventaire"""
+
+from django.utils.functional import SimpleLazyObject
+
+from inventaire.utils import zones_utilisateur
+
+
+class ZonesUtilisateurMiddleware:
+    """Attache à chaque requête les zones consultables et modifiables de l'utilisateur
+
+    L'attribut 'request.zones' est paresseux : les permissions ne sont résolues qu'à la première utilisation,
+    puis partagées entre la vue, ses formulaires et les gabarits. Doit être placé après 'AuthenticationMiddleware'.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.zones = SimpleLazyObject(lambda: zones_utilisateur(request.user))
+        return self.get_response(request)
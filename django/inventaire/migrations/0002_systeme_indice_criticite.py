@@ -0,0 +1,51 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:06
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def calcule_criticites(apps, schema_editor):
+    """Initialise la criticité stockée des systèmes existants (copie figée de la formule du modèle)"""
+    SystemeIndustriel = apps.get_model("inventaire", "SystemeIndustriel")
+    coeff_environnement = {0: 1, 1: 4, 2: 3, 3: 2}
+    coeff_sensibilite = {"V": 3, "H": 2, "M": 1}
+    criticite_max = 13 * 4 * (4 + 3)
+
+    systemes = (
+        SystemeIndustriel.objects.filter(localisation__isnull=False)
+        .select_related("domaine_metier", "localisation")
+        .annotate(somme_coeff_fct=Sum("fonctions_metiers__coeff_criticite"))
+    )
+    modifies = []
+    for systeme in systemes:
+        systeme.indice_criticite = int(
+            (
+                (systeme.somme_coeff_fct or 1)
+                * systeme.domaine_metier.coeff_criticite
+                * (coeff_environnement[systeme.environnement] + coeff_sensibilite[systeme.localisation.sensibilite])
+            )
+            / criticite_max
+            * 100
+        )
+        modifies.append(systeme)
+    SystemeIndustriel.objects.bulk_update(modifies, ["indice_criticite"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("inventaire", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="systemeindustriel",
+            name="indice_criticite",
+            field=models.PositiveSmallIntegerField(
+                db_index=True,
+                default=0,
+                editable=False,
+                verbose_name="Criticité du S2I",
+            ),
+        ),
+        migrations.RunPython(calcule_criticites, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:10
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+import inventaire.models
+
+
+class Migration(migrations.Migration):
+    """Index GIN trigrammes des champs texte libre de la recherche des systèmes
+
+    L'extension et les index ne sont créés que sous postgresql : 'TrigramExtension' et 'IndexTrigrammes' ne font
+    rien sous sqlite.
+    """
+
+    dependencies = [
+        ("inventaire", "0002_systeme_indice_criticite"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name="systemeindustriel",
+            index=inventaire.models.IndexTrigrammes(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("nom"), name="gin_trgm_ops"
+                ),
+                name="systeme_nom_trgm",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="materielordinateur",
+            index=inventaire.models.IndexTrigrammes(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("marque"), name="gin_trgm_ops"
+                ),
+                name="ordinateur_marque_trgm",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="materielordinateur",
+            index=inventaire.models.IndexTrigrammes(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("modele"), name="gin_trgm_ops"
+                ),
+                name="ordinateur_modele_trgm",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="materieleffecteur",
+            index=inventaire.models.IndexTrigrammes(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("marque"), name="gin_trgm_ops"
+                ),
+                name="effecteur_marque_trgm",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="materieleffecteur",
+            index=inventaire.models.IndexTrigrammes(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("modele"), name="gin_trgm_ops"
+                ),
+                name="effecteur_modele_trgm",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="licencelogiciel",
+            index=inventaire.models.IndexTrigrammes(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("editeur"), name="gin_trgm_ops"
+                ),
+                name="licence_editeur_trgm",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="licencelogiciel",
+            index=inventaire.models.IndexTrigrammes(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("logiciel"), name="gin_trgm_ops"
+                ),
+                name="licence_logiciel_trgm",
+            ),
+        ),
+    ]
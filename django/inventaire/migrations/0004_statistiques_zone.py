@@ -0,0 +1,61 @@
+# Generated by Django 5.0.7 on 2026-10-17 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("inventaire", "0003_recherche_trigrammes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StatistiquesZone",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "zone_usid",
+                    models.CharField(
+                        choices=[
+                            ("AMS", "USID d'Angers"),
+                            ("BGA", "USID de Bourges-Avord"),
+                            ("CBG", "USID de Cherbourg"),
+                            ("EVX", "USID d'Évreux"),
+                            ("OAN", "USID de Bricy"),
+                            ("RVC", "USID de Rennes"),
+                            ("TRS", "USID de Tours"),
+                        ],
+                        max_length=3,
+                        unique=True,
+                        verbose_name="Périmètre de l'USID",
+                    ),
+                ),
+                ("date_calcul", models.DateTimeField(verbose_name="Date du calcul des statistiques")),
+                ("a_jour", models.BooleanField(default=True, verbose_name="Statistiques à jour")),
+                ("total_systemes", models.PositiveIntegerField(default=0, verbose_name="Nombre de S2I")),
+                ("total_contrats", models.PositiveIntegerField(default=0, verbose_name="Nombre de contrats")),
+                (
+                    "homologations_expirant",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Nombre d'homologations expirées ou expirant bientôt"
+                    ),
+                ),
+                (
+                    "licences_expirant",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Nombre de licences expirées ou expirant bientôt"
+                    ),
+                ),
+                (
+                    "repartitions",
+                    models.JSONField(default=dict, verbose_name="Répartitions des S2I et des ordinateurs"),
+                ),
+            ],
+            options={
+                "verbose_name": "Statistiques d'une zone",
+                "verbose_name_plural": "Statistiques des zones",
+                "db_table": "inventaire_statistiques",
+                "db_table_comment": "les statistiques précalculées de chaque zone d'USID",
+            },
+        ),
+    ]
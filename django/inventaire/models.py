@@ -3,9 +3,15 @@
 # from packaging.version import parse as parse_version
 # from packaging.version import Version
 
+from collections.abc import Iterable
+from functools import reduce
+from operator import or_
+
 from django.contrib.auth.models import User
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
-from django.db.models import Sum
+from django.db.models import Case, Exists, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Upper
 
 
 class ZoneUsid(models.TextChoices):
@@ -61,7 +67,55 @@ class Droits(models.Model):
         ]
 
 
-class Localisation(models.Model):
+class IndexTrigrammes(GinIndex):
+    """Index GIN trigrammes ('pg_trgm') d'un champ texte, pour ses recherches 'icontains'
+
+    Sous postgresql, django traduit 'icontains' en 'UPPER("colonne"::text) LIKE UPPER(%s)' : l'index porte donc sur
+    'Upper(champ)' pour être utilisé par le planificateur. Sous sqlite (développement et tests) il n'est pas créé,
+    la recherche reste un parcours de table.
+    """
+
+    def create_sql(self, model, schema_editor, using="", **kwargs):
+        if schema_editor.connection.vendor != "postgresql":
+            return ""
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+    def remove_sql(self, model, schema_editor, **kwargs):
+        if schema_editor.connection.vendor != "postgresql":
+            return ""
+        return super().remove_sql(model, schema_editor, **kwargs)
+
+
+def index_trigrammes(champ: str, nom: str) -> IndexTrigrammes:
+    """L'index trigrammes de la recherche 'icontains' sur un champ"""
+    return IndexTrigrammes(OpClass(Upper(champ), name="gin_trgm_ops"), name=nom)
+
+
+class ValeursChargeesMixin:
+    """Retient les valeurs de 'champs_suivis' telles que chargées depuis la base de donnée
+
+    Les signaux peuvent ainsi connaître l'état enregistré d'une instance modifiée (sa zone avant un déplacement par
+    exemple) sans relire la ligne avant chaque sauvegarde.
+    """
+
+    champs_suivis: tuple[str, ...] = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.retient_valeurs()
+        return instance
+
+    def retient_valeurs(self) -> None:
+        """Mémorise les valeurs actuelles des champs suivis (hors champs différés) comme valeurs enregistrées"""
+        self._valeurs_chargees = {k: self.__dict__[k] for k in self.champs_suivis if k in self.__dict__}
+
+    def valeur_chargee(self, champ: str):
+        """La valeur enregistrée d'un champ suivi, None si l'instance n'a pas été chargée ou le champ était différé"""
+        return getattr(self, "_valeurs_chargees", {}).get(champ)
+
+
+class Localisation(ValeursChargeesMixin, models.Model):
     """Modèle stockant une emprise"""
 
     class Meta:
@@ -89,6 +143,7 @@ class Localisation(models.Model):
         HAUTE = "H", "haute"
         MOINDRE = "M", "moindre"
 
+    champs_suivis = ("zone_usid", "nom_ville", "nom_quartier")
     objects = models.Manager()
     # champs du modèle
     zone_usid = models.CharField(verbose_name="Périmètre de l'USID", max_length=3, choices=ZoneUsid)
@@ -111,7 +166,7 @@ class Localisation(models.Model):
             return f"{self.nom_ville} - {self.nom_quartier}"
 
 
-class ContratMaintenance(models.Model):
+class ContratMaintenance(ValeursChargeesMixin, models.Model):
     """Modèle stockant un contrat de maintenance"""
 
     class Meta:
@@ -120,6 +175,7 @@ class ContratMaintenance(models.Model):
         db_table = "inventaire_contrat"
         db_table_comment = "tous les contrats de maintenance"
 
+    champs_suivis = ("zone_usid",)
     objects = models.Manager()
     # champs du modèle
     zone_usid = models.CharField(verbose_name="Périmètre de l'USID", max_length=3, choices=ZoneUsid)
@@ -212,7 +268,133 @@ class FonctionsMetier(models.Model):
         return str(self.nom)
 
 
-class SystemeIndustriel(models.Model):
+class SystemeIndustrielQuerySet(models.QuerySet):
+    """Requêtes spécifiques aux systèmes industriels"""
+
+    def avec_criticite(self):
+        """Annote chaque système avec sa criticité ('criticite_calculee'), calculée par la base de donnée
+
+        C'est la même formule que 'SystemeIndustriel.criticite', mais en une seule requête pour tout le queryset.
+        La somme des coefficients des fonctions est une sous-requête corrélée, elle n'est donc pas faussée par
+        les jointures ou le 'distinct' du queryset d'origine. La division entière donne le même arrondi que
+        la méthode python pour toutes les valeurs atteignables des coefficients.
+        """
+        fonctions = SystemeIndustriel.fonctions_metiers.through.objects.filter(systemeindustriel=OuterRef("pk"))
+        somme_coeff_fct = Coalesce(
+            Subquery(
+                fonctions.values("systemeindustriel")
+                .annotate(somme=Sum("fonctionsmetier__coeff_criticite"))
+                .values("somme")
+            ),
+            Value(1),
+            output_field=IntegerField(),
+        )
+        coeff_environnement = Case(
+            *[When(environnement=k, then=Value(v)) for k, v in COEFF_CRITICITE_ENVIRONNEMENT.items()],
+            output_field=IntegerField(),
+        )
+        coeff_sensibilite = Case(
+            *[When(localisation__sensibilite=k, then=Value(v)) for k, v in COEFF_CRITICITE_SENSIBILITE.items()],
+            output_field=IntegerField(),
+        )
+        return self.annotate(
+            criticite_calculee=(
+                somme_coeff_fct
+                * F("domaine_metier__coeff_criticite")
+                * (coeff_environnement + coeff_sensibilite)
+                * Value(100)
+                / Value(CRITICITE_MAX)
+            )
+        )
+
+    def recalcule_criticite(self) -> int:
+        """Recalcule et enregistre la criticité de tous les systèmes sélectionnés
+
+        Les criticités sont calculées en une seule requête, puis seules celles qui ont changé sont écrites.
+
+        Returns:
+            le nombre de systèmes dont la criticité a changé
+        """
+        systemes = SystemeIndustriel.objects.filter(pk__in=self.values("pk")).avec_criticite().only("indice_criticite")
+        modifies = []
+        for systeme in systemes:
+            criticite = systeme.criticite_calculee or 0  # 'None' pour un système sans localisation
+            if criticite != systeme.indice_criticite:
+                systeme.indice_criticite = criticite
+                modifies.append(systeme)
+        SystemeIndustriel.objects.bulk_update(modifies, ["indice_criticite"], batch_size=500)
+        return len(modifies)
+
+    def _filtre_lie(self, relation: str, jointures: bool, *conditions: dict) -> "SystemeIndustrielQuerySet":
+        """Les systèmes dont un objet lié par 'relation' (matériel ou licence) vérifie l'une des conditions"""
+        if jointures:
+            return self.filter(reduce(or_, [Q(**{f"{relation}__{k}": v for k, v in c.items()}) for c in conditions]))
+        modele = self.model._meta.get_field(relation).related_model
+        lies = modele.objects.filter(reduce(or_, [Q(**c) for c in conditions]), systeme=OuterRef("pk"))
+        return self.filter(Exists(lies))
+
+    def recherche(self, criteres: dict, jointures: bool = False) -> "SystemeIndustrielQuerySet":
+        """Filtre les systèmes selon les critères du formulaire de recherche ('cleaned_data'), les absents sont ignorés
+
+        Les critères sur les matériels et les licences sont des sous-requêtes corrélées (EXISTS), qui ne dupliquent
+        pas les systèmes. Avec 'jointures', ce sont des jointures qu'il faut alors dédoublonner (DISTINCT) : seule
+        la commande 'compare_recherche' s'en sert, pour comparer les deux stratégies.
+        """
+        query = self
+        # par la table de localisation
+        if criteres.get("z_usid"):
+            query = query.filter(localisation__zone_usid__in=criteres["z_usid"])
+        if criteres.get("z_ville"):
+            query = query.filter(localisation__nom_ville__in=criteres["z_ville"])
+        if criteres.get("z_quartier"):
+            query = query.filter(localisation__nom_quartier__in=criteres["z_quartier"])
+        # par la table des systèmes industriels
+        if criteres.get("s_nom"):
+            query = query.filter(nom__icontains=criteres["s_nom"])
+        if criteres.get("s_metier"):
+            query = query.filter(domaine_metier__in=criteres["s_metier"])
+        if criteres.get("s_classe"):
+            query = query.filter(homologation_classe__in=criteres["s_classe"])
+        if criteres.get("s_fin"):
+            query = query.filter(homologation_fin__lt=criteres["s_fin"])
+        if criteres.get("s_criticite") is not None:
+            query = query.filter(indice_criticite__gte=criteres["s_criticite"])
+        # par la table des ordinateurs et serveurs
+        if criteres.get("o_fonction"):
+            query = query._filtre_lie("materiels_it", jointures, {"fonction__in": criteres["o_fonction"]})
+        if criteres.get("o_famille"):
+            query = query._filtre_lie("materiels_it", jointures, {"os_famille__in": criteres["o_famille"]})
+        if criteres.get("o_marque_modele"):
+            query = query._filtre_lie(
+                "materiels_it",
+                jointures,
+                {"marque__icontains": criteres["o_marque_modele"]},
+                {"modele__icontains": criteres["o_marque_modele"]},
+            )
+        # par la table des effecteurs
+        if criteres.get("e_type"):
+            query = query._filtre_lie("materiels_ot", jointures, {"type__in": criteres["e_type"]})
+        if criteres.get("e_marque_modele"):
+            query = query._filtre_lie(
+                "materiels_ot",
+                jointures,
+                {"marque__icontains": criteres["e_marque_modele"]},
+                {"modele__icontains": criteres["e_marque_modele"]},
+            )
+        # par la table des licences de logiciels
+        if criteres.get("l_editeur_logiciel"):
+            query = query._filtre_lie(
+                "licences",
+                jointures,
+                {"editeur__icontains": criteres["l_editeur_logiciel"]},
+                {"logiciel__icontains": criteres["l_editeur_logiciel"]},
+            )
+        if criteres.get("l_fin"):
+            query = query._filtre_lie("licences", jointures, {"date_fin__lt": criteres["l_fin"]})
+        return query
+
+
+class SystemeIndustriel(ValeursChargeesMixin, models.Model):
     """Modèle stockant un système industriel d'infrastructure"""
 
     class Meta:
@@ -221,6 +403,7 @@ class SystemeIndustriel(models.Model):
         db_table = "inventaire_systeme"
         db_table_comment = "tous les systèmes industriels d'infrastructure"
         unique_together = ["localisation", "nom", "environnement", "domaine_metier"]
+        indexes = [index_trigrammes("nom", "systeme_nom_trgm")]
 
     class Environnement(models.IntegerChoices):
         """Les missions auxquelles participe le S2I"""
@@ -249,7 +432,8 @@ class SystemeIndustriel(models.Model):
         DRSD = 4, "Direction du renseignement et de la sécurité de la défense"
         EMA = 5, "État-major des armées"
 
-    objects = models.Manager()
+    champs_suivis = ("localisation_id",)
+    objects = SystemeIndustrielQuerySet.as_manager()
     # champs du modèle
     localisation = models.ForeignKey(
         Localisation,
@@ -343,6 +527,13 @@ class SystemeIndustriel(models.Model):
         related_name="systemes_modifies",
     )
     fiche_corbeille = models.BooleanField(verbose_name="S2I placé dans la corbeille", default=False)
+    # valeur calculée, maintenue à jour par les signaux de 'inventaire.signals'
+    indice_criticite = models.PositiveSmallIntegerField(
+        verbose_name="Criticité du S2I",
+        default=0,
+        editable=False,
+        db_index=True,
+    )
 
     def __str__(self) -> str:
         """Affichage de l'élément"""
@@ -357,33 +548,145 @@ class SystemeIndustriel(models.Model):
         Returns:
             un entier représentant la criticité du S2I
         """
-        maximum_somme_coeff_fonctions = 13
-        maximum_coeff_domaine_metier = 4
-        coeff_environnement = {
-            self.Environnement.NUC: 4,
-            self.Environnement.CYB: 3,
-            self.Environnement.OPS: 2,
-            self.Environnement.AUTRE: 1,
-        }
-        coeff_localisation = {
-            Localisation.Sensibilite.VITALE: 3,
-            Localisation.Sensibilite.HAUTE: 2,
-            Localisation.Sensibilite.MOINDRE: 1,
-        }
-        criticite_max = maximum_somme_coeff_fonctions * maximum_coeff_domaine_metier * (4 + 3)
         sum_coeff_fct = self.fonctions_metiers.aggregate(Sum("coeff_criticite"))["coeff_criticite__sum"]
+        return self.formule_criticite(
+            sum_coeff_fct,
+            self.domaine_metier.coeff_criticite,
+            self.environnement,
+            self.localisation.sensibilite,
+        )
+
+    @staticmethod
+    def formule_criticite(sum_coeff_fct: int | None, coeff_domaine: int, environnement: int, sensibilite: str) -> int:
+        """Applique la formule de la criticité aux coefficients déjà connus d'un S2I
+
+        Returns:
+            un entier représentant la criticité du S2I
+        """
         if sum_coeff_fct is None:
             sum_coeff_fct = 1
         return int(
             (
                 sum_coeff_fct
-                * self.domaine_metier.coeff_criticite
-                * (coeff_environnement[self.environnement] + coeff_localisation[self.localisation.sensibilite])
+                * coeff_domaine
+                * (COEFF_CRITICITE_ENVIRONNEMENT[environnement] + COEFF_CRITICITE_SENSIBILITE[sensibilite])
             )
-            / criticite_max
+            / CRITICITE_MAX
             * 100
         )
 
+    def met_a_jour_criticite(self) -> None:
+        """Recalcule la criticité du S2I et l'enregistre, sans déclencher de nouvelle sauvegarde complète"""
+        if self.localisation_id is None:
+            self.indice_criticite = 0
+        else:
+            self.indice_criticite = self.criticite()
+        SystemeIndustriel.objects.filter(pk=self.pk).update(indice_criticite=self.indice_criticite)
+
+
+# les coefficients utilisés dans le calcul de la criticité d'un S2I
+COEFF_CRITICITE_ENVIRONNEMENT = {
+    SystemeIndustriel.Environnement.NUC: 4,
+    SystemeIndustriel.Environnement.CYB: 3,
+    SystemeIndustriel.Environnement.OPS: 2,
+    SystemeIndustriel.Environnement.AUTRE: 1,
+}
+COEFF_CRITICITE_SENSIBILITE = {
+    Localisation.Sensibilite.VITALE: 3,
+    Localisation.Sensibilite.HAUTE: 2,
+    Localisation.Sensibilite.MOINDRE: 1,
+}
+# maximum de la somme des coeff des fonctions * coeff maximal d'un domaine * (max environnement + max sensibilité)
+CRITICITE_MAX = 13 * 4 * (4 + 3)
+
+
+class InterconnexionQuerySet(models.QuerySet):
+    """Requêtes des interconnexions, qui maintiennent la symétrie des liens entre deux S2I
+
+    Chaque interconnexion de A vers B a une symétrique de B vers A avec les mêmes caractéristiques : les
+    enregistrements et suppressions en masse traitent les deux sens en une seule requête par lot.
+    """
+
+    def relie(self, interconnexions: Iterable["Interconnexion"], symetriques=True, batch_size=500) -> list:
+        """Crée ou met à jour les interconnexions (et leurs symétriques) en une seule requête par lot
+
+        Les interconnexions sont retrouvées par leurs deux systèmes, pas par leur clef primaire, qui est mise à jour
+        depuis la base de donnée. Si une paire est donnée plusieurs fois, dans un sens ou dans l'autre, la dernière
+        l'emporte.
+
+        Returns:
+            les interconnexions enregistrées, symétriques comprises
+        """
+        liens = {}
+        for interconnexion in interconnexions:
+            interconnexion.pk = None
+            liens[(interconnexion.systeme_from_id, interconnexion.systeme_to_id)] = interconnexion
+            if symetriques:
+                liens[(interconnexion.systeme_to_id, interconnexion.systeme_from_id)] = interconnexion.symetrique()
+        if not liens:
+            return []
+        return super().bulk_create(
+            liens.values(),
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["systeme_from", "systeme_to"],
+            update_fields=Interconnexion.champs_symetriques,
+        )
+
+    def bulk_create(
+        self,
+        objs,
+        batch_size=None,
+        ignore_conflicts=False,
+        update_conflicts=False,
+        update_fields=None,
+        unique_fields=None,
+    ):
+        """Crée les interconnexions, puis crée ou met à jour leurs symétriques absentes de 'objs'"""
+        objs = super().bulk_create(
+            objs,
+            batch_size=batch_size,
+            ignore_conflicts=ignore_conflicts,
+            update_conflicts=update_conflicts,
+            update_fields=update_fields,
+            unique_fields=unique_fields,
+        )
+        paires = {(k.systeme_from_id, k.systeme_to_id) for k in objs}
+        self.relie(
+            [k.symetrique() for k in objs if (k.systeme_to_id, k.systeme_from_id) not in paires],
+            symetriques=False,
+            batch_size=batch_size or 500,
+        )
+        return objs
+
+    def avec_symetriques(self) -> "InterconnexionQuerySet":
+        """Les interconnexions sélectionnées et leurs symétriques"""
+        symetriques = self.filter(systeme_from=OuterRef("systeme_to"), systeme_to=OuterRef("systeme_from"))
+        return Interconnexion.objects.filter(Q(pk__in=self.values("pk")) | Exists(symetriques))
+
+    def delete(self):
+        """Supprime les interconnexions sélectionnées et leurs symétriques, en une seule requête
+
+        Aucun récepteur de suppression n'étant connecté aux interconnexions, django les supprime sans les charger.
+        Les cartographies des sites de leurs systèmes sont lues avant, en une seule requête, puis invalidées ici ;
+        à l'intérieur de 'invalidations_differees', c'est l'appelant qui s'en charge.
+        """
+        # imports locaux : ces modules importent eux-mêmes les modèles
+        from inventaire.cartographie import invalide_cartographies, sites_systemes
+        from inventaire.utils import invalidations_differees, invalidations_suspendues
+
+        selection = self.avec_symetriques()
+        if invalidations_suspendues():
+            return super(InterconnexionQuerySet, selection).delete()
+        sites = sites_systemes(selection.values("systeme_from"), voisins=False)
+        with invalidations_differees():
+            resultat = super(InterconnexionQuerySet, selection).delete()
+        invalide_cartographies(sites)
+        return resultat
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
 
 class Interconnexion(models.Model):
     """Modèle intermédiaire stockant une interconnexion entre deux S2I"""
@@ -421,7 +724,10 @@ class Interconnexion(models.Model):
         INFRAROUGE = 8, "infrarouge"
         RFID = 9, "RFID"
 
-    objects = models.Manager()
+    # les caractéristiques partagées par une interconnexion et sa symétrique
+    champs_symetriques = ("type_reseau", "type_liaison", "protocole", "description")
+
+    objects = InterconnexionQuerySet.as_manager()
     # champ du modèle
     systeme_from = models.ForeignKey(
         SystemeIndustriel,
@@ -453,45 +759,30 @@ class Interconnexion(models.Model):
         """Affichage de l'élément"""
         return f"Liaison {self.get_type_liaison_display()} ({self.get_type_reseau_display()}) de [{self.systeme_from}] vers [{self.systeme_to}]"
 
+    def symetrique(self) -> "Interconnexion":
+        """L'interconnexion inverse, avec les mêmes caractéristiques (non enregistrée)"""
+        return Interconnexion(
+            systeme_from_id=self.systeme_to_id,
+            systeme_to_id=self.systeme_from_id,
+            **{k: getattr(self, k) for k in self.champs_symetriques},
+        )
+
     def save(self, *args, recursif=True, **kwargs):
-        """Override la fonction de sauvegarde pour enregistrer l'interconnexion symétrique"""
+        """Override la fonction de sauvegarde pour enregistrer l'interconnexion symétrique
+
+        La symétrique est créée ou mise à jour en une seule requête.
+        """
         super().save(*args, **kwargs)
-        # puis enregistrement du symétrique
         if recursif:
-            try:
-                x = Interconnexion.objects.get(
-                    systeme_from=self.systeme_to,
-                    systeme_to=self.systeme_from,
-                )
-                x.type_reseau = self.type_reseau
-                x.type_liaison = self.type_liaison
-                x.protocole = self.protocole
-                x.description = self.description
-            except Interconnexion.DoesNotExist:
-                x = Interconnexion(
-                    systeme_from=self.systeme_to,
-                    systeme_to=self.systeme_from,
-                    type_reseau=self.type_reseau,
-                    type_liaison=self.type_liaison,
-                    protocole=self.protocole,
-                    description=self.description,
-                )
-            finally:
-                x.save(recursif=False)
+            Interconnexion.objects.relie([self.symetrique()], symetriques=False)
 
     def delete(self, *args, recursif=True, **kwargs):
-        """Override la fonction de suppression pour supprimer l'interconnexion symétrique"""
-        super().delete(*args, **kwargs)
-        # puis suppression du symétrique
-        if recursif:
-            try:
-                x = Interconnexion.objects.get(
-                    systeme_from=self.systeme_to,
-                    systeme_to=self.systeme_from,
-                )
-                x.delete(recursif=False)
-            except Interconnexion.DoesNotExist:
-                pass  # un logger d'erreur peut être utile à cet endroit
+        """Override la fonction de suppression pour supprimer l'interconnexion symétrique dans la même requête"""
+        if not recursif:
+            return super().delete(*args, **kwargs)
+        resultat = Interconnexion.objects.filter(pk=self.pk).delete()
+        self.pk = None
+        return resultat
 
 
 '''
@@ -522,6 +813,10 @@ class MaterielOrdinateur(models.Model):
         verbose_name_plural = "Ordinateurs"
         db_table = "inventaire_ordinateur"
         db_table_comment = "tous les ordinateurs et serveurs"
+        indexes = [
+            index_trigrammes("marque", "ordinateur_marque_trgm"),
+            index_trigrammes("modele", "ordinateur_modele_trgm"),
+        ]
 
     class Fonction(models.IntegerChoices):
         """Les fonctions principales des matériels IT"""
@@ -614,6 +909,10 @@ class MaterielEffecteur(models.Model):
         verbose_name_plural = "Matériels intelligents"
         db_table = "inventaire_effecteur"
         db_table_comment = "tous les capteurs, actionneurs et éléments actifs de réseau"
+        indexes = [
+            index_trigrammes("marque", "effecteur_marque_trgm"),
+            index_trigrammes("modele", "effecteur_modele_trgm"),
+        ]
 
     class Type(models.IntegerChoices):
         """Les types d'effecteurs"""
@@ -687,6 +986,10 @@ class LicenceLogiciel(models.Model):
         verbose_name_plural = "Licences de logiciels"
         db_table = "inventaire_licence"
         db_table_comment = "toutes les licences utilisées par le S2I"
+        indexes = [
+            index_trigrammes("editeur", "licence_editeur_trgm"),
+            index_trigrammes("logiciel", "licence_logiciel_trgm"),
+        ]
 
     objects = models.Manager()
     # champs du modèle
@@ -706,3 +1009,38 @@ class LicenceLogiciel(models.Model):
     def __str__(self) -> str:
         """Affichage de l'élément"""
         return f"{self.logiciel} ({self.editeur}) de {self.systeme}"
+
+
+class StatistiquesZone(models.Model):
+    """Modèle stockant les statistiques précalculées d'une zone d'USID
+
+    Les lignes sont recalculées périodiquement par la tâche 'rafraichit_statistiques'. Une modification d'un
+    système, d'un contrat ou d'une localisation de la zone marque la ligne comme périmée jusqu'au prochain calcul.
+    """
+
+    class Meta:
+        verbose_name = "Statistiques d'une zone"
+        verbose_name_plural = "Statistiques des zones"
+        db_table = "inventaire_statistiques"
+        db_table_comment = "les statistiques précalculées de chaque zone d'USID"
+
+    objects = models.Manager()
+    # champs du modèle
+    zone_usid = models.CharField(verbose_name="Périmètre de l'USID", max_length=3, choices=ZoneUsid, unique=True)
+    date_calcul = models.DateTimeField(verbose_name="Date du calcul des statistiques")
+    a_jour = models.BooleanField(verbose_name="Statistiques à jour", default=True)
+    total_systemes = models.PositiveIntegerField(verbose_name="Nombre de S2I", default=0)
+    total_contrats = models.PositiveIntegerField(verbose_name="Nombre de contrats", default=0)
+    homologations_expirant = models.PositiveIntegerField(
+        verbose_name="Nombre d'homologations expirées ou expirant bientôt",
+        default=0,
+    )
+    licences_expirant = models.PositiveIntegerField(
+        verbose_name="Nombre de licences expirées ou expirant bientôt",
+        default=0,
+    )
+    repartitions = models.JSONField(verbose_name="Répartitions des S2I et des ordinateurs", default=dict)
+
+    def __str__(self) -> str:
+        """Affichage de l'élément"""
+        return f"Statistiques de l'{self.get_zone_usid_display()}"
@@ -0,0 +1,162 @@
+"""Définition de la pagination par curseur (keyset) des pages de recherche de l'inventaire"""
+
+import logging
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from hashlib import md5
+from json import dumps, loads
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db.models import Field, Model, Q, QuerySet
+
+logger = logging.getLogger(__name__)
+
+# les paramètres GET utilisés par les deux modes de pagination
+PARAMETRES_PAGINATION = ("page", "apres", "avant")
+
+
+def encode_curseur(valeurs: list) -> str:
+    """Encode les valeurs des champs de tri d'une ligne en un curseur transmissible dans une URL"""
+    return urlsafe_b64encode(dumps(valeurs, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decode_curseur(curseur: str | None, taille: int) -> list | None:
+    """Décode un curseur, renvoie None s'il est absent ou invalide"""
+    if not curseur:
+        return None
+    try:
+        valeurs = loads(urlsafe_b64decode(curseur.encode("ascii")))
+    except (Base64Error, UnicodeError, ValueError):
+        logger.debug("curseur de pagination invalide : %s" % curseur)
+        return None
+    if not isinstance(valeurs, list) or len(valeurs) != taille:
+        logger.debug("curseur de pagination invalide : %s" % curseur)
+        return None
+    return valeurs
+
+
+class PageCurseur:
+    """Page de résultats obtenue par curseur, utilisable comme 'page_obj' dans les gabarits"""
+
+    def __init__(self, object_list: list, curseur_precedent: str | None, curseur_suivant: str | None, total: int):
+        self.object_list = object_list
+        self.curseur_precedent = curseur_precedent
+        self.curseur_suivant = curseur_suivant
+        self.total = total
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self) -> int:
+        return len(self.object_list)
+
+    def has_previous(self) -> bool:
+        return self.curseur_precedent is not None
+
+    def has_next(self) -> bool:
+        return self.curseur_suivant is not None
+
+
+class PaginationCurseurMixin:
+    """Pagination par curseur des 'ListView', activée par le paramètre 'PAGINATION_CURSEUR'
+
+    Au lieu de 'OFFSET', la page suivante (paramètre 'apres') ou précédente (paramètre 'avant') est obtenue par une
+    comparaison sur les champs de tri 'ordre_curseur', qui doivent former un ordre total et ascendant (terminé par
+    'pk'). Le nombre total de résultats n'est compté qu'une fois par recherche et conservé en cache.
+    """
+
+    ordre_curseur: tuple[str, ...] = ()
+
+    def _condition_curseur(self, valeurs: list, operateur: str) -> Q:
+        """Condition lexicographique '(champ_1, ..., champ_n) <opérateur> (valeur_1, ..., valeur_n)'"""
+        condition = Q()
+        egalites = {}
+        for champ, valeur in zip(self.ordre_curseur, valeurs):
+            condition |= Q(**egalites, **{f"{champ}__{operateur}": valeur})
+            egalites[champ] = valeur
+        return condition
+
+    def _champs_curseur(self, modele: type[Model]) -> list[Field]:
+        """Les champs du modèle désignés par 'ordre_curseur', en traversant les relations"""
+        champs = []
+        for chemin in self.ordre_curseur:
+            champ, courant = None, modele
+            for nom in chemin.split("__"):
+                champ = courant._meta.pk if nom == "pk" else courant._meta.get_field(nom)
+                if champ.is_relation:
+                    courant = champ.related_model
+                    champ = courant._meta.pk
+            champs.append(champ)
+        return champs
+
+    def _valide_curseur(self, modele: type[Model], valeurs: list | None) -> list | None:
+        """Convertit les valeurs d'un curseur selon le type de leur champ de tri, None si l'une d'elles est invalide"""
+        if valeurs is None:
+            return None
+        converties = []
+        for champ, valeur in zip(self._champs_curseur(modele), valeurs):
+            if not isinstance(valeur, (str, int, float)):  # None, listes et dictionnaires
+                logger.debug("curseur de pagination invalide : %r pour %s" % (valeur, champ.name))
+                return None
+            try:
+                converties.append(champ.to_python(valeur))
+            except ValidationError:
+                logger.debug("curseur de pagination invalide : %r pour %s" % (valeur, champ.name))
+                return None
+        return converties
+
+    def _valeurs_curseur(self, objet) -> list:
+        """Valeurs des champs de tri d'une ligne (les relations doivent être chargées par 'select_related')"""
+        valeurs = []
+        for champ in self.ordre_curseur:
+            valeur = objet
+            for attribut in champ.split("__"):
+                valeur = getattr(valeur, attribut)
+            valeurs.append(valeur)
+        return valeurs
+
+    @staticmethod
+    def nombre_resultats(queryset: QuerySet) -> int:
+        """Nombre total de résultats de la recherche, conservé en cache quelle que soit la page demandée"""
+        try:
+            sql = str(queryset.order_by().query)
+        except EmptyResultSet:
+            return 0
+        clef = "inventaire:pagination:" + md5(sql.encode("utf-8")).hexdigest()
+        return cache.get_or_set(clef, queryset.order_by().count, settings.CACHE_PAGINATION_DUREE)
+
+    def paginate_queryset(self, queryset, page_size):
+        """Pagine la requête par curseur si le mode est activé, sinon par numéro de page"""
+        if not settings.PAGINATION_CURSEUR:
+            return super().paginate_queryset(queryset, page_size)
+
+        total = self.nombre_resultats(queryset)
+        taille = len(self.ordre_curseur)
+        # un curseur modifié à la main, qui ne correspond pas aux champs de tri, renvoie vers la première page
+        avant = self._valide_curseur(queryset.model, decode_curseur(self.request.GET.get("avant"), taille))
+        apres = self._valide_curseur(queryset.model, decode_curseur(self.request.GET.get("apres"), taille))
+        if avant is not None:
+            # page précédente : parcours à rebours depuis le curseur, puis remise dans l'ordre
+            lignes = list(
+                queryset.filter(self._condition_curseur(avant, "lt")).order_by(
+                    *[f"-{k}" for k in self.ordre_curseur]
+                )[: page_size + 1]
+            )
+            a_precedent, a_suivant = len(lignes) > page_size, True
+            lignes = lignes[:page_size][::-1]
+        else:
+            if apres is not None:
+                queryset = queryset.filter(self._condition_curseur(apres, "gt"))
+            lignes = list(queryset.order_by(*self.ordre_curseur)[: page_size + 1])
+            a_precedent, a_suivant = apres is not None, len(lignes) > page_size
+            lignes = lignes[:page_size]
+
+        page = PageCurseur(
+            object_list=lignes,
+            curseur_precedent=encode_curseur(self._valeurs_curseur(lignes[0])) if a_precedent and lignes else None,
+            curseur_suivant=encode_curseur(self._valeurs_curseur(lignes[-1])) if a_suivant and lignes else None,
+            total=total,
+        )
+        return None, page, lignes, True
@@ -0,0 +1,105 @@
+"""Parcours à plusieurs sauts du réseau des interconnexions, calculé en base de donnée
+
+Les systèmes atteignables depuis un système sont obtenus en une seule requête récursive ('WITH RECURSIVE', compris
+par SQLite et PostgreSQL) sur la table des interconnexions. Le parcours mémorise pour chaque système atteint, à
+chaque profondeur, le système par lequel il a été atteint : l'union sans doublon borne le nombre de lignes au
+nombre d'interconnexions multiplié par la profondeur, même en présence de cycles. Le plus court chemin vers chaque
+système est ensuite reconstitué en remontant ces prédécesseurs.
+
+Seuls les systèmes des zones données, hors corbeille, sont traversés : un système hors de ces zones n'est ni
+renvoyé, ni utilisé comme intermédiaire. Les colonnes initiales sont typées explicitement, PostgreSQL exigeant
+les mêmes types dans les deux parties de la requête récursive.
+"""
+
+import logging
+from collections.abc import Iterable
+from dataclasses import dataclass
+
+from django.db import connection
+
+from inventaire.models import Interconnexion, Localisation, SystemeIndustriel
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Atteignable:
+    """Un système atteignable, sa distance en nombre de sauts et le plus court chemin depuis l'origine"""
+
+    pk: int
+    distance: int
+    chemin: tuple[int, ...]
+
+
+def _marqueurs(valeurs: list) -> str:
+    """Les paramètres d'une clause 'IN'"""
+    return ", ".join(["%s"] * len(valeurs))
+
+
+def atteignables(
+    origine: int,
+    zones: Iterable[str],
+    profondeur: int,
+    limite: int,
+    reseaux: Iterable[int] | None = None,
+) -> tuple[list[Atteignable], bool]:
+    """Les systèmes atteignables depuis 'origine' en au plus 'profondeur' sauts, du plus proche au plus lointain
+
+    Args:
+        origine: la clef primaire du système de départ
+        zones: les zones d'USID dont les systèmes peuvent être traversés
+        profondeur: le nombre maximal de sauts
+        limite: le nombre maximal de systèmes renvoyés
+        reseaux: si donnés, seules les interconnexions de ces types de réseau sont suivies
+
+    Returns:
+        les systèmes atteignables, et si la liste a été tronquée à 'limite'
+    """
+    zones = list(zones)
+    if not zones:
+        return [], False
+    parametres = [origine, profondeur, False, *zones]
+    filtre_reseau = ""
+    if reseaux is not None:
+        reseaux = list(reseaux)
+        if not reseaux:
+            return [], False
+        filtre_reseau = f"AND i.type_reseau IN ({_marqueurs(reseaux)})"
+        parametres.extend(reseaux)
+    parametres.append(limite + 1)
+
+    requete = f"""
+        WITH RECURSIVE parcours(systeme, precedent, profondeur) AS (
+            SELECT CAST(%s AS BIGINT), CAST(NULL AS BIGINT), 0
+            UNION
+            SELECT i.systeme_to_id, p.systeme, p.profondeur + 1
+            FROM parcours p
+            INNER JOIN {Interconnexion._meta.db_table} i ON i.systeme_from_id = p.systeme
+            INNER JOIN {SystemeIndustriel._meta.db_table} s ON s.id = i.systeme_to_id
+            INNER JOIN {Localisation._meta.db_table} l ON l.id = s.localisation_id
+            WHERE p.profondeur < %s AND s.fiche_corbeille = %s AND l.zone_usid IN ({_marqueurs(zones)}) {filtre_reseau}
+        ),
+        distances(systeme, distance) AS (
+            SELECT systeme, MIN(profondeur) FROM parcours GROUP BY systeme
+        )
+        SELECT p.systeme, MIN(p.precedent), d.distance
+        FROM parcours p
+        INNER JOIN distances d ON d.systeme = p.systeme AND d.distance = p.profondeur
+        WHERE d.distance > 0
+        GROUP BY p.systeme, d.distance
+        ORDER BY d.distance, p.systeme
+        LIMIT %s
+    """
+    with connection.cursor() as curseur:
+        curseur.execute(requete, parametres)
+        lignes = curseur.fetchall()
+
+    tronque = len(lignes) > limite
+    # un précédent à la profondeur minimale est lui-même à sa distance minimale : il précède dans le tri
+    chemins = {origine: (origine,)}
+    resultat = []
+    for systeme, precedent, distance in lignes[:limite]:
+        chemins[systeme] = chemins[precedent] + (systeme,)
+        resultat.append(Atteignable(pk=systeme, distance=distance, chemin=chemins[systeme]))
+    logger.debug("%d systèmes atteignables depuis %d en %d sauts" % (len(resultat), origine, profondeur))
+    return resultat, tronque
@@ -0,0 +1,233 @@
+"""Définition des signaux de l'inventaire
+
+Ces récepteurs maintiennent la cohérence des données calculées et conservées en cache.
+Ils sont connectés au démarrage de l'application, dans 'apps.py'.
+"""
+
+from django.contrib.auth.models import Group, Permission, User
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from inventaire.cartographie import Site, invalide_cartographies, sites_systemes
+from inventaire.models import (
+    ContratMaintenance,
+    DomaineMetier,
+    FonctionsMetier,
+    Interconnexion,
+    Localisation,
+    SystemeIndustriel,
+)
+from inventaire.statistiques import perime_statistiques
+from inventaire.utils import invalidations_suspendues, invalide_zones_utilisateurs
+
+
+# les zones des utilisateurs
+_ACTIONS_M2M = ("post_add", "post_remove", "pre_clear")
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def zones_groupes_utilisateur(sender, instance, action, reverse, pk_set, **kwargs):
+    """Un utilisateur change de groupe (ou un groupe change de membres)"""
+    if action not in _ACTIONS_M2M:
+        return
+    if not reverse:  # user.groups.add(...)
+        invalide_zones_utilisateurs([instance.pk])
+    elif pk_set:  # group.user_set.add(...)
+        invalide_zones_utilisateurs(pk_set)
+    else:  # group.user_set.clear()
+        invalide_zones_utilisateurs(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def zones_permissions_utilisateur(sender, instance, action, reverse, pk_set, **kwargs):
+    """Les permissions directes d'un utilisateur changent"""
+    if action not in _ACTIONS_M2M:
+        return
+    if not reverse:  # user.user_permissions.add(...)
+        invalide_zones_utilisateurs([instance.pk])
+    elif pk_set:  # permission.user_set.add(...)
+        invalide_zones_utilisateurs(pk_set)
+    else:  # permission.user_set.clear()
+        invalide_zones_utilisateurs(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def zones_permissions_groupe(sender, instance, action, reverse, pk_set, **kwargs):
+    """Les permissions d'un groupe changent, tous ses membres sont concernés"""
+    if action not in _ACTIONS_M2M:
+        return
+    if not reverse:  # group.permissions.add(...)
+        invalide_zones_utilisateurs(instance.user_set.values_list("pk", flat=True))
+    elif pk_set:  # permission.group_set.add(...)
+        invalide_zones_utilisateurs(User.objects.filter(groups__in=pk_set).values_list("pk", flat=True))
+    else:  # permission.group_set.clear()
+        invalide_zones_utilisateurs(User.objects.filter(groups__permissions=instance).values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def zones_utilisateur_modifie(sender, instance, update_fields=None, **kwargs):
+    """Les statuts 'is_active' et 'is_superuser' changent aussi les zones accessibles"""
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return  # simple connexion de l'utilisateur
+    invalide_zones_utilisateurs([instance.pk])
+
+
+@receiver(pre_delete, sender=Group)
+@receiver(pre_delete, sender=Permission)
+def zones_groupe_supprime(sender, instance, **kwargs):
+    """La suppression d'un groupe ou d'une permission retire des droits à tous ses détenteurs"""
+    if sender is Group:
+        invalide_zones_utilisateurs(instance.user_set.values_list("pk", flat=True))
+    else:
+        invalide_zones_utilisateurs(User.objects.filter(user_permissions=instance).values_list("pk", flat=True))
+        invalide_zones_utilisateurs(User.objects.filter(groups__permissions=instance).values_list("pk", flat=True))
+
+
+# la criticité des systèmes industriels
+@receiver(post_save, sender=SystemeIndustriel)
+def criticite_systeme_modifie(sender, instance, raw=False, **kwargs):
+    """Le domaine, l'environnement ou la localisation d'un S2I a pu changer"""
+    if not raw:
+        instance.met_a_jour_criticite()
+
+
+@receiver(m2m_changed, sender=SystemeIndustriel.fonctions_metiers.through)
+def criticite_fonctions_modifiees(sender, instance, action, reverse, pk_set, **kwargs):
+    """Les fonctions métiers d'un S2I changent"""
+    if not reverse:  # systeme.fonctions_metiers.add(...)
+        if action in ("post_add", "post_remove", "post_clear"):
+            instance.met_a_jour_criticite()
+    elif action == "pre_clear":  # fonction.systemes.clear(), les systèmes ne seront plus connus après
+        instance._systemes_avant_clear = list(instance.systemes.values_list("pk", flat=True))
+    elif action == "post_clear":
+        SystemeIndustriel.objects.filter(pk__in=getattr(instance, "_systemes_avant_clear", [])).recalcule_criticite()
+    elif action in ("post_add", "post_remove"):  # fonction.systemes.add(...)
+        SystemeIndustriel.objects.filter(pk__in=pk_set).recalcule_criticite()
+
+
+@receiver(post_save, sender=Localisation)
+@receiver(post_save, sender=DomaineMetier)
+@receiver(post_save, sender=FonctionsMetier)
+def criticite_coefficient_modifie(sender, instance, created=False, raw=False, **kwargs):
+    """La sensibilité d'une localisation ou le coefficient d'un domaine ou d'une fonction a pu changer"""
+    if not created and not raw:
+        instance.systemes.all().recalcule_criticite()
+
+
+# les statistiques de la page d'accueil
+def _zone(instance) -> str | None:
+    """Zone d'USID d'un système, d'un contrat ou d'une localisation"""
+    if not isinstance(instance, SystemeIndustriel):
+        return instance.zone_usid
+    try:
+        return instance.localisation.zone_usid if instance.localisation_id else None
+    except Localisation.DoesNotExist:
+        return None
+
+
+def _zone_avant(instance) -> str | None:
+    """Zone d'USID enregistrée avant modification, retenue au chargement de l'instance
+
+    La zone d'un système n'est relue que s'il a changé de localisation.
+    """
+    if not isinstance(instance, SystemeIndustriel):
+        return instance.valeur_chargee("zone_usid")
+    localisation = instance.valeur_chargee("localisation_id")
+    if localisation is None or localisation == instance.localisation_id:
+        return None
+    return Localisation.objects.filter(pk=localisation).values_list("zone_usid", flat=True).first()
+
+
+@receiver(post_save, sender=SystemeIndustriel)
+@receiver(post_save, sender=ContratMaintenance)
+@receiver(post_save, sender=Localisation)
+@receiver(post_delete, sender=SystemeIndustriel)
+@receiver(post_delete, sender=ContratMaintenance)
+@receiver(post_delete, sender=Localisation)
+def statistiques_zone_modifiee(sender, instance, raw=False, **kwargs):
+    """Un système, un contrat ou une localisation est créé, modifié, mis à la corbeille ou supprimé"""
+    if not raw and not invalidations_suspendues():
+        perime_statistiques([_zone(instance), _zone_avant(instance)])
+
+
+@receiver(post_save, sender=DomaineMetier)
+@receiver(post_delete, sender=DomaineMetier)
+def statistiques_domaine_modifie(sender, instance, raw=False, **kwargs):
+    """Le nom d'un domaine métier apparait dans les statistiques de toutes les zones"""
+    if not raw:
+        perime_statistiques()
+
+
+# la cartographie des sites
+def _site_avant(localisation: Localisation) -> Site | None:
+    """Site enregistré d'une localisation, retenu à son chargement"""
+    site = tuple(localisation.valeur_chargee(k) for k in ("zone_usid", "nom_ville", "nom_quartier"))
+    return None if None in site else site
+
+
+@receiver(pre_delete, sender=SystemeIndustriel)
+@receiver(pre_delete, sender=Localisation)
+def cartographie_avant_suppression(sender, instance, **kwargs):
+    """Retient les sites représentant l'objet supprimé, ses interconnexions étant supprimées avec lui"""
+    if invalidations_suspendues():
+        return
+    if sender is SystemeIndustriel:
+        instance._sites_avant = sites_systemes([instance.pk])
+    else:
+        instance._sites_avant = sites_systemes(instance.systemes.values("pk"))
+        instance._sites_avant.add((instance.zone_usid, instance.nom_ville, instance.nom_quartier))
+
+
+@receiver(post_save, sender=SystemeIndustriel)
+def cartographie_systeme_modifie(sender, instance, raw=False, **kwargs):
+    """Un système est créé, modifié ou déplacé, les cartographies de ses sites et de ceux de ses voisins changent
+
+    Ses interconnexions n'étant pas modifiées, seule son ancienne localisation s'ajoute aux sites actuels.
+    """
+    if raw or invalidations_suspendues():
+        return
+    sites = sites_systemes([instance.pk])
+    localisation = instance.valeur_chargee("localisation_id")
+    if localisation is not None and localisation != instance.localisation_id:
+        sites.update(Localisation.objects.filter(pk=localisation).values_list("zone_usid", "nom_ville", "nom_quartier"))
+    invalide_cartographies(sites)
+
+
+@receiver(post_save, sender=Localisation)
+def cartographie_localisation_modifiee(sender, instance, created=False, raw=False, **kwargs):
+    """Une localisation est créée, renommée ou déplacée dans un autre site, avec ses systèmes"""
+    if raw or invalidations_suspendues():
+        return
+    sites = {(instance.zone_usid, instance.nom_ville, instance.nom_quartier)}
+    if not created:
+        sites.update(sites_systemes(instance.systemes.values("pk")))
+        site_avant = _site_avant(instance)
+        if site_avant is not None:
+            sites.add(site_avant)
+    invalide_cartographies(sites)
+
+
+@receiver(post_delete, sender=SystemeIndustriel)
+@receiver(post_delete, sender=Localisation)
+def cartographie_supprimee(sender, instance, **kwargs):
+    """Un système ou une localisation est supprimé, ses liens ne sont plus connus : les sites retenus sont invalidés"""
+    invalide_cartographies(getattr(instance, "_sites_avant", set()))
+
+
+# pas de récepteur de suppression : il empêcherait la suppression en une requête des interconnexions, dont les
+# cartographies sont invalidées par 'InterconnexionQuerySet.delete'
+@receiver(post_save, sender=Interconnexion)
+def cartographie_interconnexion_modifiee(sender, instance, raw=False, **kwargs):
+    """Une interconnexion enregistrée apparait sur la cartographie des sites de ses deux systèmes"""
+    if not raw and not invalidations_suspendues():
+        invalide_cartographies(sites_systemes([instance.systeme_from_id, instance.systeme_to_id], voisins=False))
+
+
+# après tous les autres récepteurs : l'état enregistré devient la référence des prochaines modifications
+@receiver(post_save, sender=SystemeIndustriel)
+@receiver(post_save, sender=ContratMaintenance)
+@receiver(post_save, sender=Localisation)
+def valeurs_enregistrees(sender, instance, **kwargs):
+    """Les valeurs sauvegardées deviennent les valeurs enregistrées de l'instance"""
+    instance.retient_valeurs()
@@ -0,0 +1,209 @@
+"""Définition des statistiques du tableau de bord de l'inventaire
+
+Les statistiques de chaque zone d'USID sont précalculées périodiquement dans la table 'StatistiquesZone' par la
+tâche 'rafraichit_statistiques'. La page d'accueil les agrège pour l'ensemble des zones de l'utilisateur, ou les
+calcule en direct (deux requêtes) si une des zones n'a pas de statistiques à jour. Le résultat est conservé en cache.
+
+Chaque zone possède un numéro de version qui est changé par les signaux à chaque modification d'un système, d'un
+contrat ou d'une localisation de la zone : les statistiques des ensembles de zones la contenant sont alors
+recalculées à la demande suivante.
+"""
+
+import logging
+from collections.abc import Iterable
+from datetime import date, timedelta
+from hashlib import md5
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from inventaire.models import (
+    ContratMaintenance,
+    LicenceLogiciel,
+    Localisation,
+    MaterielOrdinateur,
+    StatistiquesZone,
+    SystemeIndustriel,
+    ZoneUsid,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _clef_version(zone: str) -> str:
+    """Clef du cache de la version des statistiques d'une zone d'USID"""
+    return f"inventaire:statistiques:version:{zone}"
+
+
+def invalide_statistiques(zones: Iterable[str] | None = None) -> None:
+    """Invalide les statistiques en cache de toutes les zones données (toutes les zones si 'None')"""
+    if zones is None:
+        zones = ZoneUsid.values
+    cache.set_many({_clef_version(k): uuid4().hex for k in set(zones) if k}, timeout=None)
+
+
+def perime_statistiques(zones: Iterable[str] | None = None) -> None:
+    """Marque les statistiques précalculées des zones données comme périmées et invalide le cache"""
+    zones = set(ZoneUsid.values if zones is None else [k for k in zones if k])
+    StatistiquesZone.objects.filter(zone_usid__in=zones, a_jour=True).update(a_jour=False)
+    invalide_statistiques(zones)
+
+
+def calcule_statistiques_zone(zone: str) -> dict:
+    """Calcule toutes les statistiques d'une zone, sous la forme des champs du modèle 'StatistiquesZone'"""
+    limite = date.today() + timedelta(days=settings.STATISTIQUES_DELAI_EXPIRATION)
+    lignes = (
+        Localisation.objects.filter(zone_usid=zone)
+        .values(
+            "nom_ville",
+            "systemes__domaine_metier__nom",
+            "systemes__homologation_classe",
+            "systemes__environnement",
+        )
+        .annotate(
+            nb=Count("systemes"),
+            nb_expirant=Count("systemes", filter=Q(systemes__homologation_fin__lte=limite)),
+        )
+        .order_by()
+    )
+    repartitions = {"domaine_metier": {}, "nom_ville": {}, "homologation_classe": {}, "environnement": {}}
+    homologations_expirant = 0
+    for k in lignes:
+        _ajoute(repartitions["nom_ville"], k["nom_ville"], k["nb"])
+        if k["systemes__domaine_metier__nom"] is not None:
+            _ajoute(repartitions["domaine_metier"], k["systemes__domaine_metier__nom"], k["nb"])
+            _ajoute(repartitions["homologation_classe"], str(k["systemes__homologation_classe"]), k["nb"])
+            _ajoute(repartitions["environnement"], str(k["systemes__environnement"]), k["nb"])
+            homologations_expirant += k["nb_expirant"]
+    repartitions["os_famille"] = {
+        str(k["os_famille"]): k["nb"]
+        for k in MaterielOrdinateur.objects.filter(systeme__localisation__zone_usid=zone)
+        .values("os_famille")
+        .annotate(nb=Count("pk"))
+        .order_by()
+    }
+
+    return {
+        "total_systemes": sum(repartitions["nom_ville"].values()),
+        "total_contrats": ContratMaintenance.objects.filter(zone_usid=zone).count(),
+        "homologations_expirant": homologations_expirant,
+        "licences_expirant": LicenceLogiciel.objects.filter(
+            systeme__localisation__zone_usid=zone,
+            date_fin__lte=limite,
+        ).count(),
+        "repartitions": repartitions,
+    }
+
+
+def rafraichit_statistiques_zones(zones: Iterable[str] | None = None) -> int:
+    """Recalcule et enregistre les statistiques précalculées des zones données (toutes les zones si 'None')"""
+    zones = ZoneUsid.values if zones is None else list(zones)
+    for zone in zones:
+        StatistiquesZone.objects.update_or_create(
+            zone_usid=zone,
+            defaults={**calcule_statistiques_zone(zone), "date_calcul": timezone.now(), "a_jour": True},
+        )
+    invalide_statistiques(zones)
+    return len(zones)
+
+
+def _ajoute(repartition: dict, clef: str, nb: int) -> None:
+    repartition[clef] = repartition.get(clef, 0) + nb
+
+
+def _format_accueil(total_systemes: int, total_contrats: int, domaines: dict, villes: dict, classes: dict) -> dict:
+    """Met en forme les statistiques pour les graphiques de la page d'accueil (libellés triés)"""
+    domaines = sorted(domaines.items())
+    villes = sorted(villes.items())
+    classes = sorted((int(k), v) for k, v in classes.items())
+    return {
+        "total_systemes": total_systemes,
+        "total_contrats": total_contrats,
+        "stat": {
+            "pie_domaine_metier": {"label": [k[0] for k in domaines], "data": [k[1] for k in domaines]},
+            "pie_nom_ville": {"label": [k[0] for k in villes], "data": [k[1] for k in villes]},
+            "pie_homologation_classe": {
+                "label": [SystemeIndustriel.ClasseHomologation(k[0]).label for k in classes],
+                "data": [k[1] for k in classes],
+            },
+        },
+    }
+
+
+def agrege_statistiques(lignes: Iterable[StatistiquesZone]) -> dict:
+    """Agrège les statistiques précalculées de plusieurs zones"""
+    agrege = {
+        "total_systemes": 0,
+        "total_contrats": 0,
+        "homologations_expirant": 0,
+        "licences_expirant": 0,
+        "repartitions": {"domaine_metier": {}, "nom_ville": {}, "homologation_classe": {}, "environnement": {}},
+    }
+    for ligne in lignes:
+        for champ in ("total_systemes", "total_contrats", "homologations_expirant", "licences_expirant"):
+            agrege[champ] += getattr(ligne, champ)
+        for nom, repartition in ligne.repartitions.items():
+            for clef, nb in repartition.items():
+                _ajoute(agrege["repartitions"].setdefault(nom, {}), clef, nb)
+    return agrege
+
+
+def calcule_statistiques(zones: list[str]) -> dict:
+    """Calcule en direct les statistiques de la page d'accueil pour les zones données
+
+    Une seule requête groupe les localisations (même sans système) par ville, domaine métier et classe
+    d'homologation de leurs systèmes, une seconde compte les contrats. Comme avant, les systèmes dans la corbeille
+    sont comptés.
+    """
+    lignes = (
+        Localisation.objects.filter(zone_usid__in=zones)
+        .values("nom_ville", "systemes__domaine_metier__nom", "systemes__homologation_classe")
+        .annotate(nb=Count("systemes"))
+        .order_by()
+    )
+    villes, domaines, classes = {}, {}, {}
+    for k in lignes:
+        _ajoute(villes, k["nom_ville"], k["nb"])
+        if k["systemes__domaine_metier__nom"] is not None:
+            _ajoute(domaines, k["systemes__domaine_metier__nom"], k["nb"])
+            _ajoute(classes, k["systemes__homologation_classe"], k["nb"])
+    total_contrats = ContratMaintenance.objects.filter(zone_usid__in=zones).count()
+    return _format_accueil(sum(villes.values()), total_contrats, domaines, villes, classes)
+
+
+def statistiques_accueil(zones: Iterable[str]) -> dict:
+    """Renvoie les statistiques de la page d'accueil pour les zones données, depuis le cache si possible"""
+    zones = sorted(set(zones))
+    if not zones:
+        return calcule_statistiques(zones)
+
+    # la clef dépend des versions de chacune des zones, initialisées si elles sont absentes du cache
+    clefs_versions = [_clef_version(k) for k in zones]
+    versions = cache.get_many(clefs_versions)
+    manquantes = {k: uuid4().hex for k in clefs_versions if k not in versions}
+    if manquantes:
+        cache.set_many(manquantes, timeout=None)
+        versions.update(manquantes)
+    empreinte = md5(":".join(f"{k}-{versions[c]}" for k, c in zip(zones, clefs_versions)).encode("utf-8"))
+    clef = f"inventaire:statistiques:{empreinte.hexdigest()}"
+
+    statistiques = cache.get(clef)
+    if statistiques is None:
+        lignes = list(StatistiquesZone.objects.filter(zone_usid__in=zones, a_jour=True))
+        if len(lignes) == len(zones):
+            agrege = agrege_statistiques(lignes)
+            statistiques = _format_accueil(
+                agrege["total_systemes"],
+                agrege["total_contrats"],
+                agrege["repartitions"]["domaine_metier"],
+                agrege["repartitions"]["nom_ville"],
+                agrege["repartitions"]["homologation_classe"],
+            )
+        else:
+            logger.debug("statistiques des zones %s calculées en direct" % zones)
+            statistiques = calcule_statistiques(zones)
+        cache.set(clef, statistiques, settings.CACHE_STATISTIQUES_DUREE)
+    return statistiques
@@ -0,0 +1,146 @@
+"""Définition du stockage des fichiers excel d'import
+
+Les fichiers envoyés par le formulaire ou la commande 'importe_systemes' sont écrits morceau par morceau dans le
+dossier 'IMPORT_DOSSIER', partagé entre le serveur web et celery (le volume 'tempo'). Le nom d'un fichier est
+l'empreinte sha256 de son contenu : seul ce nom transite par le service de messages, jamais le contenu.
+
+Un lot de fichiers, un par zone d'USID, est fourni sous forme de dossier ou d'archive zip : la zone de chaque
+fichier est déduite de son nom, qui doit contenir la ville de l'USID.
+"""
+
+import logging
+import re
+import unicodedata
+from collections.abc import Iterable
+from functools import partial
+from hashlib import sha256
+from pathlib import Path, PurePosixPath
+from tempfile import NamedTemporaryFile
+from time import time
+from typing import BinaryIO
+from zipfile import BadZipFile, ZipFile
+
+from django.conf import settings
+
+from inventaire.models import ZoneUsid
+
+logger = logging.getLogger(__name__)
+
+# les noms des fichiers créés par 'enregistre_fichier_import'
+NOM_FICHIER_IMPORT = re.compile(r"^[0-9a-f]{64}\.xlsx$")
+# suffixe des fichiers en cours d'écriture
+SUFFIXE_EN_COURS = ".part"
+# lecture des fichiers d'un lot par morceaux de 1 Mo
+TAILLE_MORCEAU = 1024 * 1024
+
+
+def enregistre_fichier_import(morceaux: Iterable[bytes]) -> str:
+    """Écrit un fichier d'import dans le dossier partagé sans le charger en mémoire, renvoie son nom
+
+    Le fichier est d'abord écrit sous un nom temporaire puis renommé, une tâche ne peut donc jamais lire un fichier
+    incomplet. Un même contenu n'est stocké qu'une fois.
+    """
+    dossier = Path(settings.IMPORT_DOSSIER)
+    dossier.mkdir(parents=True, exist_ok=True)
+    empreinte = sha256()
+    with NamedTemporaryFile(dir=dossier, suffix=SUFFIXE_EN_COURS, delete=False) as f:
+        temporaire = Path(f.name)
+        try:
+            for morceau in morceaux:
+                empreinte.update(morceau)
+                f.write(morceau)
+        except BaseException:
+            f.close()
+            temporaire.unlink(missing_ok=True)
+            raise
+    nom = f"{empreinte.hexdigest()}.xlsx"
+    temporaire.replace(dossier / nom)
+    logger.debug("fichier d'import enregistré : %s" % nom)
+    return nom
+
+
+def chemin_fichier_import(nom: str) -> Path:
+    """Chemin d'un fichier d'import, seuls les noms créés par 'enregistre_fichier_import' sont acceptés"""
+    if not NOM_FICHIER_IMPORT.match(nom):
+        raise ValueError("le nom de fichier d'import '%s' est invalide" % nom)
+    return Path(settings.IMPORT_DOSSIER) / nom
+
+
+def purge_fichiers_import(age: int) -> int:
+    """Supprime les fichiers d'import, et les écritures interrompues, plus vieux que 'age' secondes
+
+    Les autres fichiers du dossier partagé ne sont pas touchés. Renvoie le nombre de fichiers supprimés.
+    """
+    dossier = Path(settings.IMPORT_DOSSIER)
+    if not dossier.is_dir():
+        return 0
+    limite = time() - age
+    supprimes = 0
+    for chemin in dossier.iterdir():
+        if not (NOM_FICHIER_IMPORT.match(chemin.name) or chemin.name.endswith(SUFFIXE_EN_COURS)):
+            continue
+        if chemin.stat().st_mtime < limite:
+            chemin.unlink(missing_ok=True)
+            supprimes += 1
+    return supprimes
+
+
+def _sans_accents(texte: str) -> str:
+    """Texte en minuscules et sans accents, pour comparer des noms de fichiers"""
+    return "".join(k for k in unicodedata.normalize("NFKD", texte) if not unicodedata.combining(k)).lower()
+
+
+def ville_zone(zone: ZoneUsid) -> str:
+    """Ville d'une zone d'USID, telle qu'écrite dans le nom des fichiers excel ('USID de Bourges-Avord' -> 'Avord')"""
+    label = zone.label
+    for separateur in ("'", "-", " "):
+        if separateur in label:
+            return label[label.rfind(separateur) + 1 :]
+    return label
+
+
+def zone_fichier_import(nom: str) -> ZoneUsid | None:
+    """Zone d'USID d'un fichier excel d'après son nom, None si aucune ou plusieurs villes y apparaissent"""
+    nom = _sans_accents(nom)
+    zones = [k for k in ZoneUsid if _sans_accents(ville_zone(k)) in nom]
+    return zones[0] if len(zones) == 1 else None
+
+
+def enregistre_lot_import(source: Path | str | BinaryIO) -> dict[ZoneUsid, str]:
+    """Enregistre dans le dossier partagé les fichiers excel d'un dossier ou d'une archive zip, un par zone
+
+    Renvoie le nom de chaque fichier enregistré par zone. Un fichier dont la zone ne peut être déduite, deux
+    fichiers pour une même zone ou une archive invalide lèvent une ValueError.
+    """
+    fichiers = {}
+
+    def enregistre(nom: str, f: BinaryIO) -> None:
+        zone = zone_fichier_import(nom)
+        if zone is None:
+            raise ValueError("impossible de déduire la zone d'USID du fichier '%s'" % nom)
+        if zone in fichiers:
+            raise ValueError("plusieurs fichiers concernent l'%s" % zone.label)
+        fichiers[zone] = enregistre_fichier_import(iter(partial(f.read, TAILLE_MORCEAU), b""))
+
+    if isinstance(source, (str, Path)) and Path(source).is_dir():
+        for chemin in sorted(Path(source).glob("*.xlsx")):
+            if not chemin.name.startswith(("~$", ".")):
+                with open(chemin, "rb") as f:
+                    enregistre(chemin.name, f)
+    else:
+        try:
+            archive = ZipFile(source)
+        except BadZipFile as e:
+            raise ValueError("l'archive zip est invalide : %s" % e)
+        with archive:
+            for info in archive.infolist():
+                nom = PurePosixPath(info.filename).name
+                # les fichiers de verrouillage d'excel et les fichiers cachés sont ignorés
+                if info.is_dir() or not nom.lower().endswith(".xlsx") or nom.startswith(("~$", ".")):
+                    continue
+                with archive.open(info) as f:
+                    enregistre(nom, f)
+
+    if not fichiers:
+        raise ValueError("aucun fichier excel n'a été trouvé")
+    return fichiers
@@ -1 +1,3 @@
-from .importe_excel import importe_excel
+from .importe_excel import importe_excel, purge_imports
+from .importe_lot import rapporte_lot
+from .statistiques import rafraichit_statistiques
@@ -1,16 +1,28 @@
 """Permet d'importer les systèmes depuis un fichier excel (version excel 2.X)"""
 
 import logging
-from csv import reader
-from datetime import datetime
-from pathlib import Path
-from base64 import b64decode
-from tempfile import TemporaryDirectory
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from functools import partial
+from threading import Event, Lock
+from time import monotonic
 
 from celery import shared_task
-from django.db.utils import IntegrityError
-from xlsx2csv import Xlsx2csv
-
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Choices, Model
+
+from inventaire.cartographie import (
+    Site,
+    invalide_cartographies,
+    invalide_cartographies_zones,
+    sites_systemes,
+    sites_zones,
+)
+from inventaire.lecteur_excel import ClasseurExcel
 from inventaire.models import (
     DomaineMetier,
     FonctionsMetier,
@@ -21,16 +33,78 @@ from inventaire.models import (
     SystemeIndustriel,
     ZoneUsid,
 )
-from inventaire.utils import DomainesMetiersOfficiels, CeleryResult, CeleryResultStatus, CeleryResultMessageType
+from inventaire.statistiques import perime_statistiques
+from inventaire.stockage import chemin_fichier_import, purge_fichiers_import
+from inventaire.utils import (
+    DomainesMetiersOfficiels,
+    CeleryResult,
+    CeleryResultStatus,
+    CeleryResultMessageType,
+    PolitiqueImport,
+    invalidations_differees,
+)
 
 
 logger = logging.getLogger(__name__)
 
+# état de la tâche d'import pendant son exécution, son avancement est dans les méta-données
+ETAT_PROGRESSION = "PROGRESS"
+# champs identifiant une localisation (son 'unique_together')
+CHAMPS_CLEF_LOCALISATION = ("zone_usid", "nom_ville", "nom_quartier", "zone_quartier")
+# champs d'un système industriel déjà existant qui sont mis à jour par l'import
+CHAMPS_MAJ_SYSTEME = ("numero_gtp", "homologation_fin", "homologation_classe", "description")
+# champs d'une localisation déjà existante qui sont mis à jour par l'import différentiel
+CHAMPS_MAJ_LOCALISATION = ("protection", "sensibilite")
+# champs comparés par l'import différentiel pour retrouver un matériel déjà enregistré
+CHAMPS_MATERIELS = {
+    MaterielOrdinateur: ("fonction", "marque", "modele", "os_famille", "os_version", "nombre", "description"),
+    MaterielEffecteur: ("type", "marque", "modele", "nombre", "firmware", "cortec", "description"),
+}
+
 
 class ImporteExcelError(Exception):
     pass
 
 
+class ImporteExcelAnnulation(Exception):
+    """L'import est annulé, la transaction est entièrement défaite"""
+
+    pass
+
+
+def _normalise(valeur: str) -> str:
+    """Forme comparable d'une cellule : sans espaces autour, en minuscules et avec des apostrophes droites"""
+    return valeur.strip().lower().replace("’", "'")
+
+
+class TableChoix:
+    """Table de décodage d'une colonne du fichier csv vers une énumération de modèle
+
+    La table est construite une seule fois, avec la structure, à partir des valeurs et libellés de l'énumération et
+    des alias propres au fichier excel : décoder une cellule est une recherche dans un dictionnaire, et une nouvelle
+    orthographe s'ajoute dans les alias.
+    """
+
+    def __init__(self, colonne: int, choix: type[Choices], erreur: str, alias: dict[str, Choices] | None = None):
+        self.colonne = colonne
+        self.erreur = erreur
+        self.table = {}
+        for membre in choix:
+            self.table[_normalise(str(membre.label))] = membre
+            if isinstance(membre.value, str):
+                self.table[_normalise(membre.value)] = membre
+        for valeur, membre in (alias or {}).items():
+            self.table[_normalise(valeur)] = membre
+
+    def decode(self, ligne: list) -> Choices:
+        """Décode la cellule de la colonne, une valeur inconnue est une erreur indiquant la colonne"""
+        valeur = ligne[self.colonne]
+        try:
+            return self.table[_normalise(valeur)]
+        except KeyError:
+            raise ImporteExcelError("Colonne %s : %s" % (self.colonne + 1, self.erreur % valeur))
+
+
 class StructureLocalisation:
     """Traduction des informations de localisation du fichier csv vers le modèle Localisation"""
 
@@ -41,25 +115,28 @@ class StructureLocalisation:
     _protection = 7
     _sensibilite = 8
 
+    _table_zone_usid = TableChoix(
+        _zone_usid,
+        ZoneUsid,
+        "la zone_usid '%s' est inconnue",
+        alias={
+            "USID_ANGERS": ZoneUsid.AMS,
+            "USID_AVORD": ZoneUsid.BGA,
+            "USID_BRICY": ZoneUsid.OAN,
+            "USID_CHERBOURG": ZoneUsid.CBG,
+            "USID_EVREUX": ZoneUsid.EVX,
+            "USID_RENNES": ZoneUsid.RVC,
+            "USID_TOURS": ZoneUsid.TRS,
+        },
+    )
+    _table_protection = TableChoix(
+        _protection, Localisation.Protection, "le niveau de protection périmétrique '%s' est inconnu"
+    )
+    _table_sensibilite = TableChoix(_sensibilite, Localisation.Sensibilite, "le niveau de sensibilité '%s' est inconnu")
+
     def get_zone_usid(self, ligne: list) -> ZoneUsid:
         """Obtient le champ zone_usid dans le fichier csv"""
-        zone = ligne[self._zone_usid].upper()
-        if zone == "USID_ANGERS":
-            return ZoneUsid.AMS
-        elif zone == "USID_AVORD":
-            return ZoneUsid.BGA
-        elif zone == "USID_BRICY":
-            return ZoneUsid.OAN
-        elif zone == "USID_CHERBOURG":
-            return ZoneUsid.CBG
-        elif zone == "USID_EVREUX":
-            return ZoneUsid.EVX
-        elif zone == "USID_RENNES":
-            return ZoneUsid.RVC
-        elif zone == "USID_TOURS":
-            return ZoneUsid.TRS
-        else:
-            raise ImporteExcelError("Colonne %s : la zone_usid '%s' est inconnue" % (self._zone_usid + 1, zone))
+        return self._table_zone_usid.decode(ligne)
 
     def get_nom_ville(self, ligne: list) -> str:
         """Obtient le champ nom_ville dans le fichier csv"""
@@ -75,40 +152,11 @@ class StructureLocalisation:
 
     def get_protection(self, ligne: list) -> Localisation.Protection:
         """Obtient le champ protection dans le fichier csv"""
-        protection = ligne[self._protection].upper()
-        if protection == "MC":
-            return Localisation.Protection.MC
-        elif protection == "TM":
-            return Localisation.Protection.TM
-        elif protection == "ZP":
-            return Localisation.Protection.ZP
-        elif protection == "ZDHS":
-            return Localisation.Protection.ZDHS
-        elif protection == "ZR":
-            return Localisation.Protection.ZR
-        elif protection == "ZNAR":
-            return Localisation.Protection.ZNAR
-        elif protection == "ZV":
-            return Localisation.Protection.ZV
-        else:
-            raise ImporteExcelError(
-                "Colonne %s : le niveau de protection périmétrique '%s' est inconnu"
-                % (self._protection + 1, protection)
-            )
+        return self._table_protection.decode(ligne)
 
     def get_sensibilite(self, ligne: list) -> Localisation.Sensibilite:
         """Obtient le champ sensibilite dans le fichier csv"""
-        sensibilite = ligne[self._sensibilite].upper()
-        if sensibilite == "VITALE":
-            return Localisation.Sensibilite.VITALE
-        elif sensibilite == "HAUTE":
-            return Localisation.Sensibilite.HAUTE
-        elif sensibilite == "MOINDRE":
-            return Localisation.Sensibilite.MOINDRE
-        else:
-            raise ImporteExcelError(
-                "Colonne %s : le niveau de sensibilité '%s' est inconnu" % (self._sensibilite + 1, sensibilite)
-            )
+        return self._table_sensibilite.decode(ligne)
 
 
 class StructureDomaineMetier:
@@ -117,15 +165,15 @@ class StructureDomaineMetier:
     _domaine_metier = 10
     _domaines = DomainesMetiersOfficiels()
 
-    def get_domaine_metier(self, ligne: list) -> DomaineMetier:
+    def get_domaine_metier(self, ligne: list, domaines: dict[str, DomaineMetier]) -> DomaineMetier:
         """Obtient le champ domaine_metier dans le fichier csv
 
-        Cette fonction se base sur les domaines métiers déclarés dans la commande 'db_metiers'
+        Cette fonction se base sur les domaines métiers déclarés dans la commande 'db_metiers', préchargés par code
         """
         code_domaine_metier = ligne[self._domaine_metier].split("_")[0].upper()
         try:
-            return DomaineMetier.objects.get(code=code_domaine_metier)
-        except DomaineMetier.DoesNotExist:
+            return domaines[code_domaine_metier]
+        except KeyError:
             raise ImporteExcelError(
                 "Colonne %s: l'acronyme du domaine métier '%s' est inconnu"
                 % (self._domaine_metier + 1, code_domaine_metier)
@@ -136,23 +184,22 @@ class StructureFonctionMetier:
     """Traduction des informations du système industriel du fichier csv S2I vers le modèle FonctionMetier"""
 
     _nom = 11
-    _domaines = DomainesMetiersOfficiels()
+    # les codes des fonctions de chaque domaine métier
+    _fonctions = {k: frozenset(v) for k, v in DomainesMetiersOfficiels().fonctions.items()}
 
     def get_fonctions_metiers(self, ligne: list, domaine=None) -> list[str]:
         """Obtient les champs fonctions_metiers dans le fichier csv"""
         fonctions_metiers = ligne[self._nom].split("(")[-1][:-1].split("-")
-        fonctions_a_renvoyer = []
         # nota : le domaine métier est forcément connu, car validé par sa structure dédiée
+        fonctions_du_domaine = self._fonctions.get(domaine, frozenset())
 
         for k in fonctions_metiers:
-            if k in self._domaines.fonctions.get(domaine, None):
-                fonctions_a_renvoyer.append(k)
-            else:
+            if k not in fonctions_du_domaine:
                 raise ImporteExcelError(
                     "Colonne %s : la fonction de domaine métier '%s' est inconnue ou ne correspond pas au domaine métier inscrit"
                     % (self._nom + 1, k)
                 )
-        return fonctions_a_renvoyer
+        return fonctions_metiers
 
 
 class StructureSystemeIndustriel:
@@ -170,6 +217,28 @@ class StructureSystemeIndustriel:
     # _homologation_responsable n'est pas présent dans le ficher excel
     _description = 26
 
+    _table_environnement = TableChoix(
+        _environnement,
+        SystemeIndustriel.Environnement,
+        "l'environnement '%s' est inconnu",
+        alias={
+            "nucleaire": SystemeIndustriel.Environnement.NUC,
+            "operationnel": SystemeIndustriel.Environnement.OPS,
+        },
+    )
+    _table_homologation_classe = TableChoix(
+        _homologation_classe,
+        SystemeIndustriel.ClasseHomologation,
+        "la classe d'homologation '%s' est inconnue",
+        alias={
+            "": SystemeIndustriel.ClasseHomologation.NC,
+            "?": SystemeIndustriel.ClasseHomologation.NC,
+            "sommaire (1)": SystemeIndustriel.ClasseHomologation.C1,
+            "simplifiée (2)": SystemeIndustriel.ClasseHomologation.C2,
+            "standard (3)": SystemeIndustriel.ClasseHomologation.C3,
+        },
+    )
+
     def get_id_excel(self, ligne: list) -> str | None:
         """Obtient le champ de l'ID excel (hors BDD, correspondance entre les onglets)"""
         try:
@@ -183,30 +252,18 @@ class StructureSystemeIndustriel:
 
     def get_environnement(self, ligne: list) -> SystemeIndustriel.Environnement:
         """Obtient le champ environnement dans le fichier csv"""
-        environnement = ligne[self._environnement].lower()
-        if environnement == "autre":
-            return SystemeIndustriel.Environnement.AUTRE
-        elif environnement == "nucleaire":
-            return SystemeIndustriel.Environnement.NUC
-        elif environnement == "cyber":
-            return SystemeIndustriel.Environnement.CYB
-        elif environnement == "operationnel":
-            return SystemeIndustriel.Environnement.OPS
-        else:
-            raise ImporteExcelError(
-                "Colonne %s : l'environnement '%s' est inconnu" % (self._environnement + 1, environnement)
-            )
+        return self._table_environnement.decode(ligne)
 
     def get_numero_gtp(self, ligne: list) -> str:
         """Obtient le champ numero_gtp dans le fichier csv"""
         return ligne[self._numero_gtp]
 
-    def get_homologation_fin(self, ligne: list) -> None | datetime:
+    def get_homologation_fin(self, ligne: list) -> None | date:
         """Obtient le champ homologation_fin dans le fichier csv"""
         homologation_fin = ligne[self._homologation_fin]
         if homologation_fin:
             try:
-                return datetime.strptime(homologation_fin, "%d/%M/%Y")
+                return datetime.strptime(homologation_fin, "%d/%m/%Y").date()
             except ValueError:
                 raise ImporteExcelError(
                     "Colonne %s : impossible de convertir la date '%s'" % (self._homologation_fin + 1, homologation_fin)
@@ -214,22 +271,9 @@ class StructureSystemeIndustriel:
         else:
             return None
 
-    def get_homologation_classe(self, ligne: list) -> None | SystemeIndustriel.ClasseHomologation:
+    def get_homologation_classe(self, ligne: list) -> SystemeIndustriel.ClasseHomologation:
         """Obtient le champ homologation_classe dans le fichier csv"""
-        homologation_classe = ligne[self._homologation_classe].lower()
-        if not homologation_classe or homologation_classe == "?":
-            return SystemeIndustriel.ClasseHomologation.NC
-        elif homologation_classe == "sommaire (1)":
-            return SystemeIndustriel.ClasseHomologation.C1
-        elif homologation_classe == "simplifiée (2)":
-            return SystemeIndustriel.ClasseHomologation.C2
-        elif homologation_classe == "standard (3)":
-            return SystemeIndustriel.ClasseHomologation.C3
-        else:
-            raise ImporteExcelError(
-                "Colonne %s : la classe d'homologation '%s' est inconnue"
-                % (self._homologation_classe + 1, homologation_classe)
-            )
+        return self._table_homologation_classe.decode(ligne)
 
     def get_description(self, ligne: list) -> str:
         """Obtient le champ description dans le fichier csv"""
@@ -248,34 +292,30 @@ class StructureMaterielOrdinateur:
     _nombre = 13
     _description = 14
 
+    _table_fonction = TableChoix(
+        _fonction,
+        MaterielOrdinateur.Fonction,
+        "la fonction '%s' est inconnue",
+        alias={"serveur de base de données": MaterielOrdinateur.Fonction.BASED},
+    )
+    _table_os_famille = TableChoix(
+        _os_famille,
+        MaterielOrdinateur.FamilleOs,
+        "la famille d'OS '%s' est inconnue",
+        alias={
+            "linux (mode bureau)": MaterielOrdinateur.FamilleOs.LIN_D,
+            "linux (mode serveur)": MaterielOrdinateur.FamilleOs.LIN_S,
+            "android": MaterielOrdinateur.FamilleOs.ANDROID,
+        },
+    )
+
     def get_id_excel(self, ligne: list) -> str:
         """Obtient le champ de l'ID excel (hors BDD, correspondance entre les onglets)"""
         return ligne[self._excel_id].lower()
 
     def get_fonction(self, ligne: list) -> MaterielOrdinateur.Fonction:
         """Obtient le champ fonction dans le fichier csv"""
-        fonction = ligne[self._fonction].lower()
-        if fonction == "poste de maintenance":
-            return MaterielOrdinateur.Fonction.MAINT
-        elif fonction == "poste de supervision":
-            return MaterielOrdinateur.Fonction.SUPER
-        elif fonction == "poste d'administration" or fonction == "poste d’administration":
-            return MaterielOrdinateur.Fonction.ADMIN
-        elif (
-            fonction == "poste de supervision et d'administration"
-            or fonction == "poste de supervision et d’administration"
-        ):
-            return MaterielOrdinateur.Fonction.SU_AD
-        elif fonction == "serveur de temps":
-            return MaterielOrdinateur.Fonction.TEMPS
-        elif fonction == "serveur de fichier":
-            return MaterielOrdinateur.Fonction.FICHI
-        elif fonction == "serveur de base de données":
-            return MaterielOrdinateur.Fonction.BASED
-        elif fonction == "serveur d'annuaire" or fonction == "serveur d’annuaire":
-            return MaterielOrdinateur.Fonction.ANNUA
-        else:
-            raise ImporteExcelError("Colonne %s : la fonction '%s' est inconnue" % (self._fonction + 1, fonction))
+        return self._table_fonction.decode(ligne)
 
     def get_marque(self, ligne: list) -> str:
         """Obtient le champ marque dans le fichier csv"""
@@ -287,53 +327,7 @@ class StructureMaterielOrdinateur:
 
     def get_os_famille(self, ligne: list) -> MaterielOrdinateur.FamilleOs:
         """Obtient le champ os_famille dans le fichier csv"""
-        os_famille = ligne[self._os_famille].lower()
-        if os_famille == "autre":
-            return MaterielOrdinateur.FamilleOs.AUTRE
-        elif os_famille == "windows xp":
-            return MaterielOrdinateur.FamilleOs.WIN_P_XP
-        elif os_famille == "windows vista":
-            return MaterielOrdinateur.FamilleOs.WIN_P_VISTA
-        elif os_famille == "windows 7":
-            return MaterielOrdinateur.FamilleOs.WIN_P_7
-        elif os_famille == "windows 8":
-            return MaterielOrdinateur.FamilleOs.WIN_P_8
-        elif os_famille == "windows 10":
-            return MaterielOrdinateur.FamilleOs.WIN_P_10
-        elif os_famille == "windows 11":
-            return MaterielOrdinateur.FamilleOs.WIN_P_11
-        elif os_famille == "windows serveur nt":
-            return MaterielOrdinateur.FamilleOs.WIN_S_NT
-        elif os_famille == "windows serveur 2000":
-            return MaterielOrdinateur.FamilleOs.WIN_S_00
-        elif os_famille == "windows serveur 2003":
-            return MaterielOrdinateur.FamilleOs.WIN_S_03
-        elif os_famille == "windows serveur 2008":
-            return MaterielOrdinateur.FamilleOs.WIN_S_081
-        elif os_famille == "windows serveur 2008 r2":
-            return MaterielOrdinateur.FamilleOs.WIN_S_082
-        elif os_famille == "windows serveur 2012":
-            return MaterielOrdinateur.FamilleOs.WIN_S_121
-        elif os_famille == "windows serveur 2012 r2":
-            return MaterielOrdinateur.FamilleOs.WIN_S_122
-        elif os_famille == "windows serveur 2016":
-            return MaterielOrdinateur.FamilleOs.WIN_S_16
-        elif os_famille == "windows serveur 2019":
-            return MaterielOrdinateur.FamilleOs.WIN_S_19
-        elif os_famille == "windows serveur 2022":
-            return MaterielOrdinateur.FamilleOs.WIN_S_22
-        elif os_famille == "linux (mode bureau)":
-            return MaterielOrdinateur.FamilleOs.LIN_D
-        elif os_famille == "linux (mode serveur)":
-            return MaterielOrdinateur.FamilleOs.LIN_S
-        elif os_famille == "android":
-            return MaterielOrdinateur.FamilleOs.ANDROID
-        elif os_famille == "propriétaire industriel":
-            return MaterielOrdinateur.FamilleOs.INDUS
-        else:
-            raise ImporteExcelError(
-                "Colonne %s : la famille d'OS '%s' est inconnue" % (self._os_famille + 1, os_famille)
-            )
+        return self._table_os_famille.decode(ligne)
 
     def get_os_version(self, ligne: list) -> str:
         """Obtient le champ os_version dans le fichier csv"""
@@ -365,49 +359,20 @@ class StructureMaterielEffecteur:
     _cortec = 11
     _description = 14
 
+    _table_type = TableChoix(
+        _type,
+        MaterielEffecteur.Type,
+        "le type '%s' est inconnu",
+        alias={"caméra": MaterielEffecteur.Type.CAMERA, "switch": MaterielEffecteur.Type.SWITCH},
+    )
+
     def get_id_excel(self, ligne: list) -> str:
         """Obtient le champ de l'ID excel (hors BDD, correspondance entre les onglets)"""
         return ligne[self._excel_id].lower()
 
     def get_type(self, ligne: list) -> MaterielEffecteur.Type:
         """Obtient le champ type dans le fichier csv"""
-        type_m = ligne[self._type].lower()
-        if type_m == "autre matériel":
-            return MaterielEffecteur.Type.AUTRE
-        elif type_m == "capteur intelligent":
-            return MaterielEffecteur.Type.CAPTEUR
-        elif type_m == "actionneur intelligent":
-            return MaterielEffecteur.Type.ACTIONNEUR
-        elif type_m == "routeur":
-            return MaterielEffecteur.Type.ROUTEUR
-        elif type_m == "switch":
-            return MaterielEffecteur.Type.SWITCH
-        elif type_m == "automate":
-            return MaterielEffecteur.Type.AUTOMATE
-        elif type_m == "antenne":
-            return MaterielEffecteur.Type.ANTENNE
-        elif type_m == "caméra":
-            return MaterielEffecteur.Type.CAMERA
-        elif type_m == "centrale de mesure":
-            return MaterielEffecteur.Type.MESURE
-        elif type_m == "imprimante":
-            return MaterielEffecteur.Type.IMPRIMANTE
-        elif type_m == "onduleur":
-            return MaterielEffecteur.Type.ONDULEUR
-        elif type_m == "sonde":
-            return MaterielEffecteur.Type.SONDE
-        elif type_m == "télécommande":
-            return MaterielEffecteur.Type.TELECOMMANDE
-        elif type_m == "variateur":
-            return MaterielEffecteur.Type.VARIATEUR
-        elif type_m == "enregistreur":
-            return MaterielEffecteur.Type.ENREGISTREUR
-        elif type_m == "horloge":
-            return MaterielEffecteur.Type.HORLOGE
-        elif type_m == "hub":
-            return MaterielEffecteur.Type.HUB
-        else:
-            raise ImporteExcelError("Colonne %s : le type '%s' est inconnu" % (self._type + 1, type_m))
+        return self._table_type.decode(ligne)
 
     def get_marque(self, ligne: list) -> str:
         """Obtient le champ marque dans le fichier csv"""
@@ -439,8 +404,162 @@ class StructureMaterielEffecteur:
         return ligne[self._description]
 
 
+def empreinte(valeurs: dict | Model, champs: tuple[str, ...]) -> tuple:
+    """Empreinte d'une ligne du fichier ou d'un objet de la base de donnée, les deux sont comparables"""
+    if isinstance(valeurs, dict):
+        return tuple(valeurs[k] for k in champs)
+    return tuple(getattr(valeurs, k) for k in champs)
+
+
+@dataclass
+class LigneSysteme:
+    """Ligne validée de l'onglet S2I, prête à être enregistrée"""
+
+    numero: int
+    id_excel: str
+    localisation: dict
+    systeme: dict
+    fonctions: list[int]
+
+    @property
+    def clef_localisation(self) -> tuple:
+        """Les champs identifiant la localisation (son 'unique_together')"""
+        return tuple(self.localisation[k] for k in CHAMPS_CLEF_LOCALISATION)
+
+
+@dataclass
+class LigneMateriel:
+    """Ligne validée d'un onglet de matériels, prête à être enregistrée"""
+
+    numero: int
+    id_excel: str
+    champs: dict
+
+
+@dataclass
+class PlanSystemes:
+    """Écritures nécessaires à l'enregistrement de l'onglet S2I"""
+
+    zones: set[str]
+    # le système de chaque ligne, dans l'ordre des lignes
+    systemes: list[SystemeIndustriel] = field(default_factory=list)
+    nouvelles_localisations: list[Localisation] = field(default_factory=list)
+    localisations_a_modifier: list[Localisation] = field(default_factory=list)
+    localisations_a_supprimer: list[Localisation] = field(default_factory=list)
+    a_creer: list[SystemeIndustriel] = field(default_factory=list)
+    a_modifier: list[SystemeIndustriel] = field(default_factory=list)
+    a_supprimer: list[SystemeIndustriel] = field(default_factory=list)
+    inchanges: int = 0
+    # les fonctions métiers à lier, par système, et les clefs primaires des liens à retirer
+    fonctions_a_lier: list[tuple[SystemeIndustriel, int]] = field(default_factory=list)
+    fonctions_a_retirer: list[int] = field(default_factory=list)
+
+    @property
+    def vide(self) -> bool:
+        """Aucune écriture n'est nécessaire"""
+        return not (
+            self.nouvelles_localisations
+            or self.localisations_a_modifier
+            or self.localisations_a_supprimer
+            or self.a_creer
+            or self.a_modifier
+            or self.a_supprimer
+            or self.fonctions_a_lier
+            or self.fonctions_a_retirer
+        )
+
+
+class Avancement:
+    """Avancement d'un import, publié au plus une fois toutes les 'intervalle' secondes
+
+    Les compteurs de chaque onglet ne sont modifiés que par le fil d'exécution qui l'analyse ; seule la publication,
+    qui peut être demandée par plusieurs fils à la fois, est protégée par un verrou.
+    """
+
+    ANALYSE = "analyse"
+    ENREGISTREMENT = "enregistrement"
+
+    def __init__(self, publie: Callable[[dict], None] | None = None, intervalle: float = 1.0):
+        self.publie = publie
+        self.intervalle = intervalle
+        self.etape = self.ANALYSE
+        self.onglet = None
+        self.onglets = {}
+        self._debut = monotonic()
+        self._derniere_publication = float("-inf")
+        self._verrou = Lock()
+
+    def ajoute_onglet(self, libelle: str, total: int | None) -> None:
+        """Déclare un onglet et son nombre de lignes à analyser (None s'il est inconnu), avant toute analyse"""
+        self.onglets[libelle] = {"lignes": 0, "total": total, "erreurs": 0}
+
+    def ligne(self, libelle: str, erreur: bool = False) -> None:
+        """Compte une ligne analysée d'un onglet"""
+        compteurs = self.onglets[libelle]
+        compteurs["lignes"] += 1
+        if erreur:
+            compteurs["erreurs"] += 1
+        self.onglet = libelle
+        if self.publie is not None and monotonic() - self._derniere_publication >= self.intervalle:
+            self._publie()
+
+    def enregistre(self, libelle: str) -> None:
+        """Signale le début de l'enregistrement d'un onglet"""
+        self.etape = self.ENREGISTREMENT
+        self.onglet = libelle
+        if self.publie is not None:
+            self._publie()
+
+    def meta(self) -> dict:
+        """L'avancement tel que publié : l'étape, l'onglet en cours, les totaux et le détail par onglet"""
+        onglets = {k: dict(v) for k, v in self.onglets.items()}
+        lignes = sum(k["lignes"] for k in onglets.values())
+        totaux = [k["total"] for k in onglets.values()]
+        duree = monotonic() - self._debut
+        return {
+            "etape": self.etape,
+            "onglet": self.onglet,
+            "lignes": lignes,
+            "total": None if None in totaux else sum(totaux),
+            "erreurs": sum(k["erreurs"] for k in onglets.values()),
+            "debit": round(lignes / duree, 1) if duree > 0 else 0.0,
+            "onglets": onglets,
+        }
+
+    def _publie(self) -> None:
+        # un seul fil publie à la fois, les autres ne l'attendent pas
+        if not self._verrou.acquire(blocking=False):
+            return
+        try:
+            maintenant = monotonic()
+            if maintenant - self._derniere_publication >= self.intervalle:
+                self._derniere_publication = maintenant
+                self.publie(self.meta())
+        finally:
+            self._verrou.release()
+
+
 class ImporteExcel:
-    """Commande d'import des données du S2I"""
+    """Commande d'import des données du S2I
+
+    Chaque onglet est d'abord lu et validé en entier sans accès à la base de donnée, les domaines et fonctions
+    métiers étant préchargés. Les lignes valides sont ensuite enregistrées par lots : le nombre de requêtes ne dépend
+    pas du nombre de lignes du fichier.
+
+    Tout l'import, nettoyage compris, se fait dans une seule transaction, et chaque onglet est enregistré dans un
+    point de sauvegarde. Selon la politique choisie, une erreur annule tout l'import ('ANNULE') ou seulement les
+    lignes en erreur ('GARDE_VALIDES') ; un arrêt inattendu ne laisse jamais la zone à moitié importée.
+
+    En simulation ('dry_run'), le fichier est validé et les créations et mises à jour sont calculées à partir des
+    données existantes de la zone, mais rien n'est écrit dans la base de donnée.
+
+    En import différentiel, chaque ligne est comparée par son empreinte à l'état de la zone dans la base de donnée :
+    seuls les créations, mises à jour et suppressions nécessaires sont écrites, et les matériels déjà enregistrés ne
+    sont pas dupliqués. Ce qui n'est plus dans le fichier est supprimé de la zone, sauf si l'onglet a des erreurs.
+
+    L'avancement de l'analyse et de l'enregistrement est transmis à 'progression', s'il est donné, au plus une fois
+    toutes les 'IMPORT_AVANCEMENT_INTERVALLE' secondes.
+    """
 
     # constantes de structures du fichier excel
     struct_localisation = StructureLocalisation()
@@ -452,22 +571,40 @@ class ImporteExcel:
     # struct_licence = StructureLicence()
 
     # paramétrage de la lecture du fichier
+    onglet_S2I = "S2I"
+    onglet_ordi = "PC - SERVEUR"
+    onglet_mate = "EQUIPEMENTS DIVERS"
+    # onglet_licence = "LICENCES"
     onglet_S2I_ignore_lignes_debut = 3  # Compter lignes à partir de 1 (et non de 0)
     onglet_ordi_ignore_lignes_debut = 3
     onglet_mate_ignore_lignes_debut = 3
-
-    # constates
-    nom_excel = "base.xlsx"
-    nom_csv_systeme = "S2I.csv"
-    nom_csv_ordinateur = "ordinateur.csv"
-    nom_csv_materiel = "materiel.csv"
-    nom_csv_license = "license.csv"
-
-    def __init__(self, zone: ZoneUsid, encoded_fichier: bytes, verbosity=0, nettoie=False):
+    # nombre de colonnes lues par onglet, les cellules vides en fin de ligne ne sont pas enregistrées dans le fichier
+    onglet_S2I_largeur = StructureSystemeIndustriel._description + 1
+    onglet_ordi_largeur = StructureMaterielOrdinateur._description + 1
+    onglet_mate_largeur = StructureMaterielEffecteur._description + 1
+
+    # nombre d'objets par requête lors des enregistrements en masse
+    taille_lot = 500
+
+    def __init__(
+        self,
+        zone: ZoneUsid,
+        fichier: str,
+        verbosity=0,
+        nettoie=False,
+        politique=PolitiqueImport.GARDE_VALIDES,
+        dry_run=False,
+        differentiel=False,
+        progression: Callable[[dict], None] | None = None,
+    ):
         """Initialisation de la commande"""
         self.zone_usid = zone
-        self.encoded_fichier = encoded_fichier
+        self.fichier = fichier
         self.pre_nettoie = nettoie
+        self.politique = politique
+        self.dry_run = dry_run
+        self.differentiel = differentiel
+        self.avancement = Avancement(progression, settings.IMPORT_AVANCEMENT_INTERVALLE)
 
         # gestion du logging
         if verbosity == 0:
@@ -480,269 +617,686 @@ class ImporteExcel:
             logger.setLevel(logging.DEBUG)
 
         # variables utilisés par l'objet
+        self.domaines = {}
+        self.fonctions = {}
+        self.ids_systemes = {}
+        self.clefs_systemes = {}
         self.memoire_systemes = {}
+        self.zones_importees = set()
         self.traceback = []
 
-    def _decode_excel(self, chemin_sortie: Path) -> None:
-        """décodage du fichier excel"""
-        with open(chemin_sortie, "wb+") as f:
-            f.write(b64decode(self.encoded_fichier))
-
     def _nettoyage(self) -> None:
         """Effectue les actions de nettoyage préliminaires sur la base de donnée"""
-        # suppression
-        MaterielOrdinateur.objects.filter(systeme__localisation__zone_usid=self.zone_usid).delete()
-        MaterielEffecteur.objects.filter(systeme__localisation__zone_usid=self.zone_usid).delete()
-        # LicenceLogiciel.objects.filter(systeme__localisation__zone_usid=self.zone_usid).delete()
-        SystemeIndustriel.objects.filter(localisation__zone_usid=self.zone_usid).delete()
-        Localisation.objects.filter(zone_usid=self.zone_usid).delete()
+        # les sites voisins sont lus avant que les interconnexions ne soient supprimées en cascade
+        sites = sites_zones([self.zone_usid])
+        # suppression, sans invalidation instance par instance
+        with invalidations_differees():
+            MaterielOrdinateur.objects.filter(systeme__localisation__zone_usid=self.zone_usid).delete()
+            MaterielEffecteur.objects.filter(systeme__localisation__zone_usid=self.zone_usid).delete()
+            # LicenceLogiciel.objects.filter(systeme__localisation__zone_usid=self.zone_usid).delete()
+            SystemeIndustriel.objects.filter(localisation__zone_usid=self.zone_usid).delete()
+            Localisation.objects.filter(zone_usid=self.zone_usid).delete()
+        transaction.on_commit(partial(perime_statistiques, [self.zone_usid]))
+        transaction.on_commit(partial(invalide_cartographies, sites))
         self.traceback.append((CeleryResultMessageType.SUCCESS, f"zone {self.zone_usid} nettoyée de la base de donnée"))
 
-    def _traite_ligne_csv_s2i(self, numero: int, ligne: list) -> None:
-        """Traite chaque ligne pour l'onglet S2I"""
+    def _charge_referentiels(self) -> None:
+        """Précharge les domaines métiers par code, et les fonctions métiers par code du domaine et de la fonction"""
+        self.domaines = {k.code: k for k in DomaineMetier.objects.all()}
+        self.fonctions = {(k.domaine.code, k.code): k.pk for k in FonctionsMetier.objects.select_related("domaine")}
+
+    @staticmethod
+    def _lit_onglet(
+        classeur: ClasseurExcel, onglet: str, ignore_lignes_debut: int, largeur: int
+    ) -> Iterator[tuple[int, list]]:
+        """Parcourt les lignes d'un onglet avec leur numéro excel (à partir de 1), après l'entête"""
+        for numero, ligne in enumerate(classeur.lignes(onglet), start=1):
+            if numero > ignore_lignes_debut:
+                yield numero, ligne + [""] * (largeur - len(ligne))
+
+    def _analyse_onglet(
+        self,
+        lignes: Iterable[tuple[int, list]],
+        analyse: Callable[[int, list], LigneSysteme | LigneMateriel | None],
+        libelle: str,
+        arret: Event | None = None,
+    ) -> tuple[list, list[tuple[int, str]]]:
+        """Analyse toutes les lignes d'un onglet, renvoie les lignes valides et les erreurs avec leur numéro de ligne
+
+        Les erreurs ne sont pas ajoutées au compte-rendu ici : les onglets des matériels sont analysés dans des fils
+        d'exécution parallèles, leurs erreurs sont rapportées dans l'ordre une fois l'analyse terminée.
+        L'analyse s'interrompt dès que 'arret' est levé, son résultat ne servant plus ; avec la politique 'ANNULE',
+        la première erreur le lève pour tous les onglets, l'import étant de toute façon annulé.
+        """
+        valides = []
+        erreurs = []
+        for numero, ligne in lignes:
+            if arret is not None and arret.is_set():
+                logger.debug("%s - analyse interrompue à la ligne n° %s" % (libelle, numero))
+                break
+            try:
+                resultat = analyse(numero, ligne)
+            except ImporteExcelError as e:
+                logger.debug(str(e))
+                logger.warning("%s - Erreur pour la ligne n° %s" % (libelle, numero))
+                erreurs.append((numero, f"{libelle} - erreur pour la ligne n°{numero} : {e}"))
+                self.avancement.ligne(libelle, erreur=True)
+                if arret is not None and self.politique == PolitiqueImport.ANNULE:
+                    arret.set()
+            else:
+                if resultat is not None:
+                    valides.append(resultat)
+                self.avancement.ligne(libelle)
+        return valides, erreurs
+
+    def _lie_materiels(
+        self, lignes: list[LigneMateriel], erreurs: list[tuple[int, str]], libelle: str
+    ) -> tuple[list[LigneMateriel], list[tuple[int, str]]]:
+        """Écarte les matériels dont le système lié n'est pas dans l'onglet S2I, une fois celui-ci analysé"""
+        valides = []
+        erreurs = list(erreurs)
+        for ligne in lignes:
+            if ligne.id_excel in self.ids_systemes:
+                valides.append(ligne)
+            else:
+                logger.warning("%s - Erreur pour la ligne n° %s" % (libelle, ligne.numero))
+                erreurs.append(
+                    (
+                        ligne.numero,
+                        f"{libelle} - erreur pour la ligne n°{ligne.numero} : "
+                        "impossible de créer le matériel car le système lié est introuvable",
+                    )
+                )
+        erreurs.sort()
+        return valides, erreurs
+
+    def _rapporte_erreurs(self, erreurs: list[tuple[int, str]]) -> None:
+        """Ajoute les erreurs d'analyse d'un onglet au compte-rendu"""
+        self.traceback.extend((CeleryResultMessageType.ERROR, message) for _, message in erreurs)
+
+    def _analyse_ligne_s2i(self, numero: int, ligne: list) -> LigneSysteme | None:
+        """Valide une ligne de l'onglet S2I"""
         # si la ligne est vide
-        if not self.struct_systeme.get_id_excel(ligne):
+        id_excel = self.struct_systeme.get_id_excel(ligne)
+        if not id_excel:
             return None
 
         logger.info("S2I - ligne n°%s" % numero)
-        # la localisation du S2I
-        try:
-            temp_localisation = Localisation.objects.filter(
-                zone_usid=self.struct_localisation.get_zone_usid(ligne),
-                nom_ville=self.struct_localisation.get_nom_ville(ligne),
-                nom_quartier=self.struct_localisation.get_nom_quartier(ligne),
-                zone_quartier=self.struct_localisation.get_zone_quartier(ligne),
-            ).get()
-        except Localisation.DoesNotExist:
-            temp_localisation = Localisation(
-                zone_usid=self.struct_localisation.get_zone_usid(ligne),
-                nom_ville=self.struct_localisation.get_nom_ville(ligne),
-                nom_quartier=self.struct_localisation.get_nom_quartier(ligne),
-                zone_quartier=self.struct_localisation.get_zone_quartier(ligne),
-                protection=self.struct_localisation.get_protection(ligne),
-                sensibilite=self.struct_localisation.get_sensibilite(ligne),
-            )
-            temp_localisation.save()
-            logger.info("création de la localisation '%s'" % temp_localisation)
-            self.traceback.append((CeleryResultMessageType.INFO, f"localisation {temp_localisation} créée"))
+        domaine = self.struct_domaine.get_domaine_metier(ligne, self.domaines)
+        fonctions = []
+        for code in self.struct_fonction.get_fonctions_metiers(ligne, domaine=domaine.code):
+            # la fonction doit être celle du domaine du système (la GTC existe dans plusieurs domaines)
+            try:
+                fonctions.append(self.fonctions[(domaine.code, code)])
+            except KeyError:
+                raise ImporteExcelError(
+                    "la fonction '%s' du domaine métier '%s' n'existe pas dans la base de donnée" % (code, domaine.code)
+                )
 
-        # les informations principales du S2I
-        try:
-            temp_systeme = SystemeIndustriel.objects.filter(
-                localisation=temp_localisation,
-                nom=self.struct_systeme.get_nom(ligne),
-                environnement=self.struct_systeme.get_environnement(ligne),
-                domaine_metier=self.struct_domaine.get_domaine_metier(ligne),
-            ).get()
-            temp_systeme.numero_gtp = self.struct_systeme.get_numero_gtp(ligne)
-            temp_systeme.homologation_fin = self.struct_systeme.get_homologation_fin(ligne)
-            temp_systeme.homologation_classe = self.struct_systeme.get_homologation_classe(ligne)
-            temp_systeme.description = self.struct_systeme.get_description(ligne)
-        except SystemeIndustriel.DoesNotExist:
-            temp_systeme = SystemeIndustriel(
-                localisation=temp_localisation,
-                nom=self.struct_systeme.get_nom(ligne),
-                environnement=self.struct_systeme.get_environnement(ligne),
-                domaine_metier=self.struct_domaine.get_domaine_metier(ligne),
-                numero_gtp=self.struct_systeme.get_numero_gtp(ligne),
-                homologation_fin=self.struct_systeme.get_homologation_fin(ligne),
-                homologation_classe=self.struct_systeme.get_homologation_classe(ligne),
-                description=self.struct_systeme.get_description(ligne),
-            )
-        try:
-            temp_systeme.save()
-            logger.info("création du système industriel '%s'" % temp_systeme)
-            self.traceback.append((CeleryResultMessageType.INFO, f"système industriel {temp_systeme} créé"))
-        except IntegrityError:
-            raise ImporteExcelError("Impossible de sauvegarder le système '%s'" % temp_systeme)
-        # ajout des fonctions métiers
-        temp_systeme.fonctions_metiers.add(
-            *FonctionsMetier.objects.filter(
-                code__in=self.struct_fonction.get_fonctions_metiers(ligne, domaine=temp_systeme.domaine_metier.code)
-            )
+        resultat = LigneSysteme(
+            numero=numero,
+            id_excel=id_excel,
+            localisation={
+                "zone_usid": self.struct_localisation.get_zone_usid(ligne),
+                "nom_ville": self.struct_localisation.get_nom_ville(ligne),
+                "nom_quartier": self.struct_localisation.get_nom_quartier(ligne),
+                "zone_quartier": self.struct_localisation.get_zone_quartier(ligne),
+                "protection": self.struct_localisation.get_protection(ligne),
+                "sensibilite": self.struct_localisation.get_sensibilite(ligne),
+            },
+            systeme={
+                "nom": self.struct_systeme.get_nom(ligne),
+                "environnement": self.struct_systeme.get_environnement(ligne),
+                "domaine_metier": domaine,
+                "numero_gtp": self.struct_systeme.get_numero_gtp(ligne),
+                "homologation_fin": self.struct_systeme.get_homologation_fin(ligne),
+                "homologation_classe": self.struct_systeme.get_homologation_classe(ligne),
+                "description": self.struct_systeme.get_description(ligne),
+            },
+            fonctions=fonctions,
         )
 
-        # Cette ligne sert à la correspondance entre la clef primaire de la BDD et les ID du fichier excel,
-        # pour pouvoir lier les futurs ordinateurs, matériels et licences du fichier excel, aux systèmes qu'on vient
-        # de créer dans la base de donnée.
-        self.memoire_systemes[self.struct_systeme.get_id_excel(ligne)] = temp_systeme.pk
-
-    def _traite_ligne_csv_ordinateur(self, numero: int, ligne: list) -> None:
-        """Traite chaque ligne pour l'onglet PC - SERVEUR"""
+        # unicité de l'ID excel et du système ('unique_together') dans l'onglet
+        clef = (resultat.clef_localisation, resultat.systeme["nom"], resultat.systeme["environnement"], domaine.pk)
+        if id_excel in self.ids_systemes:
+            raise ImporteExcelError(
+                "l'ID excel '%s' est déjà utilisé à la ligne n°%s" % (id_excel, self.ids_systemes[id_excel])
+            )
+        if clef in self.clefs_systemes:
+            raise ImporteExcelError("le système industriel est déjà décrit à la ligne n°%s" % self.clefs_systemes[clef])
+        self.ids_systemes[id_excel] = numero
+        self.clefs_systemes[clef] = numero
+        return resultat
+
+    def _analyse_ligne_ordinateur(self, numero: int, ligne: list) -> LigneMateriel | None:
+        """Valide une ligne de l'onglet PC - SERVEUR"""
         # si la ligne est vide
-        if not self.struct_ordinateur.get_id_excel(ligne):
+        id_excel = self.struct_ordinateur.get_id_excel(ligne)
+        if not id_excel:
             return None
 
+        # l'existence du système lié est vérifiée une fois l'onglet S2I analysé
         logger.info("Ordinateurs - ligne n°%s" % numero)
-        # les informations du matériel ordinateur / serveur
-        temp_systeme_lie_pk = self.memoire_systemes.get(self.struct_ordinateur.get_id_excel(ligne), None)
-        if temp_systeme_lie_pk is None:
-            raise ImporteExcelError("impossible de créer le matériel car le système lié est introuvable")
-        else:
-            temp_materiel_ordinateur_serveur = MaterielOrdinateur(
-                systeme=SystemeIndustriel.objects.get(pk=temp_systeme_lie_pk),
-                fonction=self.struct_ordinateur.get_fonction(ligne),
-                marque=self.struct_ordinateur.get_marque(ligne),
-                modele=self.struct_ordinateur.get_modele(ligne),
-                os_famille=self.struct_ordinateur.get_os_famille(ligne),
-                os_version=self.struct_ordinateur.get_os_version(ligne),
-                nombre=self.struct_ordinateur.get_nombre(ligne),
-                description=self.struct_ordinateur.get_description(ligne),
-            )
-            try:
-                temp_materiel_ordinateur_serveur.save()
-            except Exception as e:
-                raise ImporteExcelError("Erreur inconnue : %s" % e)
+        return LigneMateriel(
+            numero=numero,
+            id_excel=id_excel,
+            champs={
+                "fonction": self.struct_ordinateur.get_fonction(ligne),
+                "marque": self.struct_ordinateur.get_marque(ligne),
+                "modele": self.struct_ordinateur.get_modele(ligne),
+                "os_famille": self.struct_ordinateur.get_os_famille(ligne),
+                "os_version": self.struct_ordinateur.get_os_version(ligne),
+                "nombre": self.struct_ordinateur.get_nombre(ligne),
+                "description": self.struct_ordinateur.get_description(ligne),
+            },
+        )
 
-    def _traite_ligne_csv_materiel(self, numero: int, ligne: list) -> None:
-        """Traite chaque ligne pour l'onglet EQUIPEMENTS DIVERS"""
+    def _analyse_ligne_materiel(self, numero: int, ligne: list) -> LigneMateriel | None:
+        """Valide une ligne de l'onglet EQUIPEMENTS DIVERS"""
         # si la ligne est vide
-        if not self.struct_materiel.get_id_excel(ligne):
+        id_excel = self.struct_materiel.get_id_excel(ligne)
+        if not id_excel:
             return None
 
+        # l'existence du système lié est vérifiée une fois l'onglet S2I analysé
         logger.info("Matériels intelligents - ligne n°%s" % numero)
-        # les informations du matériel ordinateur / serveur
-        temp_systeme_lie_pk = self.memoire_systemes.get(self.struct_materiel.get_id_excel(ligne), None)
-        if temp_systeme_lie_pk is None:
-            raise ImporteExcelError("impossible de créer le matériel car le système lié est introuvable")
-        else:
-            temp_materiel_effecteur = MaterielEffecteur(
-                systeme=SystemeIndustriel.objects.get(pk=temp_systeme_lie_pk),
-                type=self.struct_materiel.get_type(ligne),
-                marque=self.struct_materiel.get_marque(ligne),
-                modele=self.struct_materiel.get_modele(ligne),
-                nombre=self.struct_materiel.get_nombre(ligne),
-                firmware=self.struct_materiel.get_firmware(ligne),
-                cortec=self.struct_materiel.get_cortec(ligne),
-                description=self.struct_materiel.get_description(ligne),
+        return LigneMateriel(
+            numero=numero,
+            id_excel=id_excel,
+            champs={
+                "type": self.struct_materiel.get_type(ligne),
+                "marque": self.struct_materiel.get_marque(ligne),
+                "modele": self.struct_materiel.get_modele(ligne),
+                "nombre": self.struct_materiel.get_nombre(ligne),
+                "firmware": self.struct_materiel.get_firmware(ligne),
+                "cortec": self.struct_materiel.get_cortec(ligne),
+                "description": self.struct_materiel.get_description(ligne),
+            },
+        )
+
+    def _prepare_systemes(self, lignes: list[LigneSysteme], supprime: bool = True) -> PlanSystemes:
+        """Calcule les écritures nécessaires à l'enregistrement de l'onglet S2I, sans modifier la base de donnée
+
+        Les localisations et systèmes existants des zones concernées sont lus une seule fois et indexés en mémoire par
+        leur 'unique_together'. Les systèmes sont indexés par la clef de leur localisation et non par sa clef
+        primaire : les localisations à créer n'en ont pas encore. En import différentiel, seuls les objets dont
+        l'empreinte change sont mis à jour et, si 'supprime', ceux de la zone absents du fichier sont supprimés.
+        """
+        zones = {k.localisation["zone_usid"] for k in lignes}
+        if self.differentiel:
+            # la zone importée est comparée au fichier même si aucune ligne ne la concerne
+            zones.add(self.zone_usid)
+        localisations_existantes = Localisation.objects.filter(zone_usid__in=zones)
+        systemes_existants = SystemeIndustriel.objects.filter(localisation__zone_usid__in=zones)
+        if self.dry_run and self.pre_nettoie:
+            # la zone n'est pas nettoyée lors d'une simulation, ses données sont ignorées comme si elle l'était
+            localisations_existantes = localisations_existantes.exclude(zone_usid=self.zone_usid)
+            systemes_existants = systemes_existants.exclude(localisation__zone_usid=self.zone_usid)
+        plan = PlanSystemes(zones=zones)
+
+        # les localisations, créées ou mises à jour si besoin
+        existantes = {
+            tuple(getattr(k, champ) for champ in CHAMPS_CLEF_LOCALISATION): k for k in localisations_existantes
+        }
+        localisations = dict(existantes)
+        for ligne in lignes:
+            clef = ligne.clef_localisation
+            localisation = localisations.get(clef)
+            if localisation is None:
+                localisation = localisations[clef] = Localisation(**ligne.localisation)
+                plan.nouvelles_localisations.append(localisation)
+            elif (
+                self.differentiel
+                and clef in existantes
+                and localisation not in plan.localisations_a_modifier
+                and empreinte(ligne.localisation, CHAMPS_MAJ_LOCALISATION)
+                != empreinte(localisation, CHAMPS_MAJ_LOCALISATION)
+            ):
+                for champ in CHAMPS_MAJ_LOCALISATION:
+                    setattr(localisation, champ, ligne.localisation[champ])
+                plan.localisations_a_modifier.append(localisation)
+
+        # les systèmes industriels, créés ou mis à jour, et leurs fonctions métiers
+        clefs_localisations = {k.pk: clef for clef, k in existantes.items()}
+        existants = {
+            (clefs_localisations[k.localisation_id], k.nom, k.environnement, k.domaine_metier_id): k
+            for k in systemes_existants
+        }
+        liens_existants = defaultdict(dict)
+        if self.differentiel:
+            for pk, systeme_id, fonction_id in SystemeIndustriel.fonctions_metiers.through.objects.filter(
+                systemeindustriel__in=systemes_existants
+            ).values_list("pk", "systemeindustriel_id", "fonctionsmetier_id"):
+                liens_existants[systeme_id][fonction_id] = pk
+
+        for ligne in lignes:
+            clef = (
+                ligne.clef_localisation,
+                ligne.systeme["nom"],
+                ligne.systeme["environnement"],
+                ligne.systeme["domaine_metier"].pk,
+            )
+            systeme = existants.get(clef)
+            fonctions = set(ligne.fonctions)
+            if systeme is None:
+                systeme = SystemeIndustriel(localisation=localisations[ligne.clef_localisation], **ligne.systeme)
+                plan.a_creer.append(systeme)
+            elif not self.differentiel:
+                # les fonctions déjà liées sont ignorées lors de l'enregistrement
+                for champ in CHAMPS_MAJ_SYSTEME:
+                    setattr(systeme, champ, ligne.systeme[champ])
+                plan.a_modifier.append(systeme)
+            else:
+                liens = liens_existants[systeme.pk]
+                retirees = [pk for fonction, pk in liens.items() if fonction not in fonctions]
+                fonctions -= liens.keys()
+                modifie = empreinte(ligne.systeme, CHAMPS_MAJ_SYSTEME) != empreinte(systeme, CHAMPS_MAJ_SYSTEME)
+                if modifie:
+                    for champ in CHAMPS_MAJ_SYSTEME:
+                        setattr(systeme, champ, ligne.systeme[champ])
+                if modifie or fonctions or retirees:
+                    plan.a_modifier.append(systeme)
+                else:
+                    plan.inchanges += 1
+                plan.fonctions_a_retirer.extend(retirees)
+            plan.fonctions_a_lier.extend((systeme, k) for k in fonctions)
+            plan.systemes.append(systeme)
+
+        # ce qui n'est plus dans le fichier est supprimé de la zone importée
+        if self.differentiel and supprime:
+            gardes = {k.pk for k in plan.systemes}
+            plan.a_supprimer = [
+                k for clef, k in existants.items() if clef[0][0] == self.zone_usid and k.pk not in gardes
+            ]
+            clefs_fichier = {ligne.clef_localisation for ligne in lignes}
+            plan.localisations_a_supprimer = [
+                k for clef, k in existantes.items() if clef[0] == self.zone_usid and clef not in clefs_fichier
+            ]
+        return plan
+
+    def _supprime(self, modele: type[Model], pks: list[int]) -> None:
+        """Supprime des objets par lots, leurs signaux et suppressions en cascade sont conservés"""
+        for debut in range(0, len(pks), self.taille_lot):
+            modele.objects.filter(pk__in=pks[debut : debut + self.taille_lot]).delete()
+
+    def _sites_systemes(self, pks: list[int]) -> set[Site]:
+        """Les sites des systèmes donnés et de leurs voisins, lus par lots"""
+        sites = set()
+        for debut in range(0, len(pks), self.taille_lot):
+            sites.update(sites_systemes(pks[debut : debut + self.taille_lot]))
+        return sites
+
+    def _enregistre_systemes(self, lignes: list[LigneSysteme], supprime: bool = True) -> None:
+        """Enregistre par lots les localisations, les systèmes industriels et leurs fonctions métiers
+
+        Les signaux n'étant pas émis par les opérations en masse, la criticité des systèmes et les statistiques des
+        zones concernées sont mises à jour explicitement. Lors d'une simulation, seul le compte-rendu est produit.
+        """
+        plan = self._prepare_systemes(lignes, supprime)
+        for localisation in plan.nouvelles_localisations:
+            logger.info("création de la localisation '%s'" % localisation)
+            self.traceback.append((CeleryResultMessageType.INFO, f"localisation {localisation} créée"))
+        for localisation in plan.localisations_a_modifier:
+            logger.info("mise à jour de la localisation '%s'" % localisation)
+            self.traceback.append((CeleryResultMessageType.INFO, f"localisation {localisation} mise à jour"))
+        for systeme in plan.a_creer:
+            logger.info("création du système industriel '%s'" % systeme)
+            self.traceback.append((CeleryResultMessageType.INFO, f"système industriel {systeme} créé"))
+        for systeme in plan.a_modifier:
+            logger.info("mise à jour du système industriel '%s'" % systeme)
+            self.traceback.append((CeleryResultMessageType.INFO, f"système industriel {systeme} mis à jour"))
+        for systeme in plan.a_supprimer:
+            logger.info("suppression du système industriel '%s'" % systeme)
+            self.traceback.append((CeleryResultMessageType.INFO, f"système industriel {systeme} supprimé"))
+        for localisation in plan.localisations_a_supprimer:
+            logger.info("suppression de la localisation '%s'" % localisation)
+            self.traceback.append((CeleryResultMessageType.INFO, f"localisation {localisation} supprimée"))
+        if self.differentiel:
+            if not supprime:
+                self.traceback.append(
+                    (
+                        CeleryResultMessageType.INFO,
+                        "import S2I - l'onglet a des erreurs, les systèmes absents du fichier ne sont pas supprimés",
+                    )
+                )
+            self.traceback.append(
+                (
+                    CeleryResultMessageType.INFO,
+                    f"import S2I - {len(plan.a_creer)} créés, {len(plan.a_modifier)} mis à jour, "
+                    f"{len(plan.a_supprimer)} supprimés, {plan.inchanges} inchangés",
+                )
             )
-            try:
-                temp_materiel_effecteur.save()
-            except Exception as e:
-                raise ImporteExcelError("Erreur inconnue : %s" % e)
 
-    def main(self) -> CeleryResult:
-        """Import d'un fichier excel dans la base de donnée.
-        Renvoi True si l'import s'est correctement déroulé.
+        # Correspondance entre les systèmes et les ID du fichier excel, pour pouvoir lier les ordinateurs, matériels
+        # et licences du fichier excel aux systèmes. Les systèmes à créer ont leur clef primaire une fois enregistrés.
+        for ligne, systeme in zip(lignes, plan.systemes):
+            self.memoire_systemes[ligne.id_excel] = systeme
+        self.zones_importees = plan.zones
+        if self.dry_run or plan.vide:
+            return
+
+        # les systèmes à créer reprennent la clef primaire de leur localisation une fois celle-ci créée
+        Localisation.objects.bulk_create(plan.nouvelles_localisations, batch_size=self.taille_lot)
+        Localisation.objects.bulk_update(
+            plan.localisations_a_modifier, CHAMPS_MAJ_LOCALISATION, batch_size=self.taille_lot
+        )
+        SystemeIndustriel.objects.bulk_create(plan.a_creer, batch_size=self.taille_lot)
+        SystemeIndustriel.objects.bulk_update(plan.a_modifier, CHAMPS_MAJ_SYSTEME, batch_size=self.taille_lot)
+
+        # les fonctions métiers, celles déjà liées sont ignorées
+        lien_fonction = SystemeIndustriel.fonctions_metiers.through
+        self._supprime(lien_fonction, plan.fonctions_a_retirer)
+        lien_fonction.objects.bulk_create(
+            [
+                lien_fonction(systemeindustriel_id=systeme.pk, fonctionsmetier_id=fonction)
+                for systeme, fonction in plan.fonctions_a_lier
+            ],
+            batch_size=self.taille_lot,
+            ignore_conflicts=True,
+        )
+
+        # les suppressions ne passent pas par les invalidations des signaux, faites une fois pour toutes ci-dessous :
+        # les sites voisins des systèmes supprimés sont lus avant que leurs interconnexions ne disparaissent
+        sites = self._sites_systemes([k.pk for k in plan.a_supprimer])
+        sites.update((k.zone_usid, k.nom_ville, k.nom_quartier) for k in plan.localisations_a_supprimer)
+        with invalidations_differees():
+            self._supprime(SystemeIndustriel, [k.pk for k in plan.a_supprimer])
+            self._supprime(Localisation, [k.pk for k in plan.localisations_a_supprimer])
+
+        SystemeIndustriel.objects.filter(localisation__zone_usid__in=plan.zones).recalcule_criticite()
+        transaction.on_commit(partial(perime_statistiques, plan.zones))
+        transaction.on_commit(partial(invalide_cartographies, sites))
+        transaction.on_commit(partial(invalide_cartographies_zones, plan.zones))
+
+    def _enregistre_materiels(
+        self, modele: type[MaterielOrdinateur | MaterielEffecteur], lignes: list[LigneMateriel], supprime: bool = True
+    ) -> None:
+        """Enregistre par lots les matériels, liés aux systèmes grâce à leur ID excel
+
+        En import différentiel, les matériels déjà enregistrés sont retrouvés par leur empreinte : seuls ceux qui
+        manquent sont créés et, si 'supprime', ceux absents du fichier sont supprimés.
         """
+        champs = CHAMPS_MATERIELS[modele]
+        # clefs primaires des matériels existants, par système et par empreinte
+        existants = defaultdict(list)
+        if self.differentiel:
+            systemes = {k.pk for k in self.memoire_systemes.values() if k.pk is not None}
+            for materiel in modele.objects.filter(systeme__localisation__zone_usid__in=self.zones_importees):
+                if materiel.systeme_id in systemes:
+                    existants[(materiel.systeme_id, empreinte(materiel, champs))].append(materiel.pk)
+
+        a_creer = []
+        inchanges = 0
+        for ligne in lignes:
+            systeme = self.memoire_systemes[ligne.id_excel]
+            restants = existants.get((systeme.pk, empreinte(ligne.champs, champs)))
+            if restants:
+                restants.pop()
+                inchanges += 1
+            else:
+                a_creer.append(modele(systeme=systeme, **ligne.champs))
+        a_supprimer = [pk for k in existants.values() for pk in k] if supprime else []
+
+        if self.differentiel:
+            self.traceback.append(
+                (
+                    CeleryResultMessageType.INFO,
+                    f"{modele._meta.verbose_name_plural.lower()} - {len(a_creer)} créés, {len(a_supprimer)} supprimés, "
+                    f"{inchanges} inchangés",
+                )
+            )
+        if self.dry_run:
+            return
+        modele.objects.bulk_create(a_creer, batch_size=self.taille_lot)
+        self._supprime(modele, a_supprimer)
 
-        # création d'un répertoire temporaire
-        with TemporaryDirectory() as temp_dossier:
-            temp_path = Path(temp_dossier)
-            logger.debug("temp_dossier: %s" % temp_path)
+    def _enregistre_onglet(self, enregistre: Callable[[list], None], lignes: list, libelle: str) -> bool:
+        """Enregistre les lignes d'un onglet dans un point de sauvegarde
 
-            # enregistrement du fichier excel fournit
+        Si la base de donnée refuse l'enregistrement, seul cet onglet est défait et la fonction renvoie False (ou
+        l'import est annulé, selon la politique).
+        """
+        self.avancement.enregistre(libelle)
+        try:
+            with transaction.atomic():
+                enregistre(lignes)
+        except DatabaseError as e:
+            logger.error("%s - Erreur de la base de donnée : %s" % (libelle, e))
+            self.traceback.append(
+                (CeleryResultMessageType.ERROR, f"{libelle} - erreur de la base de donnée, onglet non enregistré : {e}")
+            )
+            if self.politique == PolitiqueImport.ANNULE:
+                raise ImporteExcelAnnulation(f"{libelle} - erreur de la base de donnée")
+            return False
+        return True
+
+    def _importe(self, classeur: ClasseurExcel) -> CeleryResultStatus:
+        """Nettoie la zone si demandé, puis valide et enregistre les onglets du fichier excel"""
+        # nettoyage de la base de donnée si demandé
+        if self.pre_nettoie and self.dry_run:
+            self.traceback.append(
+                (CeleryResultMessageType.INFO, f"simulation : la zone {self.zone_usid} serait nettoyée")
+            )
+        elif self.pre_nettoie:
             try:
-                self._decode_excel(temp_path / self.nom_excel)
+                self._nettoyage()
             except Exception as e:
-                logger.critical("Erreur dans le décodage du fichier excel : %s" % e)
-                self.traceback.append((CeleryResultMessageType.ERROR, f"erreur dans la lecture du fichier excel : {e}"))
-                return CeleryResult(status=CeleryResultStatus.FATAL, messages=self.traceback)
+                logger.critical("Erreur dans le nettoyage de la base de donnée:  %s" % e)
+                self.traceback.append(
+                    (CeleryResultMessageType.ERROR, f"erreur dans le nettoyage de la base de donnée : {e}")
+                )
+                raise ImporteExcelAnnulation("erreur dans le nettoyage de la base de donnée")
+
+        self._charge_referentiels()
+        # le nombre de lignes de chaque onglet est lu avant l'analyse, pour suivre son avancement
+        for onglet, libelle, ignore_lignes_debut in (
+            (self.onglet_S2I, "import S2I", self.onglet_S2I_ignore_lignes_debut),
+            (self.onglet_ordi, "import ordinateur/serveur", self.onglet_ordi_ignore_lignes_debut),
+            (self.onglet_mate, "matériels intelligents", self.onglet_mate_ignore_lignes_debut),
+        ):
+            total = classeur.nombre_lignes(onglet)
+            self.avancement.ajoute_onglet(libelle, None if total is None else max(total - ignore_lignes_debut, 0))
+
+        # 'cancel' n'interrompt pas une analyse déjà commencée : les analyses des matériels surveillent 'arret', levé
+        # dès que leur résultat ne servira plus (erreur dans l'onglet des S2I, import annulé ou erreur inattendue)
+        arret = Event()
+        with ThreadPoolExecutor(max_workers=2) as executeur:
+            try:
+                # les onglets des matériels sont lus et validés pendant l'analyse de l'onglet des S2I, sans accès à la
+                # base de donnée : seule la vérification du système lié attend la fin de l'onglet des S2I
+                analyse_ordinateurs = executeur.submit(
+                    self._analyse_onglet,
+                    self._lit_onglet(
+                        classeur, self.onglet_ordi, self.onglet_ordi_ignore_lignes_debut, self.onglet_ordi_largeur
+                    ),
+                    self._analyse_ligne_ordinateur,
+                    "import ordinateur/serveur",
+                    arret,
+                )
+                analyse_materiels = executeur.submit(
+                    self._analyse_onglet,
+                    self._lit_onglet(
+                        classeur, self.onglet_mate, self.onglet_mate_ignore_lignes_debut, self.onglet_mate_largeur
+                    ),
+                    self._analyse_ligne_materiel,
+                    "matériels intelligents",
+                    arret,
+                )
 
-            # nettoyage de la base de donnée si demandé
-            if self.pre_nettoie:
-                try:
-                    self._nettoyage()
-                except Exception as e:
-                    logger.critical("Erreur dans le nettoyage de la base de donnée:  %s" % e)
+                # lecture et validation de l'onglet des S2I
+                systemes, erreurs_s2i = self._analyse_onglet(
+                    self._lit_onglet(
+                        classeur, self.onglet_S2I, self.onglet_S2I_ignore_lignes_debut, self.onglet_S2I_largeur
+                    ),
+                    self._analyse_ligne_s2i,
+                    "import S2I",
+                    arret,
+                )
+                self._rapporte_erreurs(erreurs_s2i)
+
+                # s'il y a des erreurs dans l'importation des S2I, seuls les S2I valides sont enregistrés
+                if erreurs_s2i:
+                    arret.set()
+                    if self.politique == PolitiqueImport.ANNULE:
+                        raise ImporteExcelAnnulation("Il y a eu des erreurs dans l'import des S2I")
+                    self._enregistre_onglet(partial(self._enregistre_systemes, supprime=False), systemes, "import S2I")
+                    logger.warning("Il y a eu des erreurs dans l'import des S2I, fin du programme")
                     self.traceback.append(
-                        (CeleryResultMessageType.ERROR, f"erreur dans le nettoyage de la base de donnée : {e}")
+                        (
+                            CeleryResultMessageType.ERROR,
+                            f"Il y a eu des erreurs dans l'import des S2I, fin du programme",
+                        )
                     )
-                    return CeleryResult(status=CeleryResultStatus.FATAL,messages=self.traceback)
-
-            # conversion du fichier excel en plusieurs CSV
-            excel = Xlsx2csv(temp_path / self.nom_excel, outputencoding="utf-8", delimiter=";", dateformat="%d/%m/%Y")
-            excel.convert(str(temp_path / self.nom_csv_systeme), sheetname="S2I")
-            excel.convert(str(temp_path / self.nom_csv_ordinateur), sheetname="PC - SERVEUR")
-            excel.convert(str(temp_path / self.nom_csv_materiel), sheetname="EQUIPEMENTS DIVERS")
-            # excel.convert(str(temp_path / self.nom_csv_license), sheetname="LICENCES")
-
-            # traitement du fichier csv des S2I
-            erreur_s2i = False
-            with open(temp_path / self.nom_csv_systeme, "r", encoding="utf-8") as f:
-                fichier_csv_s2i = reader(f, delimiter=";")
-                i = 1
-                for row in fichier_csv_s2i:
-                    if i > self.onglet_S2I_ignore_lignes_debut:
-                        try:
-                            self._traite_ligne_csv_s2i(i, row)
-                        except ImporteExcelError as e:
-                            logger.info(str(e))
-                            logger.warning("Import S2I - Erreur pour la ligne n° %s" % i)
-                            self.traceback.append(
-                                (CeleryResultMessageType.ERROR, f"import S2I - erreur pour la ligne n°{i} : {e}")
-                            )
-                            erreur_s2i = True
-                    i += 1
-
-            # s'il y a des erreurs dans l'importation des S2I, on annule la suite
-            if erreur_s2i:
-                logger.warning("Il y a eu des erreurs dans l'import des S2I, fin du programme")
-                self.traceback.append(
-                    (CeleryResultMessageType.ERROR, f"Il y a eu des erreurs dans l'import des S2I, fin du programme")
+                    return CeleryResultStatus.MAJOR
+
+                # un onglet des matériels a une erreur et la politique annule l'import : l'onglet des S2I n'a pas été
+                # lu jusqu'au bout, seules les erreurs déjà trouvées sont rapportées
+                if arret.is_set():
+                    self._rapporte_erreurs(analyse_ordinateurs.result()[1])
+                    self._rapporte_erreurs(analyse_materiels.result()[1])
+                    raise ImporteExcelAnnulation("Il y a eu des erreurs dans l'import des matériels")
+
+                ordinateurs, erreurs_ordinateurs = self._lie_materiels(
+                    *analyse_ordinateurs.result(), "import ordinateur/serveur"
                 )
-                return CeleryResult(status=CeleryResultStatus.MAJOR, messages=self.traceback)
-            else:
-                self.traceback.append(
-                    (CeleryResultMessageType.SUCCESS, f"importation réussie des S2I dans la base de donnée")
+                materiels, erreurs_materiels = self._lie_materiels(
+                    *analyse_materiels.result(), "matériels intelligents"
                 )
-                logger.warning("Importation réussie des S2I dans la base de donnée")
-
-            # traitement du fichier des ordinateurs
-            erreur_mineure = False
-            with open(temp_path / self.nom_csv_ordinateur, "r", encoding="utf-8") as f:
-                fichier_csv_ordi = reader(f, delimiter=";")
-                i = 1
-                for row in fichier_csv_ordi:
-                    if i > self.onglet_ordi_ignore_lignes_debut:
-                        try:
-                            self._traite_ligne_csv_ordinateur(i, row)
-                        except ImporteExcelError as e:
-                            erreur_mineure = True
-                            logger.debug(str(e))
-                            logger.warning("Import ordinateur/serveur - Erreur pour la ligne n° %s" % i)
-                            self.traceback.append(
-                                (
-                                    CeleryResultMessageType.ERROR,
-                                    f"import ordinateur/serveur - erreur pour la ligne n°{i} : {e}",
-                                )
-                            )
-                    i += 1
-            logger.info("Importation terminée des ordinateurs/serveurs dans la base de donnée")
+            finally:
+                arret.set()
+        self._rapporte_erreurs(erreurs_ordinateurs)
+        self._rapporte_erreurs(erreurs_materiels)
+        erreur_ordinateurs = bool(erreurs_ordinateurs)
+        erreur_materiels = bool(erreurs_materiels)
+        if (erreur_ordinateurs or erreur_materiels) and self.politique == PolitiqueImport.ANNULE:
+            raise ImporteExcelAnnulation("Il y a eu des erreurs dans l'import des matériels")
+
+        # enregistrement en masse, un point de sauvegarde par onglet
+        if not self._enregistre_onglet(self._enregistre_systemes, systemes, "import S2I"):
             self.traceback.append(
-                (CeleryResultMessageType.SUCCESS, f"importation terminée des ordinateurs/serveurs dans la base de donnée")
+                (CeleryResultMessageType.ERROR, f"Il y a eu des erreurs dans l'import des S2I, fin du programme")
             )
+            return CeleryResultStatus.MAJOR
+        self.traceback.append((CeleryResultMessageType.SUCCESS, f"importation réussie des S2I dans la base de donnée"))
+        logger.warning("Importation réussie des S2I dans la base de donnée")
+
+        if not self._enregistre_onglet(
+            partial(self._enregistre_materiels, MaterielOrdinateur, supprime=not erreur_ordinateurs),
+            ordinateurs,
+            "import ordinateur/serveur",
+        ):
+            erreur_ordinateurs = True
+        logger.info("Importation terminée des ordinateurs/serveurs dans la base de donnée")
+        self.traceback.append(
+            (CeleryResultMessageType.SUCCESS, f"importation terminée des ordinateurs/serveurs dans la base de donnée")
+        )
 
-            # traitement du fichier des effecteurs intelligents
-            with open(temp_path / self.nom_csv_materiel, "r", encoding="utf-8") as f:
-                fichier_csv_materiel = reader(f, delimiter=";")
-                i = 1
-                for row in fichier_csv_materiel:
-                    if i > self.onglet_mate_ignore_lignes_debut:
-                        try:
-                            self._traite_ligne_csv_materiel(i, row)
-                        except ImporteExcelError as e:
-                            erreur_mineure = True
-                            logger.debug(str(e))
-                            logger.warning("Import matériels intelligents - Erreur pour la ligne n° %s" % i)
-                            self.traceback.append(
-                                (CeleryResultMessageType.ERROR, f"matériels intelligents - erreur pour la ligne n°{i} : {e}")
-                            )
-                    i += 1
-            logger.info("Importation terminée des matériels intelligents dans la base de donnée")
-            self.traceback.append(
-                (CeleryResultMessageType.SUCCESS, f"importation terminée des matériels intelligents dans la base de donnée")
-            )
+        if not self._enregistre_onglet(
+            partial(self._enregistre_materiels, MaterielEffecteur, supprime=not erreur_materiels),
+            materiels,
+            "matériels intelligents",
+        ):
+            erreur_materiels = True
+        logger.info("Importation terminée des matériels intelligents dans la base de donnée")
+        self.traceback.append(
+            (CeleryResultMessageType.SUCCESS, f"importation terminée des matériels intelligents dans la base de donnée")
+        )
 
-            if erreur_mineure:
-                return CeleryResult(status=CeleryResultStatus.MINOR, messages=self.traceback)
-            else:
-                return CeleryResult(status=CeleryResultStatus.OK, messages=self.traceback)
+        if erreur_ordinateurs or erreur_materiels:
+            return CeleryResultStatus.MINOR
+        else:
+            return CeleryResultStatus.OK
 
+    def main(self) -> CeleryResult:
+        """Import d'un fichier excel dans la base de donnée.
+        Renvoi True si l'import s'est correctement déroulé.
+        """
 
-@shared_task(pydantic=True)
-def importe_excel(zone_usid: ZoneUsid, encoded_fichier: bytes, verbosity: int, nettoie: bool) -> CeleryResult:
+        # ouverture du fichier excel du dossier partagé, les onglets sont lus au fil de l'analyse
+        try:
+            classeur = ClasseurExcel(chemin_fichier_import(self.fichier), format_date="%d/%m/%Y")
+        except Exception as e:
+            logger.critical("Erreur dans la lecture du fichier excel : %s" % e)
+            self.traceback.append((CeleryResultMessageType.ERROR, f"erreur dans la lecture du fichier excel : {e}"))
+            return CeleryResult(status=CeleryResultStatus.FATAL, messages=self.traceback)
+
+        with classeur:
+            manquants = [k for k in (self.onglet_S2I, self.onglet_ordi, self.onglet_mate) if k not in classeur.onglets]
+            if manquants:
+                logger.critical("Onglets absents du fichier excel : %s" % manquants)
+                self.traceback.append(
+                    (
+                        CeleryResultMessageType.ERROR,
+                        f"erreur dans la lecture du fichier excel : onglets absents {', '.join(manquants)}",
+                    )
+                )
+                return CeleryResult(status=CeleryResultStatus.FATAL, messages=self.traceback)
+
+            if self.dry_run:
+                self.traceback.append(
+                    (CeleryResultMessageType.INFO, "simulation : le fichier est validé sans modifier la base de donnée")
+                )
+
+            # tout l'import est fait dans une seule transaction
+            try:
+                with transaction.atomic():
+                    status = self._importe(classeur)
+            except ImporteExcelAnnulation as e:
+                logger.warning("Import annulé : %s" % e)
+                self.traceback.append(
+                    (CeleryResultMessageType.ERROR, f"{e}, import annulé : aucune modification n'a été enregistrée")
+                )
+                return CeleryResult(status=CeleryResultStatus.FATAL, messages=self.traceback)
+            if self.dry_run:
+                self.traceback.append(
+                    (CeleryResultMessageType.INFO, "simulation terminée : aucune modification n'a été enregistrée")
+                )
+            return CeleryResult(status=status, messages=self.traceback)
+
+
+@shared_task(bind=True, pydantic=True)
+def importe_excel(
+    self,
+    zone_usid: ZoneUsid,
+    fichier: str,
+    verbosity: int,
+    nettoie: bool,
+    politique: PolitiqueImport = PolitiqueImport.GARDE_VALIDES,
+    dry_run: bool = False,
+    differentiel: bool = False,
+) -> CeleryResult:
     logger.info("début de l'import du fichier excel")
-    importeur = ImporteExcel(zone_usid, encoded_fichier, verbosity=verbosity, nettoie=nettoie)
-    return importeur.main()
 
+    # la requête de la tâche est propre au thread : l'avancement est aussi publié depuis les threads d'analyse
+    task_id = self.request.id
+
+    def progression(meta: dict) -> None:
+        self.update_state(task_id=task_id, state=ETAT_PROGRESSION, meta=meta)
+
+    # un crash est rapporté comme un résultat : dans un lot, une tâche en échec empêcherait les vagues suivantes
+    try:
+        importeur = ImporteExcel(
+            zone_usid,
+            fichier,
+            verbosity=verbosity,
+            nettoie=nettoie,
+            politique=politique,
+            dry_run=dry_run,
+            differentiel=differentiel,
+            progression=progression,
+        )
+        return importeur.main()
+    except Exception:
+        logger.exception("crash inattendu de l'import du fichier excel")
+        return CeleryResult(
+            status=CeleryResultStatus.CRASH,
+            messages=[(CeleryResultMessageType.ERROR, "crash inattendu, consulter les logs pour plus de détails")],
+        )
+
+
+@shared_task
+def purge_imports() -> int:
+    """Supprime les fichiers d'import du dossier partagé plus vieux que 'IMPORT_CONSERVATION'"""
+    supprimes = purge_fichiers_import(settings.IMPORT_CONSERVATION)
+    logger.info("%s fichiers d'import supprimés" % supprimes)
+    return supprimes
@@ -0,0 +1,91 @@
+"""Import d'un lot de fichiers excel, un par zone d'USID
+
+Chaque zone est importée par sa propre tâche 'importe_excel'. Les imports sont lancés par vagues d'au plus
+'concurrence' zones, une vague commençant quand la précédente est terminée, puis la tâche 'rapporte_lot' rassemble
+leurs comptes-rendus en un seul. Les imports du lot sont aussi enregistrés comme un groupe, sous l'identifiant de
+la tâche du compte-rendu, pour suivre l'avancement du lot.
+"""
+
+import logging
+
+from celery import chain, group, shared_task
+from celery.result import AsyncResult, GroupResult
+from celery.utils import uuid
+
+from inventaire.models import ZoneUsid
+from inventaire.tasks.importe_excel import importe_excel
+from inventaire.utils import CeleryResult, CeleryResultMessageType, CeleryResultStatus
+
+logger = logging.getLogger(__name__)
+
+LIBELLES_STATUS = {
+    CeleryResultStatus.OK: "importation réussie",
+    CeleryResultStatus.MINOR: "importation réussie avec des erreurs mineures",
+    CeleryResultStatus.MAJOR: "importation réussie avec des erreurs majeures",
+    CeleryResultStatus.FATAL: "importation échouée",
+    CeleryResultStatus.CRASH: "importation échouée, crash inattendu",
+}
+
+
+def agrege_resultats(resultats: dict[ZoneUsid, CeleryResult]) -> CeleryResult:
+    """Un compte-rendu unique : le statut le plus grave du lot, et les messages de chaque zone précédés de son bilan"""
+    messages = []
+    for zone, resultat in resultats.items():
+        bilan = f"{zone.label} : {LIBELLES_STATUS[resultat.status]}"
+        if resultat.status <= CeleryResultStatus.MINOR:
+            messages.append((CeleryResultMessageType.SUCCESS, bilan))
+        else:
+            messages.append((CeleryResultMessageType.ERROR, bilan))
+        messages.extend((type_message, f"{zone.label} - {message}") for type_message, message in resultat.messages)
+    status = max((k.status for k in resultats.values()), default=CeleryResultStatus.OK)
+    return CeleryResult(status=status, messages=messages)
+
+
+def _resultat_import(task_id: str) -> CeleryResult:
+    """Le compte-rendu d'un import terminé, ou un crash si la tâche a échoué"""
+    task = AsyncResult(task_id)
+    if task.successful():
+        return CeleryResult.model_validate(task.result)
+    return CeleryResult(
+        status=CeleryResultStatus.CRASH,
+        messages=[(CeleryResultMessageType.ERROR, "crash inattendu, consulter les logs pour plus de détails")],
+    )
+
+
+@shared_task(pydantic=True)
+def rapporte_lot(imports: dict[ZoneUsid, str]) -> CeleryResult:
+    """Rassemble les comptes-rendus des imports d'un lot, donnés par l'identifiant de leur tâche par zone"""
+    logger.info("rassemblement des comptes-rendus du lot : %s" % ", ".join(imports))
+    return agrege_resultats({zone: _resultat_import(task_id) for zone, task_id in imports.items()})
+
+
+def vagues_import_lot(fichiers: dict[ZoneUsid, str], concurrence: int, **options) -> tuple[list[group], dict]:
+    """Les vagues d'imports d'un lot, et l'identifiant de la tâche d'import de chaque zone
+
+    Les 'options' sont celles de la tâche 'importe_excel'.
+    """
+    identifiants = {zone: uuid() for zone in fichiers}
+    imports = [
+        importe_excel.si(zone, nom_fichier, **options).set(task_id=identifiants[zone])
+        for zone, nom_fichier in fichiers.items()
+    ]
+    return [group(imports[k : k + concurrence]) for k in range(0, len(imports), concurrence)], identifiants
+
+
+def lance_import_lot(fichiers: dict[ZoneUsid, str], concurrence: int, **options) -> AsyncResult:
+    """Lance l'import d'un lot de fichiers, renvoie la tâche du compte-rendu du lot"""
+    vagues, identifiants = vagues_import_lot(fichiers, concurrence, **options)
+    lot_id = uuid()
+    GroupResult(lot_id, [AsyncResult(k) for k in identifiants.values()]).save()
+    return chain(*vagues, rapporte_lot.si(identifiants).set(task_id=lot_id)).apply_async()
+
+
+def avancement_lot(task_id: str) -> tuple[int, int] | None:
+    """Le nombre d'imports terminés et le nombre total d'imports d'un lot, None si la tâche n'est pas un lot"""
+    try:
+        lot = GroupResult.restore(task_id)
+    except NotImplementedError:  # pas de stockage des résultats
+        return None
+    if lot is None:
+        return None
+    return lot.completed_count(), len(lot.results)
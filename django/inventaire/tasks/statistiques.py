@@ -0,0 +1,18 @@
+"""Tâches périodiques de calcul des statistiques de l'inventaire"""
+
+import logging
+
+from celery import shared_task
+
+from inventaire.statistiques import rafraichit_statistiques_zones
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def rafraichit_statistiques() -> int:
+    """Recalcule les statistiques précalculées de toutes les zones d'USID (lancée par celery beat)"""
+    nb_zones = rafraichit_statistiques_zones()
+    logger.info("statistiques de %d zones recalculées" % nb_zones)
+    return nb_zones
@@ -4,14 +4,24 @@ from django import template
 from django.conf import settings
 from django.template.defaultfilters import date as _date
 
+from inventaire.pagination import PARAMETRES_PAGINATION
+
 register = template.Library()
 
 
 @register.simple_tag(takes_context=True)
-def lien_pagination(context, value):
-    """Ajoute le paramètre de pagination en conservant les paramètres actuels"""
+def lien_pagination(context, value, parametre="page"):
+    """Ajoute le paramètre de pagination en conservant les paramètres actuels
+
+    Le paramètre est le numéro de page ('page') ou un curseur ('apres' ou 'avant'), les autres paramètres de
+    pagination sont retirés. Une valeur vide renvoie vers la première page.
+    """
     get_params = context.request.GET.copy()
-    get_params["page"] = value
+    for k in PARAMETRES_PAGINATION:
+        if k != parametre or value in (None, ""):
+            get_params.pop(k, None)
+    if value not in (None, ""):
+        get_params[parametre] = value
     return get_params.urlencode()
 
 
@@ -0,0 +1,305 @@
+"""Définition des tests unitaires de l'inventaire pour la cartographie des sites"""
+
+import logging
+from json import loads
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+
+from inventaire.cartographie import (
+    MOTEUR_GOJS,
+    MOTEUR_MERMAID,
+    construit_graphe,
+    dessin_site,
+    invalide_cartographies_zones,
+    rendu_gojs,
+    rendu_mermaid,
+)
+from inventaire.models import DomaineMetier, Interconnexion, Localisation, SystemeIndustriel, ZoneUsid
+from inventaire.parcours import atteignables
+from inventaire.tasks.importe_excel import ImporteExcel
+from inventaire.utils import invalidations_differees
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseSiteTest(TestCase):
+    """Un site d'Angers en deux localisations, relié à un système de Rennes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.domaine = DomaineMetier.objects.create(code="GT", nom="gestion technique")
+        cls.nord = cls._localisation(ZoneUsid.AMS, "Angers", "Verneau", "nord")
+        cls.sud = cls._localisation(ZoneUsid.AMS, "Angers", "Verneau", "sud")
+        cls.rennes = cls._localisation(ZoneUsid.RVC, "Rennes", "Maurepas", "")
+        cls.chaufferie = cls._systeme(cls.nord, "chaufferie")
+        cls.ascenseur = cls._systeme(cls.nord, "ascenseur")
+        cls.portail = cls._systeme(cls.sud, "portail")
+        corbeille = cls._systeme(cls.sud, "ancien portail", fiche_corbeille=True)
+        cls.supervision = cls._systeme(cls.rennes, "supervision")
+        distant_corbeille = cls._systeme(cls.rennes, "ancienne supervision", fiche_corbeille=True)
+        sans_localisation = cls._systeme(None, "orphelin")
+        Interconnexion.objects.relie(
+            [
+                cls._lien(cls.chaufferie, cls.ascenseur, Interconnexion.Liaison.FIL),
+                cls._lien(cls.chaufferie, cls.supervision, Interconnexion.Liaison.WIFI),
+                cls._lien(cls.portail, corbeille, Interconnexion.Liaison.FIL),
+                cls._lien(cls.ascenseur, distant_corbeille, Interconnexion.Liaison.FIL),
+                cls._lien(cls.ascenseur, sans_localisation, Interconnexion.Liaison.FIL),
+            ]
+        )
+
+    @staticmethod
+    def _localisation(zone: ZoneUsid, ville: str, quartier: str, zone_quartier: str) -> Localisation:
+        return Localisation.objects.create(
+            zone_usid=zone,
+            nom_ville=ville,
+            nom_quartier=quartier,
+            zone_quartier=zone_quartier,
+            protection=Localisation.Protection.TM,
+            sensibilite=Localisation.Sensibilite.MOINDRE,
+        )
+
+    @classmethod
+    def _systeme(cls, localisation: Localisation | None, nom: str, fiche_corbeille=False) -> SystemeIndustriel:
+        return SystemeIndustriel.objects.create(
+            localisation=localisation,
+            nom=nom,
+            environnement=SystemeIndustriel.Environnement.AUTRE,
+            domaine_metier=cls.domaine,
+            fiche_corbeille=fiche_corbeille,
+        )
+
+    @staticmethod
+    def _lien(source: SystemeIndustriel, cible: SystemeIndustriel, liaison: Interconnexion.Liaison) -> Interconnexion:
+        return Interconnexion(
+            systeme_from=source, systeme_to=cible, type_reseau=Interconnexion.Reseau.A_I, type_liaison=liaison
+        )
+
+
+@tag("cartographie", "cartographie-graphe")
+class GrapheSiteTest(BaseSiteTest):
+    """Classe de test du graphe des interconnexions d'un site"""
+
+    def _graphe(self):
+        return construit_graphe(Localisation.objects.filter(nom_ville="Angers", nom_quartier="Verneau"))
+
+    def test_graphe(self):
+        """Les systèmes du site et leurs voisins sont groupés par localisation, chaque lien n'apparaît qu'une fois"""
+        graphe = self._graphe()
+        self.assertEqual(graphe.titre, "USID d'Angers - Angers - Verneau")
+        self.assertEqual(
+            [(k.pk, k.local, [n.nom for n in k.noeuds]) for k in graphe.lieux],
+            [
+                (self.nord.pk, True, ["ascenseur", "chaufferie"]),
+                (self.sud.pk, True, ["portail"]),
+                (self.rennes.pk, False, ["supervision"]),
+            ],
+        )
+        self.assertCountEqual(
+            [(frozenset((k.source, k.cible)), k.liaison) for k in graphe.liens],
+            [
+                (frozenset((self.chaufferie.pk, self.ascenseur.pk)), "filaire"),
+                (frozenset((self.chaufferie.pk, self.supervision.pk)), "wifi"),
+            ],
+        )
+
+    def test_graphe_site_inconnu(self):
+        """Un site sans localisation n'a pas de graphe"""
+        self.assertIsNone(construit_graphe(Localisation.objects.filter(nom_ville="Saumur")))
+
+    def test_graphe_nombre_requetes(self):
+        """Le nombre de requêtes ne dépend pas du nombre de systèmes ni de liens"""
+        with self.assertNumQueries(3):
+            self._graphe()
+        nouveaux = [self._systeme(self.sud, f"capteur {k}") for k in range(20)]
+        Interconnexion.objects.relie(
+            [self._lien(k, self.supervision, Interconnexion.Liaison.RADIO) for k in nouveaux]
+            + [self._lien(k, self.chaufferie, Interconnexion.Liaison.FIL) for k in nouveaux]
+        )
+        with self.assertNumQueries(3):
+            graphe = self._graphe()
+        self.assertEqual(len(graphe.liens), 42)
+
+    def test_rendu_gojs(self):
+        """Le modèle GoJS contient les groupes des localisations, les systèmes et les liens"""
+        dessin = loads(rendu_gojs(self._graphe()))
+        noeuds = {k["key"]: k for k in dessin["nodeDataArray"]}
+        self.assertEqual(noeuds[f"loc_{self.nord.pk}"]["group"], "base")
+        self.assertNotIn("group", noeuds[f"loc_{self.rennes.pk}"])
+        self.assertEqual(noeuds[self.supervision.pk]["group"], f"loc_{self.rennes.pk}")
+        self.assertEqual(noeuds[self.supervision.pk]["color"], "SkyBlue")
+        self.assertEqual(len(dessin["linkDataArray"]), 2)
+
+    def test_rendu_mermaid(self):
+        """Le graphe Mermaid regroupe les localisations du site dans un même sous-graphe"""
+        lignes = rendu_mermaid(self._graphe()).splitlines()
+        self.assertEqual(lignes[:2], ["graph TB", "subgraph C[Angers - Verneau]"])
+        fin_site = lignes.index("end", lignes.index(f'A{self.portail.pk}("portail")'))
+        self.assertEqual(lignes[fin_site + 1], "end")
+        self.assertIn(f"subgraph B{self.rennes.pk}[Rennes - Maurepas]", lignes[fin_site + 2 :])
+        self.assertIn(f"A{self.chaufferie.pk} <-- wifi --> A{self.supervision.pk}", lignes)
+
+
+@tag("cartographie", "cartographie-cache")
+class CacheCartographieTest(BaseSiteTest):
+    """Classe de test de la cartographie des sites conservée en cache"""
+
+    site_angers = (ZoneUsid.AMS, "Angers", "Verneau")
+    site_rennes = (ZoneUsid.RVC, "Rennes", "Maurepas")
+
+    def setUp(self):
+        cache.clear()
+
+    def _redessine(self, site: tuple, modification) -> str:
+        """Met le dessin du site en cache, le modifie puis vérifie qu'il est redessiné"""
+        dessin_site(site, MOTEUR_MERMAID)
+        modification()
+        with self.assertNumQueries(3):
+            return dessin_site(site, MOTEUR_MERMAID)[1]
+
+    def test_cache(self):
+        """Le dessin est conservé par site et par moteur, sans aucune requête une fois en cache"""
+        titre, mermaid = dessin_site(self.site_angers, MOTEUR_MERMAID)
+        self.assertEqual(titre, "USID d'Angers - Angers - Verneau")
+        with self.assertNumQueries(0):
+            self.assertEqual(dessin_site(self.site_angers, MOTEUR_MERMAID), (titre, mermaid))
+        with self.assertNumQueries(3):
+            _, gojs = dessin_site(self.site_angers, MOTEUR_GOJS)
+        self.assertEqual(loads(gojs)["class"], "GraphLinksModel")
+        self.assertIsNone(dessin_site((ZoneUsid.AMS, "Saumur", ""), MOTEUR_MERMAID))
+
+    def test_systeme_modifie(self):
+        """Renommer un système invalide son site et ceux de ses voisins, mais pas les autres sites"""
+        self.supervision.nom = "hyperviseur"
+        self.assertIn('("hyperviseur")', self._redessine(self.site_angers, self.supervision.save))
+        dessin_site(self.site_rennes, MOTEUR_MERMAID)
+        self.portail.nom = "barrière"
+        self.portail.save()
+        with self.assertNumQueries(0):
+            dessin_site(self.site_rennes, MOTEUR_MERMAID)
+
+    def test_systeme_deplace(self):
+        """Un système déplacé vers un autre site disparait de la cartographie de son ancien site"""
+
+        def deplace():
+            self.ascenseur.localisation = self.rennes
+            self.ascenseur.save()
+
+        self.assertNotIn('("ascenseur")', self._redessine(self.site_angers, deplace).split("subgraph B")[1])
+
+    def test_systeme_supprime(self):
+        """Un système supprimé disparait des cartographies de ses voisins"""
+        self.assertNotIn("supervision", self._redessine(self.site_angers, self.supervision.delete))
+
+    def test_localisation_modifiee(self):
+        """Renommer une localisation invalide la cartographie des sites de ses voisins"""
+
+        def renomme():
+            self.rennes.nom_quartier = "Bréquigny"
+            self.rennes.save()
+
+        self.assertIn("Rennes - Bréquigny", self._redessine(self.site_angers, renomme))
+        self.assertIsNone(dessin_site(self.site_rennes, MOTEUR_MERMAID))
+
+    def test_interconnexion(self):
+        """Créer ou supprimer une interconnexion invalide les sites de ses deux systèmes"""
+        lien = self._lien(self.portail, self.supervision, Interconnexion.Liaison.RADIO)
+        self.assertIn("radio", self._redessine(self.site_rennes, lien.save))
+        self.assertNotIn("radio", self._redessine(self.site_angers, lien.delete))
+
+    def test_systeme_modifie_sans_relecture(self):
+        """La sauvegarde d'un système ne relit rien avant d'écrire, son ancienne localisation étant retenue"""
+        self.portail.nom = "barrière"
+        with CaptureQueriesContext(connection) as requetes:
+            self.portail.save()
+        self.assertTrue(requetes.captured_queries[0]["sql"].startswith("UPDATE"))
+
+    def test_suppression_differee(self):
+        """Sous 'invalidations_differees', supprimer des systèmes coûte un nombre de requêtes indépendant de leur nombre"""
+
+        def supprime(nombre: int) -> int:
+            pks = [self._systeme(self.rennes, f"capteur {k}").pk for k in range(nombre)]
+            Interconnexion.objects.relie(
+                [self._lien(self.chaufferie, SystemeIndustriel(pk=k), Interconnexion.Liaison.FIL) for k in pks]
+            )
+            with invalidations_differees(), CaptureQueriesContext(connection) as requetes:
+                SystemeIndustriel.objects.filter(pk__in=pks).delete()
+            return len(requetes)
+
+        self.assertEqual(supprime(2), supprime(8))
+
+    def test_nettoyage_import(self):
+        """Le nettoyage d'une zone par l'import invalide les sites voisins, dont les interconnexions ont disparu"""
+        dessin_site(self.site_rennes, MOTEUR_MERMAID)
+        with self.captureOnCommitCallbacks(execute=True):
+            ImporteExcel(ZoneUsid.AMS, "nettoyage.xlsx")._nettoyage()
+        self.assertNotIn("chaufferie", dessin_site(self.site_rennes, MOTEUR_MERMAID)[1])
+
+    def test_import(self):
+        """Après un import, les sites des zones importées et leurs voisins sont invalidés"""
+        SystemeIndustriel.objects.filter(pk=self.supervision.pk).update(nom="hyperviseur")
+        dessin = self._redessine(self.site_angers, lambda: invalide_cartographies_zones([ZoneUsid.RVC]))
+        self.assertIn("hyperviseur", dessin)
+
+
+@tag("cartographie", "cartographie-parcours")
+class ParcoursTest(BaseSiteTest):
+    """Classe de test du parcours à plusieurs sauts des interconnexions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.pompe = cls._systeme(cls.rennes, "pompe")
+        internet = cls._lien(cls.pompe, cls.portail, Interconnexion.Liaison.MOBILE)
+        internet.type_reseau = Interconnexion.Reseau.NP_C
+        Interconnexion.objects.relie([cls._lien(cls.supervision, cls.pompe, Interconnexion.Liaison.FIL), internet])
+
+    def _parcours(self, zones=(ZoneUsid.AMS, ZoneUsid.RVC), profondeur=5, limite=10, reseaux=None) -> tuple:
+        resultat, tronque = atteignables(self.chaufferie.pk, zones, profondeur, limite, reseaux)
+        return [(k.pk, k.distance) for k in resultat], tronque
+
+    def test_atteignables(self):
+        """Les systèmes sont renvoyés du plus proche au plus lointain, sans corbeille ni système sans localisation"""
+        self.assertEqual(
+            self._parcours(),
+            (
+                [
+                    (self.ascenseur.pk, 1),
+                    (self.supervision.pk, 1),
+                    (self.pompe.pk, 2),
+                    (self.portail.pk, 3),
+                ],
+                False,
+            ),
+        )
+
+    def test_chemin(self):
+        """Le chemin le plus court vers chaque système part de l'origine, malgré les cycles des symétriques"""
+        resultat, _ = atteignables(self.chaufferie.pk, [ZoneUsid.AMS, ZoneUsid.RVC], 5, 10)
+        self.assertEqual(resultat[-1].chemin, (self.chaufferie.pk, self.supervision.pk, self.pompe.pk, self.portail.pk))
+
+    def test_profondeur_limite(self):
+        """La profondeur borne le nombre de sauts, la limite le nombre de systèmes"""
+        self.assertEqual(
+            [k for k, _ in self._parcours(profondeur=2)[0]], [self.ascenseur.pk, self.supervision.pk, self.pompe.pk]
+        )
+        self.assertEqual(self._parcours(limite=2), ([(self.ascenseur.pk, 1), (self.supervision.pk, 1)], True))
+
+    def test_zones(self):
+        """Un système hors des zones données n'est ni renvoyé, ni traversé"""
+        self.assertEqual(self._parcours(zones=[ZoneUsid.AMS]), ([(self.ascenseur.pk, 1)], False))
+        self.assertEqual(self._parcours(zones=[]), ([], False))
+
+    def test_reseaux(self):
+        """Seules les interconnexions des réseaux donnés sont suivies"""
+        atteints, _ = self._parcours(reseaux=[Interconnexion.Reseau.A_I])
+        self.assertNotIn(self.portail.pk, [k for k, _ in atteints])
+
+    def test_une_requete(self):
+        """Le parcours est calculé en une seule requête"""
+        with self.assertNumQueries(1):
+            self._parcours()
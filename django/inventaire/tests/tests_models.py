@@ -5,7 +5,8 @@ from datetime import date
 from packaging.version import parse as parse_version
 
 from django.db import connection
-from django.test import TestCase, tag
+from django.db.backends.postgresql.base import DatabaseWrapper as PostgresqlDatabaseWrapper
+from django.test import SimpleTestCase, TestCase, tag
 
 from inventaire.models import (
     ContratMaintenance,
@@ -261,11 +262,124 @@ class SystemeIndustrielTest(TestCase):
         self.assertEqual(SystemeIndustriel.objects.get(pk=1).criticite(), 26)
         self.assertEqual(SystemeIndustriel.objects.get(pk=2).criticite(), 16)
 
+    def test_indice_criticite(self):
+        """La criticité stockée est calculée à la création et à l'ajout des fonctions métiers"""
+        self.assertEqual(SystemeIndustriel.objects.get(pk=1).indice_criticite, 26)
+        self.assertEqual(SystemeIndustriel.objects.get(pk=2).indice_criticite, 16)
+
+    def test_indice_criticite_fonctions(self):
+        """La criticité stockée suit les changements de fonctions métiers, dans les deux sens de la relation"""
+        SystemeIndustriel.objects.get(pk=1).fonctions_metiers.remove(FonctionsMetier.objects.get(pk=3))
+        self.assertEqual(SystemeIndustriel.objects.get(pk=1).indice_criticite, 16)
+        FonctionsMetier.objects.get(pk=3).systemes.clear()
+        self.assertEqual(SystemeIndustriel.objects.get(pk=2).indice_criticite, 5)
+
+    def test_indice_criticite_systeme(self):
+        """La criticité stockée suit les changements d'environnement d'un système"""
+        systeme = SystemeIndustriel.objects.get(pk=1)
+        systeme.environnement = SystemeIndustriel.Environnement.NUC
+        systeme.save()
+        self.assertEqual(SystemeIndustriel.objects.get(pk=1).indice_criticite, 32)
+
+    def test_indice_criticite_coefficients(self):
+        """La criticité stockée est recalculée en masse quand un coefficient ou une sensibilité change"""
+        domaine = DomaineMetier.objects.get(pk=1)
+        domaine.coeff_criticite = 1
+        domaine.save()
+        self.assertEqual(SystemeIndustriel.objects.get(pk=1).indice_criticite, 8)
+        fonction = FonctionsMetier.objects.get(pk=3)
+        fonction.coeff_criticite = 1
+        fonction.save()
+        self.assertEqual(SystemeIndustriel.objects.get(pk=1).indice_criticite, 6)
+        self.assertEqual(SystemeIndustriel.objects.get(pk=2).indice_criticite, 5)
+        localisation = Localisation.objects.get(pk=1)
+        localisation.sensibilite = Localisation.Sensibilite.VITALE
+        localisation.save()
+        self.assertEqual(SystemeIndustriel.objects.get(pk=1).indice_criticite, 9)
+
+
+@tag("models", "models-systemes", "models-systemes-criticite")
+class SystemeIndustrielCriticiteTest(TestCase):
+    """Classe de test de la parité entre la criticité calculée en python et celle calculée en SQL"""
+
+    fixtures = ["inventaire/metiers.json"]
+
+    @classmethod
+    def setUpTestData(cls):
+        # une localisation par sensibilité
+        for k in Localisation.Sensibilite:
+            Localisation.objects.create(
+                zone_usid=ZoneUsid.AMS,
+                nom_ville="Angers",
+                nom_quartier=k.label,
+                protection=Localisation.Protection.TM,
+                sensibilite=k,
+            )
+        # toutes les combinaisons de domaine, environnement et sensibilité, avec aucune, une ou toutes les fonctions
+        for domaine in DomaineMetier.objects.prefetch_related("fonctions"):
+            fonctions = list(domaine.fonctions.all())
+            for localisation in Localisation.objects.all():
+                for environnement in SystemeIndustriel.Environnement:
+                    for nom, selection in (("aucune", []), ("une", fonctions[:1]), ("toutes", fonctions)):
+                        systeme = SystemeIndustriel.objects.create(
+                            localisation=localisation,
+                            nom=nom,
+                            environnement=environnement,
+                            domaine_metier=domaine,
+                        )
+                        systeme.fonctions_metiers.add(*selection)
+        # un système sans localisation et un système avec plusieurs ordinateurs (jointure multiple)
+        SystemeIndustriel.objects.create(
+            localisation=None,
+            nom="sans localisation",
+            environnement=SystemeIndustriel.Environnement.AUTRE,
+            domaine_metier=DomaineMetier.objects.first(),
+        )
+        for marque in ("extreme pc", "extreme serveur"):
+            MaterielOrdinateur.objects.create(
+                systeme=SystemeIndustriel.objects.filter(nom="toutes").first(),
+                fonction=MaterielOrdinateur.Fonction.MAINT,
+                marque=marque,
+                modele="Xtrem pro max",
+                os_famille=MaterielOrdinateur.FamilleOs.WIN_P_11,
+            )
+
+    def test_parite_formule(self):
+        """La criticité annotée est identique à celle de la méthode 'criticite' pour toutes les combinaisons"""
+        for systeme in SystemeIndustriel.objects.filter(localisation__isnull=False).avec_criticite():
+            self.assertEqual(systeme.criticite_calculee, systeme.criticite(), msg=str(systeme))
+
+    def test_parite_stockee(self):
+        """La criticité annotée est identique à la criticité stockée"""
+        for systeme in SystemeIndustriel.objects.filter(localisation__isnull=False).avec_criticite():
+            self.assertEqual(systeme.criticite_calculee, systeme.indice_criticite, msg=str(systeme))
+
+    def test_une_seule_requete(self):
+        """La criticité de tous les systèmes est obtenue en une seule requête"""
+        with self.assertNumQueries(1):
+            valeurs = [k.criticite_calculee for k in SystemeIndustriel.objects.avec_criticite()]
+        self.assertEqual(len(valeurs), 361)
+
+    def test_jointures(self):
+        """Les jointures multiples et le distinct du queryset ne faussent pas la somme des coefficients"""
+        query = SystemeIndustriel.objects.filter(materiels_it__marque__icontains="extreme").distinct().avec_criticite()
+        self.assertEqual(len(query), 1)
+        self.assertEqual(query[0].criticite_calculee, query[0].criticite())
+
+    def test_sans_localisation(self):
+        """Un système sans localisation n'a pas de criticité calculable"""
+        systeme = SystemeIndustriel.objects.avec_criticite().get(nom="sans localisation")
+        self.assertIsNone(systeme.criticite_calculee)
+        self.assertEqual(systeme.indice_criticite, 0)
+
 
 @tag("models", "models-interconnexions")
 class InterconnexionTest(TestCase):
     """Classe de test pour le modèle Interconnexion"""
 
+    # la lecture des sites dont la cartographie est invalidée, une seule quel que soit le nombre d'interconnexions
+    requetes_cartographie = 1
+
     @classmethod
     def setUpTestData(cls):
         Localisation.objects.create(
@@ -356,6 +470,98 @@ class InterconnexionTest(TestCase):
         Interconnexion.objects.get(pk=1).delete()
         self.assertEqual(Interconnexion.objects.count(), 0)
 
+    def _paires(self) -> dict:
+        return {
+            (k.systeme_from_id, k.systeme_to_id): (k.type_reseau, k.type_liaison, k.protocole)
+            for k in Interconnexion.objects.all()
+        }
+
+    def test_save_symetrique(self):
+        """La modification d'une interconnexion met à jour sa symétrique en une seule requête"""
+        self.i1.save()
+        self.i1.type_liaison = Interconnexion.Liaison.FIL
+        with self.assertNumQueries(2 + self.requetes_cartographie):
+            self.i1.save()
+        self.assertEqual(
+            self._paires(),
+            {
+                (1, 2): (Interconnexion.Reseau.A_C, Interconnexion.Liaison.FIL, ""),
+                (2, 1): (Interconnexion.Reseau.A_C, Interconnexion.Liaison.FIL, ""),
+            },
+        )
+
+    def test_relie(self):
+        """Les interconnexions et leurs symétriques sont créées puis mises à jour en une requête"""
+        with self.assertNumQueries(1):
+            Interconnexion.objects.relie([self.i1])
+        self.assertIsNotNone(self.i1.pk)
+        modifiee = Interconnexion(
+            systeme_from_id=2,
+            systeme_to_id=1,
+            type_reseau=Interconnexion.Reseau.DR_I,
+            type_liaison=Interconnexion.Liaison.FIL,
+            protocole="modbus",
+        )
+        with self.assertNumQueries(1):
+            Interconnexion.objects.relie([modifiee])
+        self.assertEqual(
+            self._paires(),
+            {
+                (1, 2): (Interconnexion.Reseau.DR_I, Interconnexion.Liaison.FIL, "modbus"),
+                (2, 1): (Interconnexion.Reseau.DR_I, Interconnexion.Liaison.FIL, "modbus"),
+            },
+        )
+        self.assertEqual(Interconnexion.objects.get(systeme_from=1).pk, self.i1.pk)
+
+    def test_bulk_create_symetrique(self):
+        """Une création en masse crée aussi les symétriques"""
+        Interconnexion.objects.bulk_create([self.i1])
+        self.assertEqual(
+            self._paires(),
+            {
+                (1, 2): (Interconnexion.Reseau.A_C, Interconnexion.Liaison.BLUETOOTH, ""),
+                (2, 1): (Interconnexion.Reseau.A_C, Interconnexion.Liaison.BLUETOOTH, ""),
+            },
+        )
+
+    def test_delete_queryset(self):
+        """Une suppression en masse supprime aussi les symétriques, en une requête"""
+        Interconnexion.objects.relie([self.i1])
+        with self.assertNumQueries(1 + self.requetes_cartographie):
+            Interconnexion.objects.filter(systeme_from=1).delete()
+        self.assertEqual(Interconnexion.objects.count(), 0)
+
+    def test_delete_queryset_nombre_requetes(self):
+        """Supprimer une ou plusieurs interconnexions coûte le même nombre de requêtes"""
+        systeme = SystemeIndustriel.objects.get(pk=1)
+        voisins = SystemeIndustriel.objects.bulk_create(
+            [
+                SystemeIndustriel(
+                    localisation=systeme.localisation,
+                    nom=f"capteur {k}",
+                    environnement=SystemeIndustriel.Environnement.AUTRE,
+                    domaine_metier=systeme.domaine_metier,
+                )
+                for k in range(20)
+            ]
+        )
+        Interconnexion.objects.relie(
+            [
+                Interconnexion(
+                    systeme_from=systeme,
+                    systeme_to=k,
+                    type_reseau=Interconnexion.Reseau.A_C,
+                    type_liaison=Interconnexion.Liaison.FIL,
+                )
+                for k in voisins
+            ]
+        )
+        with self.assertNumQueries(1 + self.requetes_cartographie):
+            Interconnexion.objects.filter(systeme_from=systeme, systeme_to=voisins[0]).delete()
+        with self.assertNumQueries(1 + self.requetes_cartographie):
+            Interconnexion.objects.filter(systeme_from=systeme).delete()
+        self.assertEqual(Interconnexion.objects.count(), 0)
+
 
 @tag("models", "models-ordinateurs")
 class MaterielOrdinateurTest(TestCase):
@@ -497,3 +703,41 @@ class LicenceLogicielTest(TestCase):
     def test_str(self):
         """Affichage d'un matériel ordinateur/serveur"""
         self.assertEqual(str(self.l1), "windaube (Nulosoft) de Orléans - La Source - compteur billet")
+
+
+@tag("models", "models-index")
+class IndexTrigrammesTest(SimpleTestCase):
+    """Classe de test des index trigrammes de la recherche, créés seulement sous postgresql"""
+
+    modeles = (SystemeIndustriel, MaterielOrdinateur, MaterielEffecteur, LicenceLogiciel)
+
+    def test_index_ignores_hors_postgresql(self):
+        """Sous sqlite, la création et la suppression des index ne produisent aucune requête"""
+        editeur = connection.schema_editor(collect_sql=True)
+        for modele in self.modeles:
+            for index in modele._meta.indexes:
+                self.assertEqual(index.create_sql(modele, editeur), "")
+                self.assertEqual(index.remove_sql(modele, editeur), "")
+
+    def test_index_postgresql(self):
+        """Sous postgresql, l'index GIN porte sur la même expression que la recherche 'icontains'"""
+        postgresql = PostgresqlDatabaseWrapper(
+            {**connection.settings_dict, "ENGINE": "django.db.backends.postgresql", "NAME": "oasis"}, alias="pg"
+        )
+        editeur = postgresql.schema_editor(collect_sql=True)
+        self.assertEqual(
+            [str(k.create_sql(SystemeIndustriel, editeur)) for k in SystemeIndustriel._meta.indexes],
+            ['CREATE INDEX "systeme_nom_trgm" ON "inventaire_systeme" USING gin ((UPPER("nom") gin_trgm_ops))'],
+        )
+        self.assertEqual(
+            sorted(k.name for modele in self.modeles for k in modele._meta.indexes),
+            [
+                "effecteur_marque_trgm",
+                "effecteur_modele_trgm",
+                "licence_editeur_trgm",
+                "licence_logiciel_trgm",
+                "ordinateur_marque_trgm",
+                "ordinateur_modele_trgm",
+                "systeme_nom_trgm",
+            ],
+        )
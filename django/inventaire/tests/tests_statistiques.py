@@ -0,0 +1,246 @@
+"""Définition des tests unitaires de l'inventaire pour les statistiques du tableau de bord"""
+
+import logging
+from datetime import date
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+
+from inventaire.models import (
+    ContratMaintenance,
+    DomaineMetier,
+    LicenceLogiciel,
+    Localisation,
+    MaterielOrdinateur,
+    StatistiquesZone,
+    SystemeIndustriel,
+    ZoneUsid,
+)
+from inventaire.statistiques import calcule_statistiques_zone, statistiques_accueil
+from inventaire.tasks import rafraichit_statistiques
+
+
+logger = logging.getLogger(__name__)
+
+
+class BaseStatistiquesTest(TestCase):
+    """Deux systèmes à Angers, une ville d'Angers sans système, un système à Rennes et un contrat à Angers"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.domaine_gt = DomaineMetier.objects.create(code="GT", nom="gestion technique", coeff_criticite=2)
+        cls.domaine_si = DomaineMetier.objects.create(code="SI", nom="sécurité incendie", coeff_criticite=3)
+        cls.angers = Localisation.objects.create(
+            zone_usid=ZoneUsid.AMS,
+            nom_ville="Angers",
+            nom_quartier="Verneau",
+            protection=Localisation.Protection.TM,
+            sensibilite=Localisation.Sensibilite.HAUTE,
+        )
+        Localisation.objects.create(  # une ville sans système
+            zone_usid=ZoneUsid.AMS,
+            nom_ville="Saumur",
+            nom_quartier="Ecole",
+            protection=Localisation.Protection.TM,
+            sensibilite=Localisation.Sensibilite.MOINDRE,
+        )
+        cls.rennes = Localisation.objects.create(
+            zone_usid=ZoneUsid.RVC,
+            nom_ville="Rennes",
+            nom_quartier="Maurepas",
+            protection=Localisation.Protection.TM,
+            sensibilite=Localisation.Sensibilite.HAUTE,
+        )
+        SystemeIndustriel.objects.create(
+            localisation=cls.angers,
+            nom="chaufferie",
+            environnement=SystemeIndustriel.Environnement.AUTRE,
+            domaine_metier=cls.domaine_gt,
+            homologation_classe=SystemeIndustriel.ClasseHomologation.C1,
+            homologation_fin=date(2020, 1, 1),
+        )
+        SystemeIndustriel.objects.create(  # celui-ci est dans la corbeille mais compte
+            localisation=cls.angers,
+            nom="détection",
+            environnement=SystemeIndustriel.Environnement.AUTRE,
+            domaine_metier=cls.domaine_si,
+            fiche_corbeille=True,
+        )
+        SystemeIndustriel.objects.create(
+            localisation=cls.rennes,
+            nom="chaufferie rennaise",
+            environnement=SystemeIndustriel.Environnement.AUTRE,
+            domaine_metier=cls.domaine_gt,
+            homologation_classe=SystemeIndustriel.ClasseHomologation.C1,
+        )
+        MaterielOrdinateur.objects.create(
+            systeme=SystemeIndustriel.objects.get(nom="chaufferie"),
+            fonction=MaterielOrdinateur.Fonction.SUPER,
+            marque="extreme pc",
+            modele="Xtrem pro max",
+            os_famille=MaterielOrdinateur.FamilleOs.WIN_P_11,
+        )
+        LicenceLogiciel.objects.create(
+            systeme=SystemeIndustriel.objects.get(nom="détection"),
+            editeur="ankamou",
+            logiciel="fodus",
+            version="1234",
+            licence="123456789",
+            date_fin=date(2021, 1, 1),
+        )
+        cls.contrat = ContratMaintenance.objects.create(
+            zone_usid=ZoneUsid.AMS,
+            numero_marche="AMS-001",
+            date_fin=date(2030, 1, 1),
+            nom_societe="Chaud devant",
+            est_actif=True,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+
+@tag("statistiques", "statistiques-accueil")
+class StatistiquesAccueilTest(BaseStatistiquesTest):
+    """Classe de test des statistiques de la page d'accueil"""
+
+    def test_statistiques_une_zone(self):
+        """Les statistiques d'une zone comptent la corbeille et les villes sans système"""
+        self.assertDictEqual(
+            statistiques_accueil([ZoneUsid.AMS]),
+            {
+                "total_systemes": 2,
+                "total_contrats": 1,
+                "stat": {
+                    "pie_domaine_metier": {"label": ["gestion technique", "sécurité incendie"], "data": [1, 1]},
+                    "pie_nom_ville": {"label": ["Angers", "Saumur"], "data": [2, 0]},
+                    "pie_homologation_classe": {"label": ["démarche sommaire", "non homologué"], "data": [1, 1]},
+                },
+            },
+        )
+
+    def test_statistiques_plusieurs_zones(self):
+        """Les statistiques de plusieurs zones sont agrégées"""
+        statistiques = statistiques_accueil([ZoneUsid.RVC, ZoneUsid.AMS])
+        self.assertEqual(statistiques["total_systemes"], 3)
+        self.assertEqual(statistiques["stat"]["pie_domaine_metier"]["data"], [2, 1])
+        self.assertEqual(statistiques["stat"]["pie_nom_ville"]["label"], ["Angers", "Rennes", "Saumur"])
+
+    def test_statistiques_aucune_zone(self):
+        """Un utilisateur sans zone n'a aucune statistique et ne fait aucune requête"""
+        with self.assertNumQueries(0):
+            statistiques = statistiques_accueil([])
+        self.assertEqual(statistiques["total_systemes"], 0)
+        self.assertEqual(statistiques["stat"]["pie_nom_ville"], {"label": [], "data": []})
+
+    def test_statistiques_requetes(self):
+        """Sans statistiques précalculées, elles sont calculées en deux requêtes puis lues depuis le cache"""
+        with self.assertNumQueries(3):
+            statistiques_accueil(ZoneUsid.values)
+        with self.assertNumQueries(0):
+            statistiques_accueil(ZoneUsid.values)
+
+    def test_statistiques_invalidation_systeme(self):
+        """La mise à la corbeille ou le déplacement d'un système invalide les zones concernées"""
+        statistiques_accueil([ZoneUsid.AMS])
+        statistiques_accueil([ZoneUsid.RVC])
+        systeme = SystemeIndustriel.objects.get(localisation=self.angers, nom="chaufferie")
+        systeme.localisation = self.rennes
+        systeme.save()
+        with self.assertNumQueries(3):
+            self.assertEqual(statistiques_accueil([ZoneUsid.AMS])["total_systemes"], 1)
+        with self.assertNumQueries(3):
+            self.assertEqual(statistiques_accueil([ZoneUsid.RVC])["total_systemes"], 2)
+
+    def test_statistiques_invalidation_contrat(self):
+        """La création d'un contrat invalide sa zone mais pas les autres"""
+        statistiques_accueil([ZoneUsid.AMS])
+        statistiques_accueil([ZoneUsid.RVC])
+        ContratMaintenance.objects.create(
+            zone_usid=ZoneUsid.AMS,
+            numero_marche="AMS-002",
+            date_fin=date(2030, 1, 1),
+            nom_societe="Froid derrière",
+            est_actif=True,
+        )
+        with self.assertNumQueries(3):
+            self.assertEqual(statistiques_accueil([ZoneUsid.AMS])["total_contrats"], 2)
+        with self.assertNumQueries(0):
+            statistiques_accueil([ZoneUsid.RVC])
+
+    def test_statistiques_zone_avant_sans_requete(self):
+        """La zone d'avant modification est retenue au chargement, sans relecture à chaque sauvegarde"""
+        contrat = ContratMaintenance.objects.get(numero_marche="AMS-001")
+        contrat.nom_societe = "Chaud devant"
+        with CaptureQueriesContext(connection) as requetes:
+            contrat.save()
+        self.assertFalse([k["sql"] for k in requetes.captured_queries if k["sql"].startswith("SELECT")])
+        contrat.zone_usid = ZoneUsid.RVC
+        statistiques_accueil([ZoneUsid.AMS])
+        contrat.save()
+        with self.assertNumQueries(3):
+            self.assertEqual(statistiques_accueil([ZoneUsid.AMS])["total_contrats"], 0)
+
+    def test_statistiques_invalidation_domaine(self):
+        """Le renommage d'un domaine métier invalide toutes les zones"""
+        statistiques_accueil([ZoneUsid.RVC])
+        self.domaine_gt.nom = "gestion technique bâtimentaire"
+        self.domaine_gt.save()
+        self.assertEqual(
+            statistiques_accueil([ZoneUsid.RVC])["stat"]["pie_domaine_metier"]["label"],
+            ["gestion technique bâtimentaire"],
+        )
+
+
+@tag("statistiques", "statistiques-zones")
+class StatistiquesZoneTest(BaseStatistiquesTest):
+    """Classe de test des statistiques précalculées par zone d'USID"""
+
+    def setUp(self):
+        super().setUp()
+        rafraichit_statistiques()
+
+    def test_calcule_statistiques_zone(self):
+        """Les statistiques d'une zone couvrent les environnements, les OS et les expirations"""
+        statistiques = calcule_statistiques_zone(ZoneUsid.AMS)
+        self.assertEqual(statistiques["total_systemes"], 2)
+        self.assertEqual(statistiques["homologations_expirant"], 1)
+        self.assertEqual(statistiques["licences_expirant"], 1)
+        self.assertDictEqual(
+            statistiques["repartitions"]["environnement"],
+            {str(SystemeIndustriel.Environnement.AUTRE.value): 2},
+        )
+        self.assertDictEqual(
+            statistiques["repartitions"]["os_famille"],
+            {str(MaterielOrdinateur.FamilleOs.WIN_P_11.value): 1},
+        )
+
+    def test_rafraichit_statistiques(self):
+        """La tâche périodique enregistre une ligne à jour pour chaque zone"""
+        self.assertEqual(StatistiquesZone.objects.filter(a_jour=True).count(), len(ZoneUsid))
+        self.assertEqual(StatistiquesZone.objects.get(zone_usid=ZoneUsid.RVC).total_systemes, 1)
+
+    def test_statistiques_requetes(self):
+        """Les statistiques précalculées de toutes les zones sont lues en une requête puis depuis le cache"""
+        with self.assertNumQueries(1):
+            self.assertEqual(statistiques_accueil(ZoneUsid.values)["total_systemes"], 3)
+        with self.assertNumQueries(0):
+            statistiques_accueil(ZoneUsid.values)
+
+    def test_statistiques_perimees(self):
+        """Une modification dans une zone périme ses statistiques précalculées, et seulement les siennes"""
+        ContratMaintenance.objects.create(
+            zone_usid=ZoneUsid.AMS,
+            numero_marche="AMS-002",
+            date_fin=date(2030, 1, 1),
+            nom_societe="Froid derrière",
+            est_actif=True,
+        )
+        self.assertFalse(StatistiquesZone.objects.get(zone_usid=ZoneUsid.AMS).a_jour)
+        self.assertTrue(StatistiquesZone.objects.get(zone_usid=ZoneUsid.RVC).a_jour)
+        with self.assertNumQueries(1):
+            statistiques_accueil([ZoneUsid.RVC])
+        with self.assertNumQueries(3):
+            self.assertEqual(statistiques_accueil([ZoneUsid.AMS])["total_contrats"], 2)
@@ -0,0 +1,794 @@
+"""Définition des tests unitaires de l'inventaire pour les tâches de fond"""
+
+import logging
+import threading
+from datetime import date
+from io import BytesIO
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import mock
+from zipfile import ZipFile
+from xml.sax.saxutils import escape
+
+from celery import chain
+from django.db import DatabaseError, connection
+from django.test import SimpleTestCase, TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+
+from inventaire.lecteur_excel import ClasseurExcel, LecteurExcelError, index_colonne
+from inventaire.models import (
+    Localisation,
+    MaterielEffecteur,
+    MaterielOrdinateur,
+    SystemeIndustriel,
+    ZoneUsid,
+)
+from inventaire.stockage import enregistre_fichier_import
+from inventaire.tasks.importe_excel import (
+    ETAT_PROGRESSION,
+    Avancement,
+    ImporteExcel,
+    ImporteExcelError,
+    StructureFonctionMetier,
+    StructureLocalisation,
+    StructureMaterielEffecteur,
+    StructureMaterielOrdinateur,
+    StructureSystemeIndustriel,
+    importe_excel,
+)
+from inventaire.tasks.importe_lot import agrege_resultats, vagues_import_lot
+from inventaire.utils import CeleryResult, CeleryResultMessageType, CeleryResultStatus, PolitiqueImport
+
+
+logger = logging.getLogger(__name__)
+
+
+def _colonne(index: int) -> str:
+    """Nom de la colonne excel à partir de son index (0 -> A, 26 -> AA)"""
+    nom = ""
+    index += 1
+    while index:
+        index, reste = divmod(index - 1, 26)
+        nom = chr(ord("A") + reste) + nom
+    return nom
+
+
+class TexteEnLigne(str):
+    """Une chaîne écrite directement dans la cellule plutôt que dans la table des chaînes partagées"""
+
+
+def _cellule(reference: str, valeur, chaines: dict) -> str:
+    """Le xml d'une cellule selon le type de sa valeur"""
+    if isinstance(valeur, TexteEnLigne):
+        return f'<c r="{reference}" t="inlineStr"><is><t>{escape(valeur)}</t></is></c>'
+    if isinstance(valeur, str):
+        index = chaines.setdefault(valeur, len(chaines))
+        return f'<c r="{reference}" t="s"><v>{index}</v></c>'
+    if isinstance(valeur, bool):
+        return f'<c r="{reference}" t="b"><v>{int(valeur)}</v></c>'
+    if isinstance(valeur, date):
+        return f'<c r="{reference}" s="1"><v>{(valeur - date(1899, 12, 30)).days}</v></c>'
+    return f'<c r="{reference}"><v>{valeur}</v></c>'
+
+
+def cree_excel(onglets: dict[str, list[list]], dimension: bool = True) -> bytes:
+    """Crée un fichier excel minimal
+
+    Les chaînes sont écrites dans la table des chaînes partagées, les dates avec un style de date, et comme excel, les
+    cellules et les lignes vides ne sont pas écrites. La dimension de chaque onglet est écrite si 'dimension'.
+    """
+    noms = list(onglets)
+    chaines = {}
+    feuilles = []
+    for nom in noms:
+        largeur = max((len(k) for k in onglets[nom]), default=1)
+        entete = f'<dimension ref="A1:{_colonne(largeur - 1)}{max(len(onglets[nom]), 1)}"/>' if dimension else ""
+        lignes = []
+        for numero, ligne in enumerate(onglets[nom], start=1):
+            cellules = "".join(
+                _cellule(f"{_colonne(k)}{numero}", v, chaines) for k, v in enumerate(ligne) if v not in ("", None)
+            )
+            if cellules:
+                lignes.append(f'<row r="{numero}">{cellules}</row>')
+        feuilles.append(
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            f"{entete}<sheetData>{''.join(lignes)}</sheetData></worksheet>"
+        )
+
+    fichier = BytesIO()
+    with ZipFile(fichier, "w") as z:
+        z.writestr(
+            "[Content_Types].xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/sharedStrings.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            + "".join(
+                f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+                for i in range(1, len(noms) + 1)
+            )
+            + "</Types>",
+        )
+        z.writestr(
+            "_rels/.rels",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="xl/workbook.xml"/>'
+            "</Relationships>",
+        )
+        z.writestr(
+            "xl/workbook.xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"><sheets>'
+            + "".join(
+                f'<sheet name="{escape(nom)}" sheetId="{i}" r:id="rId{i}"/>' for i, nom in enumerate(noms, start=1)
+            )
+            + "</sheets></workbook>",
+        )
+        z.writestr(
+            "xl/_rels/workbook.xml.rels",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + "".join(
+                f'<Relationship Id="rId{i}" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                f'Target="worksheets/sheet{i}.xml"/>'
+                for i in range(1, len(noms) + 1)
+            )
+            + '<Relationship Id="rIdChaines" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+            'Target="sharedStrings.xml"/>'
+            '<Relationship Id="rIdStyles" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+            'Target="styles.xml"/>'
+            "</Relationships>",
+        )
+        z.writestr(
+            "xl/sharedStrings.xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            + "".join(f"<si><t>{escape(k)}</t></si>" for k in chaines)
+            + "</sst>",
+        )
+        z.writestr(
+            "xl/styles.xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            '<cellXfs count="2"><xf numFmtId="0"/><xf numFmtId="14" applyNumberFormat="1"/></cellXfs>'
+            "</styleSheet>",
+        )
+        for i, feuille in enumerate(feuilles, start=1):
+            z.writestr(f"xl/worksheets/sheet{i}.xml", feuille)
+    return fichier.getvalue()
+
+
+def ligne_s2i(id_excel: str, nom: str, domaine="GT_gestion technique", fonctions="(GTB-GTS)", **kwargs) -> list:
+    """Une ligne de l'onglet S2I, les colonnes non renseignées sont vides"""
+    ligne = [""] * 27
+    ligne[0] = id_excel
+    ligne[1] = nom
+    ligne[2] = kwargs.get("numero_gtp", "")
+    ligne[3] = kwargs.get("zone", "USID_ANGERS")
+    ligne[4] = kwargs.get("ville", "Angers")
+    ligne[5] = kwargs.get("quartier", "Verneau")
+    ligne[7] = "TM"
+    ligne[8] = "HAUTE"
+    ligne[9] = kwargs.get("environnement", "autre")
+    ligne[10] = domaine
+    ligne[11] = f"{nom} {fonctions}"
+    ligne[14] = "sommaire (1)"
+    ligne[26] = kwargs.get("description", "")
+    return ligne
+
+
+def ligne_ordinateur(id_excel: str, nombre="1") -> list:
+    """Une ligne de l'onglet PC - SERVEUR"""
+    ligne = [""] * 15
+    ligne[0] = id_excel
+    ligne[8] = "poste de supervision"
+    ligne[9] = "Dell"
+    ligne[10] = "Optiplex"
+    ligne[11] = "windows 10"
+    ligne[12] = "22H2"
+    ligne[13] = nombre
+    return ligne
+
+
+def ligne_materiel(id_excel: str) -> list:
+    """Une ligne de l'onglet EQUIPEMENTS DIVERS"""
+    ligne = [""] * 15
+    ligne[0] = id_excel
+    ligne[7] = "automate"
+    ligne[8] = "Siemens"
+    ligne[9] = "S7-1200"
+    ligne[13] = "2"
+    return ligne
+
+
+def cree_excel_s2i(s2i: list, ordinateurs: list = (), materiels: list = ()) -> bytes:
+    """Crée un fichier excel d'import, avec trois lignes d'entête par onglet"""
+    entete = [["entête"]] * 3
+    return cree_excel(
+        {
+            "S2I": entete + list(s2i),
+            "PC - SERVEUR": entete + list(ordinateurs),
+            "EQUIPEMENTS DIVERS": entete + list(materiels),
+        }
+    )
+
+
+@tag("tasks", "tasks-import")
+class ImporteExcelTest(TestCase):
+    """Classe de test de l'import des systèmes depuis un fichier excel"""
+
+    fixtures = ["inventaire/metiers.json"]
+
+    def setUp(self):
+        dossier = TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        reglages = override_settings(IMPORT_DOSSIER=Path(dossier.name))
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def importe(self, fichier: bytes, politique=PolitiqueImport.GARDE_VALIDES, **kwargs):
+        nom = enregistre_fichier_import([fichier])
+        return ImporteExcel(ZoneUsid.AMS, nom, politique=politique, **kwargs).main()
+
+    def test_import_complet(self):
+        """Les localisations, systèmes, fonctions et matériels sont créés et liés entre eux"""
+        resultat = self.importe(
+            cree_excel_s2i(
+                [
+                    ligne_s2i("s1", "Chaufferie", numero_gtp="GTP-1"),
+                    ligne_s2i("s2", "Détection", domaine="SI_sécurité incendie", fonctions="(DIN)"),
+                    ligne_s2i("s3", "Ascenseur", domaine="MA_manutention", fonctions="(ASC)", quartier="Ecole"),
+                ],
+                ordinateurs=[ligne_ordinateur("s1"), ligne_ordinateur("s2", nombre="3")],
+                materiels=[ligne_materiel("s1")],
+            )
+        )
+        self.assertEqual(resultat.status, CeleryResultStatus.OK, resultat.messages)
+        self.assertEqual(Localisation.objects.filter(zone_usid=ZoneUsid.AMS).count(), 2)
+        chaufferie = SystemeIndustriel.objects.get(nom="chaufferie")
+        self.assertEqual(chaufferie.numero_gtp, "GTP-1")
+        self.assertEqual(chaufferie.localisation.nom_quartier, "verneau")
+        self.assertCountEqual(chaufferie.fonctions_metiers.values_list("code", flat=True), ["GTB", "GTS"])
+        self.assertEqual(chaufferie.materiels_it.get().nombre, 1)
+        self.assertEqual(chaufferie.materiels_ot.get().type, MaterielEffecteur.Type.AUTOMATE)
+        self.assertEqual(MaterielOrdinateur.objects.get(systeme__nom="détection").nombre, 3)
+
+    def test_import_fichier_invalide(self):
+        """Un fichier absent du dossier partagé, ou un nom hors du dossier, est une erreur fatale"""
+        for nom in ("0" * 64 + ".xlsx", "../../settings.py"):
+            resultat = ImporteExcel(ZoneUsid.AMS, nom).main()
+            self.assertEqual(resultat.status, CeleryResultStatus.FATAL)
+            self.assertIn("erreur dans la lecture du fichier excel", resultat.messages[-1][1])
+
+    def test_import_criticite(self):
+        """La criticité des systèmes importés est calculée malgré l'absence de signaux"""
+        self.importe(cree_excel_s2i([ligne_s2i("s1", "Chaufferie")]))
+        chaufferie = SystemeIndustriel.objects.get(nom="chaufferie")
+        self.assertGreater(chaufferie.indice_criticite, 0)
+        self.assertEqual(chaufferie.indice_criticite, chaufferie.criticite())
+
+    def test_import_fonction_gtc(self):
+        """La fonction GTC, présente dans plusieurs domaines, n'est liée qu'à celle du domaine du système"""
+        self.importe(cree_excel_s2i([ligne_s2i("s1", "Détection", domaine="SI_sécurité incendie", fonctions="(GTC)")]))
+        fonction = SystemeIndustriel.objects.get(nom="détection").fonctions_metiers.get()
+        self.assertEqual(fonction.domaine.code, "SI")
+
+    def test_import_mise_a_jour(self):
+        """Un second import met à jour les systèmes existants sans créer de doublons"""
+        self.importe(cree_excel_s2i([ligne_s2i("s1", "Chaufferie", description="v1")]))
+        resultat = self.importe(cree_excel_s2i([ligne_s2i("s1", "Chaufferie", description="v2")]))
+        self.assertEqual(resultat.status, CeleryResultStatus.OK)
+        self.assertIn("système industriel angers - verneau - chaufferie mis à jour", [k[1] for k in resultat.messages])
+        chaufferie = SystemeIndustriel.objects.get(nom="chaufferie")
+        self.assertEqual(chaufferie.description, "v2")
+        self.assertEqual(chaufferie.fonctions_metiers.count(), 2)
+
+    def test_import_ligne_courte(self):
+        """Les cellules vides en fin de ligne ne sont pas nécessaires"""
+        resultat = self.importe(cree_excel_s2i([ligne_s2i("s1", "Chaufferie")[:15]]))
+        self.assertEqual(resultat.status, CeleryResultStatus.OK, resultat.messages)
+        self.assertEqual(SystemeIndustriel.objects.get(nom="chaufferie").description, "")
+
+    def test_import_erreur_s2i(self):
+        """Une erreur dans l'onglet S2I empêche l'import des matériels, les S2I valides sont enregistrés"""
+        resultat = self.importe(
+            cree_excel_s2i(
+                [ligne_s2i("s1", "Chaufferie"), ligne_s2i("s2", "Inconnu", environnement="martien")],
+                ordinateurs=[ligne_ordinateur("s1")],
+            )
+        )
+        self.assertEqual(resultat.status, CeleryResultStatus.MAJOR)
+        self.assertIn("import S2I - erreur pour la ligne n°5", resultat.messages[0][1])
+        self.assertTrue(SystemeIndustriel.objects.filter(nom="chaufferie").exists())
+        self.assertFalse(MaterielOrdinateur.objects.exists())
+
+    def test_import_erreur_materiel(self):
+        """Un matériel lié à un système inconnu est une erreur mineure, les autres sont importés"""
+        resultat = self.importe(
+            cree_excel_s2i(
+                [ligne_s2i("s1", "Chaufferie")],
+                ordinateurs=[ligne_ordinateur("s1"), ligne_ordinateur("s9"), ligne_ordinateur("s1", nombre="x")],
+            )
+        )
+        self.assertEqual(resultat.status, CeleryResultStatus.MINOR)
+        erreurs = [k[1] for k in resultat.messages if k[1].startswith("import ordinateur/serveur")]
+        self.assertEqual(len(erreurs), 2)
+        self.assertIn("ligne n°5 : impossible de créer le matériel car le système lié est introuvable", erreurs[0])
+        self.assertIn("ligne n°6 : Colonne 14", erreurs[1])
+        self.assertEqual(MaterielOrdinateur.objects.count(), 1)
+
+    @override_settings(IMPORT_AVANCEMENT_INTERVALLE=0)
+    def test_import_progression(self):
+        """L'avancement de chaque onglet est publié pendant l'analyse, puis à l'enregistrement"""
+        publications = []
+        self.importe(
+            cree_excel_s2i(
+                [ligne_s2i("s1", "Chaufferie"), ligne_s2i("s2", "Détection", domaine="inconnu")],
+                ordinateurs=[ligne_ordinateur("s1")],
+            ),
+            progression=publications.append,
+        )
+        self.assertEqual(publications[0]["etape"], Avancement.ANALYSE)
+        derniere = publications[-1]
+        self.assertEqual(derniere["etape"], Avancement.ENREGISTREMENT)
+        self.assertEqual(derniere["onglets"]["import S2I"], {"lignes": 2, "total": 2, "erreurs": 1})
+        self.assertEqual(derniere["onglets"]["import ordinateur/serveur"], {"lignes": 1, "total": 1, "erreurs": 0})
+        self.assertEqual((derniere["lignes"], derniere["total"]), (3, 3))
+
+    @override_settings(IMPORT_AVANCEMENT_INTERVALLE=0)
+    def test_tache_progression(self):
+        """La tâche publie l'avancement sous son identifiant, y compris depuis les threads d'analyse des matériels"""
+        nom = enregistre_fichier_import(
+            [cree_excel_s2i([ligne_s2i("s1", "Chaufferie")], ordinateurs=[ligne_ordinateur("s1")])]
+        )
+        publications = []
+
+        def update_state(task_id=None, state=None, meta=None):
+            publications.append((task_id, state, threading.get_ident()))
+
+        with mock.patch.object(importe_excel, "update_state", update_state):
+            task = importe_excel.apply(args=(ZoneUsid.AMS, nom, 0, False))
+        self.assertEqual(task.state, "SUCCESS", task.traceback)
+        self.assertEqual(CeleryResult.model_validate(task.result).status, CeleryResultStatus.OK)
+        self.assertEqual(SystemeIndustriel.objects.count(), 1)
+        self.assertEqual({(k, etat) for k, etat, _ in publications}, {(task.id, ETAT_PROGRESSION)})
+        self.assertGreater(len({fil for _, _, fil in publications}), 1)
+
+    def test_import_onglets_paralleles(self):
+        """Les onglets des matériels sont analysés pendant celui des S2I, dans d'autres fils d'exécution"""
+        fils = set()
+        analyse = ImporteExcel._analyse_ligne_ordinateur
+
+        def espionne(importeur, numero, ligne):
+            fils.add(threading.get_ident())
+            return analyse(importeur, numero, ligne)
+
+        with mock.patch.object(ImporteExcel, "_analyse_ligne_ordinateur", espionne):
+            resultat = self.importe(cree_excel_s2i([ligne_s2i("s1", "Chaufferie")], ordinateurs=[ligne_ordinateur("s1")]))
+        self.assertEqual(resultat.status, CeleryResultStatus.OK, resultat.messages)
+        self.assertEqual(MaterielOrdinateur.objects.count(), 1)
+        self.assertTrue(fils)
+        self.assertNotIn(threading.get_ident(), fils)
+
+    def test_import_nettoie(self):
+        """Le nettoyage supprime les systèmes de la zone absents du fichier"""
+        self.importe(cree_excel_s2i([ligne_s2i("s1", "Chaufferie")]))
+        self.importe(cree_excel_s2i([ligne_s2i("s1", "Climatisation")]), nettoie=True)
+        self.assertQuerySetEqual(SystemeIndustriel.objects.values_list("nom", flat=True), ["climatisation"])
+
+    def test_import_annule_erreur_s2i(self):
+        """Avec la politique 'ANNULE', une erreur défait tout l'import, nettoyage de la zone compris"""
+        self.importe(cree_excel_s2i([ligne_s2i("s1", "Chaufferie")]))
+        resultat = self.importe(
+            cree_excel_s2i([ligne_s2i("s1", "Climatisation"), ligne_s2i("s2", "Inconnu", environnement="martien")]),
+            nettoie=True,
+            politique=PolitiqueImport.ANNULE,
+        )
+        self.assertEqual(resultat.status, CeleryResultStatus.FATAL)
+        self.assertIn("aucune modification n'a été enregistrée", resultat.messages[-1][1])
+        self.assertQuerySetEqual(SystemeIndustriel.objects.values_list("nom", flat=True), ["chaufferie"])
+
+    def test_import_annule_erreur_materiel(self):
+        """Avec la politique 'ANNULE', une erreur sur un matériel empêche aussi l'import des S2I"""
+        resultat = self.importe(
+            cree_excel_s2i([ligne_s2i("s1", "Chaufferie")], materiels=[ligne_materiel("s9")]),
+            politique=PolitiqueImport.ANNULE,
+        )
+        self.assertEqual(resultat.status, CeleryResultStatus.FATAL)
+        self.assertFalse(SystemeIndustriel.objects.exists())
+        self.assertFalse(Localisation.objects.exists())
+
+    def test_analyse_interrompue(self):
+        """Avec la politique 'ANNULE', la première erreur d'un onglet interrompt l'analyse de tous les onglets"""
+        importeur = ImporteExcel(ZoneUsid.AMS, "interruption.xlsx", politique=PolitiqueImport.ANNULE)
+        importeur.avancement.ajoute_onglet("test", 5)
+        importeur.avancement.ajoute_onglet("autre", 5)
+        lues = []
+
+        def lignes():
+            for numero in range(1, 6):
+                lues.append(numero)
+                yield numero, []
+
+        def analyse(numero: int, ligne: list) -> int:
+            if numero == 2:
+                raise ImporteExcelError("ligne invalide")
+            return numero
+
+        arret = threading.Event()
+        valides, erreurs = importeur._analyse_onglet(lignes(), analyse, "test", arret)
+        self.assertTrue(arret.is_set())
+        self.assertEqual(valides, [1])
+        self.assertEqual([numero for numero, _ in erreurs], [2])
+        self.assertEqual(lues, [1, 2, 3])
+        # un autre onglet partageant l'arrêt n'est pas analysé
+        self.assertEqual(importeur._analyse_onglet(lignes(), analyse, "autre", arret), ([], []))
+
+    def test_import_annule_erreur_analyse_materiel(self):
+        """Une erreur d'analyse d'un matériel annule l'import sans rapporter de systèmes liés introuvables"""
+        materiel = ligne_materiel("s1")
+        materiel[7] = "martien"
+        resultat = self.importe(
+            cree_excel_s2i([ligne_s2i("s1", "Chaufferie")], materiels=[materiel]),
+            politique=PolitiqueImport.ANNULE,
+        )
+        self.assertEqual(resultat.status, CeleryResultStatus.FATAL)
+        self.assertIn("matériels intelligents - erreur pour la ligne n°4", resultat.messages[0][1])
+        self.assertFalse(any("introuvable" in message for _, message in resultat.messages))
+        self.assertFalse(SystemeIndustriel.objects.exists())
+
+    def test_import_erreur_base_de_donnee(self):
+        """Un onglet refusé par la base de donnée est défait seul, sauf avec la politique 'ANNULE'"""
+        fichier = cree_excel_s2i(
+            [ligne_s2i("s1", "Chaufferie")],
+            ordinateurs=[ligne_ordinateur("s1")],
+            materiels=[ligne_materiel("s1")],
+        )
+        with mock.patch.object(MaterielEffecteur.objects, "bulk_create", side_effect=DatabaseError("refusé")):
+            resultat = self.importe(fichier, politique=PolitiqueImport.ANNULE)
+            self.assertEqual(resultat.status, CeleryResultStatus.FATAL)
+            self.assertFalse(SystemeIndustriel.objects.exists())
+
+            resultat = self.importe(fichier)
+        self.assertEqual(resultat.status, CeleryResultStatus.MINOR)
+        self.assertIn("matériels intelligents - erreur de la base de donnée", resultat.messages[-2][1])
+        self.assertEqual(MaterielOrdinateur.objects.count(), 1)
+        self.assertFalse(MaterielEffecteur.objects.exists())
+
+    def test_import_doublon(self):
+        """Un ID excel ou un système déjà présent dans l'onglet S2I est une erreur"""
+        resultat = self.importe(
+            cree_excel_s2i(
+                [ligne_s2i("s1", "Chaufferie"), ligne_s2i("s1", "Climatisation"), ligne_s2i("s2", "Chaufferie")]
+            )
+        )
+        self.assertEqual(resultat.status, CeleryResultStatus.MAJOR)
+        self.assertIn("l'ID excel 's1' est déjà utilisé à la ligne n°4", resultat.messages[0][1])
+        self.assertIn("le système industriel est déjà décrit à la ligne n°4", resultat.messages[1][1])
+        self.assertQuerySetEqual(SystemeIndustriel.objects.values_list("nom", flat=True), ["chaufferie"])
+
+    def test_import_dry_run(self):
+        """La simulation produit le compte-rendu complet de l'import sans rien écrire dans la base de donnée"""
+        self.importe(cree_excel_s2i([ligne_s2i("s1", "Chaufferie", description="v1")]))
+        fichier = cree_excel_s2i(
+            [
+                ligne_s2i("s1", "Chaufferie", description="v2"),
+                ligne_s2i("s2", "Ascenseur", domaine="MA_manutention", fonctions="(ASC)", quartier="Ecole"),
+            ],
+            ordinateurs=[ligne_ordinateur("s1"), ligne_ordinateur("s9")],
+        )
+        with CaptureQueriesContext(connection) as requetes:
+            resultat = self.importe(fichier, dry_run=True)
+        self.assertEqual(resultat.status, CeleryResultStatus.MINOR)
+        messages = [k[1] for k in resultat.messages]
+        self.assertIn("localisation angers - ecole créée", messages)
+        self.assertIn("système industriel angers - ecole - ascenseur créé", messages)
+        self.assertIn("système industriel angers - verneau - chaufferie mis à jour", messages)
+        self.assertIn("import ordinateur/serveur - erreur pour la ligne n°5", " ".join(messages))
+        self.assertIn("aucune modification n'a été enregistrée", messages[-1])
+        for requete in requetes:
+            self.assertRegex(requete["sql"], r"^(SELECT|SAVEPOINT|RELEASE SAVEPOINT)")
+        self.assertEqual(SystemeIndustriel.objects.get().description, "v1")
+        self.assertFalse(MaterielOrdinateur.objects.exists())
+
+    def test_import_dry_run_nettoie(self):
+        """En simulation avec nettoyage, les systèmes existants de la zone sont ignorés sans être supprimés"""
+        self.importe(cree_excel_s2i([ligne_s2i("s1", "Chaufferie")]))
+        resultat = self.importe(cree_excel_s2i([ligne_s2i("s1", "Chaufferie")]), nettoie=True, dry_run=True)
+        self.assertEqual(resultat.status, CeleryResultStatus.OK)
+        self.assertIn("système industriel angers - verneau - chaufferie créé", [k[1] for k in resultat.messages])
+        self.assertEqual(SystemeIndustriel.objects.count(), 1)
+
+    def test_import_differentiel_inchange(self):
+        """Un fichier déjà importé n'entraîne aucune écriture et ne duplique pas les matériels"""
+        fichier = cree_excel_s2i(
+            [ligne_s2i("s1", "Chaufferie", description="v1")],
+            ordinateurs=[ligne_ordinateur("s1"), ligne_ordinateur("s1")],
+            materiels=[ligne_materiel("s1")],
+        )
+        self.importe(fichier)
+        with CaptureQueriesContext(connection) as requetes:
+            resultat = self.importe(fichier, differentiel=True)
+        self.assertEqual(resultat.status, CeleryResultStatus.OK, resultat.messages)
+        messages = [k[1] for k in resultat.messages]
+        self.assertIn("import S2I - 0 créés, 0 mis à jour, 0 supprimés, 1 inchangés", messages)
+        self.assertIn("ordinateurs - 0 créés, 0 supprimés, 2 inchangés", messages)
+        self.assertIn("matériels intelligents - 0 créés, 0 supprimés, 1 inchangés", messages)
+        for requete in requetes:
+            self.assertRegex(requete["sql"], r"^(SELECT|SAVEPOINT|RELEASE SAVEPOINT)")
+        self.assertEqual(MaterielOrdinateur.objects.count(), 2)
+        self.assertEqual(MaterielEffecteur.objects.count(), 1)
+
+    def test_import_differentiel(self):
+        """Seuls les créations, mises à jour et suppressions nécessaires sont enregistrées"""
+        self.importe(
+            cree_excel_s2i(
+                [ligne_s2i("s1", "Chaufferie", description="v1"), ligne_s2i("s2", "Climatisation", quartier="Ecole")],
+                ordinateurs=[ligne_ordinateur("s1"), ligne_ordinateur("s1", nombre="2")],
+            )
+        )
+        ordinateur = MaterielOrdinateur.objects.get(nombre=1)
+        resultat = self.importe(
+            cree_excel_s2i(
+                [
+                    ligne_s2i("s1", "Chaufferie", fonctions="(GTB)", description="v2"),
+                    ligne_s2i("s3", "Détection", domaine="SI_sécurité incendie", fonctions="(DIN)"),
+                ],
+                ordinateurs=[ligne_ordinateur("s1"), ligne_ordinateur("s3", nombre="3")],
+            ),
+            differentiel=True,
+        )
+        self.assertEqual(resultat.status, CeleryResultStatus.OK, resultat.messages)
+        messages = [k[1] for k in resultat.messages]
+        self.assertIn("import S2I - 1 créés, 1 mis à jour, 1 supprimés, 0 inchangés", messages)
+        self.assertIn("système industriel angers - ecole - climatisation supprimé", messages)
+        self.assertIn("localisation angers - ecole supprimée", messages)
+        self.assertIn("ordinateurs - 1 créés, 1 supprimés, 1 inchangés", messages)
+
+        self.assertQuerySetEqual(
+            SystemeIndustriel.objects.order_by("nom").values_list("nom", flat=True), ["chaufferie", "détection"]
+        )
+        chaufferie = SystemeIndustriel.objects.get(nom="chaufferie")
+        self.assertEqual(chaufferie.description, "v2")
+        self.assertQuerySetEqual(chaufferie.fonctions_metiers.values_list("code", flat=True), ["GTB"])
+        self.assertEqual(chaufferie.indice_criticite, chaufferie.criticite())
+        self.assertQuerySetEqual(chaufferie.materiels_it.all(), [ordinateur])
+        self.assertEqual(MaterielOrdinateur.objects.get(systeme__nom="détection").nombre, 3)
+        self.assertFalse(Localisation.objects.filter(nom_quartier="ecole").exists())
+
+    def test_import_differentiel_erreur(self):
+        """Si l'onglet a des erreurs, rien n'est supprimé : la ligne en erreur peut décrire un système existant"""
+        self.importe(cree_excel_s2i([ligne_s2i("s1", "Chaufferie"), ligne_s2i("s2", "Climatisation")]))
+        resultat = self.importe(
+            cree_excel_s2i([ligne_s2i("s1", "Chaufferie"), ligne_s2i("s2", "Climatisation", environnement="martien")]),
+            differentiel=True,
+        )
+        self.assertEqual(resultat.status, CeleryResultStatus.MAJOR)
+        self.assertIn(
+            "import S2I - l'onglet a des erreurs, les systèmes absents du fichier ne sont pas supprimés",
+            [k[1] for k in resultat.messages],
+        )
+        self.assertEqual(SystemeIndustriel.objects.count(), 2)
+
+    def test_import_nombre_requetes(self):
+        """Le nombre de requêtes de l'import ne dépend pas du nombre de lignes du fichier"""
+
+        def fichier(nombre: int, zone: str) -> bytes:
+            return cree_excel_s2i(
+                [ligne_s2i(f"s{k}", f"Système {k}", zone=zone, quartier=f"Quartier {k % 5}") for k in range(nombre)],
+                ordinateurs=[ligne_ordinateur(f"s{k}") for k in range(nombre)],
+                materiels=[ligne_materiel(f"s{k}") for k in range(nombre)],
+            )
+
+        petit, grand = fichier(5, "USID_ANGERS"), fichier(50, "USID_RENNES")
+        with CaptureQueriesContext(connection) as requetes_petit:
+            self.assertEqual(self.importe(petit).status, CeleryResultStatus.OK)
+        with CaptureQueriesContext(connection) as requetes_grand:
+            self.assertEqual(self.importe(grand).status, CeleryResultStatus.OK)
+        self.assertEqual(SystemeIndustriel.objects.filter(localisation__zone_usid=ZoneUsid.RVC).count(), 50)
+        self.assertEqual(MaterielEffecteur.objects.count(), 55)
+        self.assertEqual(len(requetes_petit), len(requetes_grand))
+
+
+@tag("tasks", "tasks-avancement")
+class AvancementTest(SimpleTestCase):
+    """Classe de test de la publication de l'avancement d'un import"""
+
+    def test_meta(self):
+        """Les lignes et erreurs de chaque onglet sont totalisées, le total est inconnu si un onglet ne l'a pas"""
+        avancement = Avancement()
+        avancement.ajoute_onglet("import S2I", 3)
+        avancement.ajoute_onglet("matériels intelligents", None)
+        avancement.ligne("import S2I")
+        avancement.ligne("import S2I", erreur=True)
+        avancement.ligne("matériels intelligents")
+        meta = avancement.meta()
+        self.assertEqual(
+            (meta["etape"], meta["onglet"], meta["lignes"], meta["total"], meta["erreurs"]),
+            (Avancement.ANALYSE, "matériels intelligents", 3, None, 1),
+        )
+        self.assertEqual(meta["onglets"]["import S2I"], {"lignes": 2, "total": 3, "erreurs": 1})
+        self.assertGreater(meta["debit"], 0)
+
+    def test_frequence_bornee(self):
+        """L'avancement n'est pas publié plus d'une fois par intervalle, quel que soit le nombre de lignes"""
+        publie = mock.Mock()
+        avancement = Avancement(publie, intervalle=3600)
+        avancement.ajoute_onglet("import S2I", 1000)
+        for _ in range(1000):
+            avancement.ligne("import S2I")
+        avancement.enregistre("import S2I")
+        publie.assert_called_once()
+        self.assertEqual(publie.call_args.args[0]["lignes"], 1)
+
+
+@tag("tasks", "tasks-structure")
+class StructureTest(SimpleTestCase):
+    """Classe de test du décodage des colonnes du fichier excel"""
+
+    def test_enumerations(self):
+        """Les valeurs sont décodées sans tenir compte de la casse, des espaces ni des apostrophes typographiques"""
+        s2i = ligne_s2i("s1", "Chaufferie", zone=" usid_rennes ", environnement="Nucléaire")
+        self.assertEqual(StructureLocalisation().get_zone_usid(s2i), ZoneUsid.RVC)
+        self.assertEqual(StructureLocalisation().get_protection(s2i), Localisation.Protection.TM)
+        self.assertEqual(StructureLocalisation().get_sensibilite(s2i), Localisation.Sensibilite.HAUTE)
+        self.assertEqual(StructureSystemeIndustriel().get_environnement(s2i), SystemeIndustriel.Environnement.NUC)
+        self.assertEqual(
+            StructureSystemeIndustriel().get_homologation_classe(s2i), SystemeIndustriel.ClasseHomologation.C1
+        )
+
+        ordinateur = ligne_ordinateur("s1")
+        ordinateur[8] = "Serveur d’annuaire"
+        ordinateur[11] = "linux (mode serveur)"
+        self.assertEqual(StructureMaterielOrdinateur().get_fonction(ordinateur), MaterielOrdinateur.Fonction.ANNUA)
+        self.assertEqual(StructureMaterielOrdinateur().get_os_famille(ordinateur), MaterielOrdinateur.FamilleOs.LIN_S)
+
+        materiel = ligne_materiel("s1")
+        for valeur, attendu in (("switch", MaterielEffecteur.Type.SWITCH), ("caméra", MaterielEffecteur.Type.CAMERA)):
+            materiel[7] = valeur
+            self.assertEqual(StructureMaterielEffecteur().get_type(materiel), attendu)
+
+    def test_valeur_inconnue(self):
+        """Une valeur inconnue est une erreur qui indique la colonne du fichier"""
+        with self.assertRaisesMessage(ImporteExcelError, "Colonne 10 : l'environnement 'martien' est inconnu"):
+            StructureSystemeIndustriel().get_environnement(ligne_s2i("s1", "Chaufferie", environnement="martien"))
+        with self.assertRaisesMessage(ImporteExcelError, "Colonne 12 : la fonction de domaine métier 'ASC'"):
+            StructureFonctionMetier().get_fonctions_metiers(ligne_s2i("s1", "Chaufferie", fonctions="(ASC)"), "GT")
+
+    def test_homologation_fin(self):
+        """Le mois de la date de fin d'homologation est bien lu (et non pas les minutes)"""
+        s2i = ligne_s2i("s1", "Chaufferie")
+        s2i[13] = "31/12/2025"
+        self.assertEqual(StructureSystemeIndustriel().get_homologation_fin(s2i), date(2025, 12, 31))
+
+
+@tag("tasks", "tasks-lot")
+class ImporteLotTest(SimpleTestCase):
+    """Classe de test de l'import d'un lot de fichiers excel"""
+
+    def test_agrege_resultats(self):
+        """Le compte-rendu du lot a le statut le plus grave et les messages de chaque zone, précédés de son bilan"""
+        resultat = agrege_resultats(
+            {
+                ZoneUsid.AMS: CeleryResult(
+                    status=CeleryResultStatus.OK,
+                    messages=[(CeleryResultMessageType.INFO, "systèmes industriels - 2 créés")],
+                ),
+                ZoneUsid.CBG: CeleryResult(
+                    status=CeleryResultStatus.MAJOR,
+                    messages=[(CeleryResultMessageType.ERROR, "Ligne 3 : zone inconnue")],
+                ),
+            }
+        )
+        self.assertEqual(resultat.status, CeleryResultStatus.MAJOR)
+        self.assertEqual(
+            resultat.messages,
+            [
+                (CeleryResultMessageType.SUCCESS, "USID d'Angers : importation réussie"),
+                (CeleryResultMessageType.INFO, "USID d'Angers - systèmes industriels - 2 créés"),
+                (CeleryResultMessageType.ERROR, "USID de Cherbourg : importation réussie avec des erreurs majeures"),
+                (CeleryResultMessageType.ERROR, "USID de Cherbourg - Ligne 3 : zone inconnue"),
+            ],
+        )
+
+    def test_vagues_import_lot(self):
+        """Les imports sont répartis en vagues d'au plus 'concurrence' zones, chacun avec son identifiant"""
+        fichiers = {zone: "%s.xlsx" % zone.value for zone in ZoneUsid}
+        vagues, identifiants = vagues_import_lot(fichiers, 3, verbosity=0, dry_run=True)
+        self.assertEqual([len(k.tasks) for k in vagues], [3, 3, 1])
+        self.assertEqual(len(set(identifiants.values())), len(ZoneUsid))
+        imports = [tache for vague in vagues for tache in vague.tasks]
+        self.assertEqual([k.args for k in imports], [(zone, nom) for zone, nom in fichiers.items()])
+        self.assertEqual([k.options["task_id"] for k in imports], list(identifiants.values()))
+        self.assertTrue(all(k.kwargs["dry_run"] for k in imports))
+
+    def test_vagues_import_crash(self):
+        """Une zone dont l'import plante est rapportée en crash, sans empêcher les vagues suivantes"""
+        importes = []
+
+        def importeur(zone, fichier, **kwargs):
+            importes.append(zone)
+            if zone == ZoneUsid.AMS:
+                raise DatabaseError("onglet illisible")
+            return mock.Mock(main=lambda: CeleryResult(status=CeleryResultStatus.OK, messages=[]))
+
+        fichiers = {ZoneUsid.AMS: "AMS.xlsx", ZoneUsid.BGA: "BGA.xlsx", ZoneUsid.CBG: "CBG.xlsx"}
+        vagues, _ = vagues_import_lot(fichiers, 1, verbosity=0, nettoie=False)
+        with mock.patch("inventaire.tasks.importe_excel.ImporteExcel", importeur):
+            crash = vagues[0].tasks[0].apply()
+            derniere = chain(*vagues).apply()
+        self.assertEqual(crash.state, "SUCCESS")
+        self.assertEqual(CeleryResult.model_validate(crash.result).status, CeleryResultStatus.CRASH)
+        self.assertEqual(importes, [ZoneUsid.AMS] + list(fichiers))
+        self.assertEqual(derniere.state, "SUCCESS")
+
+
+@tag("tasks", "tasks-lecteur")
+class ClasseurExcelTest(SimpleTestCase):
+    """Classe de test de la lecture en flux des onglets d'un fichier excel"""
+
+    def setUp(self):
+        self.fichier = BytesIO(
+            cree_excel(
+                {
+                    "premier": [
+                        ["nom", "nombre", "fin", "actif"],
+                        [],
+                        ["chaufferie", 3, date(2030, 2, 1), True],
+                        ["", "", TexteEnLigne("en ligne"), "", "nom"],
+                    ],
+                    "second": [["nom"], ["chaufferie"]],
+                }
+            )
+        )
+        self.classeur = ClasseurExcel(self.fichier, format_date="%d/%m/%Y")
+        self.addCleanup(self.classeur.close)
+
+    def test_index_colonne(self):
+        """Les références de cellules donnent l'index de leur colonne"""
+        self.assertEqual([index_colonne(k) for k in ("A1", "Z3", "AA10", "AZ2")], [0, 25, 26, 51])
+
+    def test_lignes(self):
+        """Les lignes et cellules vides sont complétées, les dates sont formatées"""
+        self.assertEqual(
+            list(self.classeur.lignes("premier")),
+            [
+                ["nom", "nombre", "fin", "actif"],
+                [],
+                ["chaufferie", "3", "01/02/2030", "TRUE"],
+                ["", "", "en ligne", "", "nom"],
+            ],
+        )
+
+    def test_chaines_partagees(self):
+        """La table des chaînes partagées est lue une fois et sert à tous les onglets"""
+        self.assertEqual(self.classeur._chaines, ["nom", "nombre", "fin", "actif", "chaufferie"])
+        self.assertEqual(list(self.classeur.lignes("second")), [["nom"], ["chaufferie"]])
+
+    def test_onglet_absent(self):
+        """Un onglet absent est signalé dès l'appel, avant le parcours"""
+        self.assertEqual(list(self.classeur.onglets), ["premier", "second"])
+        with self.assertRaises(LecteurExcelError):
+            self.classeur.lignes("LICENCES")
+
+    def test_nombre_lignes(self):
+        """Le nombre de lignes d'un onglet est lu dans sa dimension, sans parcourir les lignes"""
+        self.assertEqual(self.classeur.nombre_lignes("premier"), 4)
+        self.assertEqual(self.classeur.nombre_lignes("second"), 2)
+        with ClasseurExcel(BytesIO(cree_excel({"premier": [["nom"]]}, dimension=False))) as classeur:
+            self.assertIsNone(classeur.nombre_lignes("premier"))
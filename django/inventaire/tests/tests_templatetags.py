@@ -75,6 +75,16 @@ class LienPaginationTest(TestCase):
         self.context.get("hello", {"coucou": "oui", "haha": 0})
         self.assertEqual(lien_pagination(self.context, 1), "coucou=oui&haha=0&page=1")
 
+    def test_lien_pagination_curseur(self):
+        """Teste la fonction avec un curseur, qui remplace le numéro de page et le curseur inverse"""
+        self.context.get("hello", {"coucou": "oui", "page": 3, "avant": "abc"})
+        self.assertEqual(lien_pagination(self.context, "xyz", "apres"), "coucou=oui&apres=xyz")
+
+    def test_lien_pagination_premiere_page(self):
+        """Teste la fonction avec une valeur vide, qui retire tous les paramètres de pagination"""
+        self.context.get("hello", {"coucou": "oui", "page": 3, "apres": "abc"})
+        self.assertEqual(lien_pagination(self.context, None), "coucou=oui")
+
 
 @tag("templatetags", "templatetags-tag")
 class GetMailtoContactTest(TestCase):
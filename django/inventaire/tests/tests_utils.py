@@ -1,15 +1,33 @@
 """Définition des tests unitaires de l'inventaire pour les objets utilitaires"""
 
 import logging
-from tempfile import NamedTemporaryFile
+from hashlib import sha256
+from os import utime
+from pathlib import Path
+from io import BytesIO
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from time import time
+from zipfile import ZipFile
 
-from django.contrib.auth.models import User, Permission
-from django.test import TestCase, tag
+from django.contrib.auth.models import AnonymousUser, Group, User, Permission
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings, tag
+from django.urls import reverse
 
+from inventaire.models import ZoneUsid
+from inventaire.stockage import (
+    chemin_fichier_import,
+    enregistre_fichier_import,
+    enregistre_lot_import,
+    purge_fichiers_import,
+    ville_zone,
+    zone_fichier_import,
+)
 from inventaire.utils import (
     DomainesMetiersOfficiels,
     ModeRestriction,
     restreint_zone,
+    zones_utilisateur,
 )
 
 
@@ -103,3 +121,213 @@ class RestreintZoneTest(TestCase):
             restreint_zone(self.user_bssi, ModeRestriction.MODIFICATION),
             [],
         )
+
+
+@tag("utils", "utils-zones")
+class ZonesUtilisateurTest(TestCase):
+    """Classe de test de la résolution mémorisée des zones d'un utilisateur"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # un utilisateur ayant des droits directs et hérités d'un groupe
+        cls.groupe = Group.objects.create(name="RSSI-RVC")
+        cls.groupe.permissions.add(Permission.objects.get(codename="consult_RVC"))
+        cls.groupe.permissions.add(Permission.objects.get(codename="modif_RVC"))
+        cls.user = User.objects.create_user(
+            username="rssi",
+            password="rssi123",
+        )
+        cls.user.user_permissions.add(Permission.objects.get(codename="consult_AMS"))
+        cls.user.groups.add(cls.groupe)
+        # un super-utilisateur
+        cls.user_admin = User.objects.create_superuser(
+            username="admin",
+            password="admin123",
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_zones_groupes_et_directes(self):
+        """Les permissions directes et celles des groupes sont fusionnées"""
+        zones = zones_utilisateur(User.objects.get(pk=self.user.pk))
+        self.assertListEqual(zones.consultation, ["AMS", "RVC"])
+        self.assertListEqual(zones.modification, ["RVC"])
+
+    def test_zones_une_seule_requete(self):
+        """Les deux modes sont résolus en une requête, puis réutilisés sans en refaire"""
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            restreint_zone(user, ModeRestriction.CONSULTATION)
+            restreint_zone(user, ModeRestriction.MODIFICATION)
+            restreint_zone(user, ModeRestriction.CONSULTATION)
+
+    def test_zones_cache_partage(self):
+        """Une nouvelle requête (nouvel objet utilisateur) réutilise le cache partagé"""
+        zones_utilisateur(User.objects.get(pk=self.user.pk))
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertListEqual(restreint_zone(user, ModeRestriction.CONSULTATION), ["AMS", "RVC"])
+
+    def test_zones_invalidation_permission_utilisateur(self):
+        """L'ajout d'une permission directe invalide le cache"""
+        zones_utilisateur(User.objects.get(pk=self.user.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.add(Permission.objects.get(codename="modif_AMS"))
+        zones = zones_utilisateur(User.objects.get(pk=self.user.pk))
+        self.assertListEqual(zones.modification, ["AMS", "RVC"])
+
+    def test_zones_invalidation_permission_groupe(self):
+        """Le retrait d'une permission d'un groupe invalide le cache de ses membres"""
+        zones_utilisateur(User.objects.get(pk=self.user.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.groupe.permissions.remove(Permission.objects.get(codename="modif_RVC"))
+        zones = zones_utilisateur(User.objects.get(pk=self.user.pk))
+        self.assertListEqual(zones.modification, [])
+
+    def test_zones_invalidation_groupe_utilisateur(self):
+        """Le retrait d'un utilisateur de ses groupes invalide son cache, dans les deux sens de la relation"""
+        zones_utilisateur(User.objects.get(pk=self.user.pk))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.groupe.user_set.clear()
+        zones = zones_utilisateur(User.objects.get(pk=self.user.pk))
+        self.assertListEqual(zones.consultation, ["AMS"])
+
+    def test_zones_invalidation_apres_validation(self):
+        """Le cache n'est vidé qu'à la validation de la transaction, pas au retrait de la permission"""
+        zones_utilisateur(User.objects.get(pk=self.user.pk))
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.groupe.permissions.remove(Permission.objects.get(codename="modif_RVC"))
+            # une requête concurrente lit encore les anciens droits, depuis le cache
+            self.assertListEqual(zones_utilisateur(User.objects.get(pk=self.user.pk)).modification, ["RVC"])
+        self.assertEqual(len(callbacks), 1)
+        self.assertListEqual(zones_utilisateur(User.objects.get(pk=self.user.pk)).modification, [])
+
+    def test_zones_superutilisateur(self):
+        """Un super-utilisateur a accès à toutes les zones, sans requête"""
+        with self.assertNumQueries(0):
+            zones = zones_utilisateur(self.user_admin)
+        self.assertListEqual(zones.modification, ["AMS", "BGA", "CBG", "EVX", "OAN", "RVC", "TRS"])
+
+    def test_zones_anonyme(self):
+        """Un utilisateur anonyme n'a accès à aucune zone"""
+        zones = zones_utilisateur(AnonymousUser())
+        self.assertListEqual(zones.consultation, [])
+        self.assertListEqual(zones.modification, [])
+
+    def test_zones_middleware(self):
+        """Les zones sont attachées à la requête par l'intergiciel"""
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("inventaire:compte"))
+        self.assertListEqual(response.wsgi_request.zones.consultation, ["AMS", "RVC"])
+        self.assertListEqual(response.context["zones_modification"], ["RVC"])
+
+
+@tag("utils", "utils-stockage")
+class StockageImportTest(SimpleTestCase):
+    """Classe de test du stockage des fichiers excel d'import dans le dossier partagé"""
+
+    def setUp(self):
+        dossier = TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        self.dossier = Path(dossier.name) / "tempo"
+        reglages = override_settings(IMPORT_DOSSIER=self.dossier)
+        reglages.enable()
+        self.addCleanup(reglages.disable)
+
+    def test_enregistre_fichier(self):
+        """Le fichier est écrit morceau par morceau et nommé par l'empreinte de son contenu"""
+        nom = enregistre_fichier_import([b"PK", b"contenu"])
+        self.assertEqual(nom, sha256(b"PKcontenu").hexdigest() + ".xlsx")
+        self.assertEqual(chemin_fichier_import(nom).read_bytes(), b"PKcontenu")
+        self.assertEqual(enregistre_fichier_import([b"PKcontenu"]), nom)
+        self.assertEqual([k.name for k in self.dossier.iterdir()], [nom])
+
+    def test_enregistre_fichier_interrompu(self):
+        """Une écriture interrompue ne laisse aucun fichier"""
+
+        def morceaux():
+            yield b"PK"
+            raise IOError("connexion perdue")
+
+        with self.assertRaises(IOError):
+            enregistre_fichier_import(morceaux())
+        self.assertEqual(list(self.dossier.iterdir()), [])
+
+    def test_chemin_fichier_invalide(self):
+        """Seuls les noms créés par le stockage sont acceptés"""
+        for nom in ("../settings.py", "/etc/passwd", "a" * 64 + ".xlsx/..", "A" * 64 + ".xlsx"):
+            with self.assertRaises(ValueError):
+                chemin_fichier_import(nom)
+
+    def test_purge_fichiers(self):
+        """Seuls les fichiers d'import trop anciens sont supprimés"""
+        ancien = enregistre_fichier_import([b"ancien"])
+        recent = enregistre_fichier_import([b"recent"])
+        autre = self.dossier / "echange.txt"
+        autre.write_text("fichier de l'hôte")
+        for chemin in (chemin_fichier_import(ancien), autre):
+            utime(chemin, (time() - 7200, time() - 7200))
+        self.assertEqual(purge_fichiers_import(3600), 1)
+        self.assertCountEqual([k.name for k in self.dossier.iterdir()], [recent, "echange.txt"])
+
+    def test_zone_fichier(self):
+        """La zone d'un fichier est déduite de la ville de l'USID présente dans son nom"""
+        self.assertEqual(ville_zone(ZoneUsid.AMS), "Angers")
+        self.assertEqual(ville_zone(ZoneUsid.BGA), "Avord")
+        self.assertEqual(zone_fichier_import("inventaire AVORD 2024.xlsx"), ZoneUsid.BGA)
+        self.assertEqual(zone_fichier_import("evreux.xlsx"), ZoneUsid.EVX)
+        self.assertIsNone(zone_fichier_import("inventaire.xlsx"))
+        self.assertIsNone(zone_fichier_import("angers et évreux.xlsx"))
+
+    @staticmethod
+    def _archive(fichiers: dict[str, bytes]) -> BytesIO:
+        archive = BytesIO()
+        with ZipFile(archive, "w") as f:
+            for nom, contenu in fichiers.items():
+                f.writestr(nom, contenu)
+        archive.seek(0)
+        return archive
+
+    def test_enregistre_lot_archive(self):
+        """Chaque fichier excel de l'archive est enregistré pour sa zone, les autres fichiers sont ignorés"""
+        archive = self._archive(
+            {
+                "lot/USID Angers.xlsx": b"angers",
+                "lot/Évreux.xlsx": b"evreux",
+                "lot/~$Évreux.xlsx": b"verrou",
+                "lot/lisez-moi.txt": b"texte",
+            }
+        )
+        fichiers = enregistre_lot_import(archive)
+        self.assertEqual(
+            fichiers,
+            {
+                ZoneUsid.AMS: sha256(b"angers").hexdigest() + ".xlsx",
+                ZoneUsid.EVX: sha256(b"evreux").hexdigest() + ".xlsx",
+            },
+        )
+        self.assertEqual(chemin_fichier_import(fichiers[ZoneUsid.EVX]).read_bytes(), b"evreux")
+
+    def test_enregistre_lot_dossier(self):
+        """Les fichiers excel d'un dossier sont enregistrés comme ceux d'une archive"""
+        dossier = TemporaryDirectory()
+        self.addCleanup(dossier.cleanup)
+        (Path(dossier.name) / "cherbourg.xlsx").write_bytes(b"cherbourg")
+        (Path(dossier.name) / ".avord.xlsx").write_bytes(b"cache")
+        self.assertEqual(
+            enregistre_lot_import(dossier.name), {ZoneUsid.CBG: sha256(b"cherbourg").hexdigest() + ".xlsx"}
+        )
+
+    def test_enregistre_lot_invalide(self):
+        """Une zone inconnue, une zone en double, une archive invalide ou vide sont refusées"""
+        lots = (
+            (self._archive({"inventaire.xlsx": b"?"}), "impossible de déduire la zone"),
+            (self._archive({"angers.xlsx": b"1", "copie/angers.xlsx": b"2"}), "plusieurs fichiers"),
+            (self._archive({"lisez-moi.txt": b"texte"}), "aucun fichier excel"),
+            (BytesIO(b"pas une archive"), "l'archive zip est invalide"),
+        )
+        for lot, message in lots:
+            with self.subTest(message=message):
+                with self.assertRaisesMessage(ValueError, message):
+                    enregistre_lot_import(lot)
@@ -1,8 +1,10 @@
 """Définition des tests unitaires de l'inventaire pour les vues de l'API"""
 
 import logging
+from json import loads
 
 from django.contrib.auth.models import User, Permission
+from django.core.cache import cache
 from django.test import TestCase, tag
 from django.urls import reverse
 from django.utils.encoding import force_str
@@ -10,7 +12,9 @@ from django.utils.encoding import force_str
 from inventaire.models import (
     DomaineMetier,
     FonctionsMetier,
+    Interconnexion,
     Localisation,
+    SystemeIndustriel,
     ZoneUsid,
 )
 
@@ -65,6 +69,9 @@ class ApiVillesViewTest(TestCase):
             sensibilite=Localisation.Sensibilite.MOINDRE,
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
@@ -182,6 +189,9 @@ class ApiQuartiersViewTest(TestCase):
             sensibilite=Localisation.Sensibilite.MOINDRE,
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
@@ -320,6 +330,9 @@ class ApiZonesViewTest(TestCase):
             sensibilite=Localisation.Sensibilite.MOINDRE,
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
@@ -446,6 +459,9 @@ class ApiFonctionsMetierViewTest(TestCase):
             code="VS",
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
@@ -494,3 +510,236 @@ class ApiFonctionsMetierViewTest(TestCase):
             force_str(response.content),
             {"fonctions": [1, 2]},
         )
+
+
+@tag("views", "views-api", "views-api-parcours")
+class ApiParcoursViewTest(TestCase):
+    """Classe de test de la vue d'api du parcours des interconnexions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # utilisateur pouvant consulter la zone AMS
+        cls.user_ams = User.objects.create_user(
+            username="ams",
+            password="ams123",
+        )
+        cls.user_ams.user_permissions.add(Permission.objects.get(codename="consult_AMS"))
+        domaine = DomaineMetier.objects.create(nom="énergie électrique", code="EE")
+        angers, rennes = [
+            Localisation.objects.create(
+                zone_usid=zone,
+                nom_ville=ville,
+                nom_quartier="centre",
+                protection=Localisation.Protection.TM,
+                sensibilite=Localisation.Sensibilite.MOINDRE,
+            )
+            for zone, ville in ((ZoneUsid.AMS, "Angers"), (ZoneUsid.RVC, "Rennes"))
+        ]
+        cls.routeur, cls.poste, cls.serveur, cls.distant = [
+            SystemeIndustriel.objects.create(
+                localisation=localisation,
+                nom=nom,
+                environnement=SystemeIndustriel.Environnement.AUTRE,
+                domaine_metier=domaine,
+            )
+            for localisation, nom in ((angers, "routeur"), (angers, "poste"), (angers, "serveur"), (rennes, "distant"))
+        ]
+        Interconnexion.objects.relie(
+            [
+                Interconnexion(
+                    systeme_from=source,
+                    systeme_to=cible,
+                    type_reseau=reseau,
+                    type_liaison=Interconnexion.Liaison.FIL,
+                )
+                for source, cible, reseau in (
+                    (cls.routeur, cls.poste, Interconnexion.Reseau.NP_C),
+                    (cls.poste, cls.serveur, Interconnexion.Reseau.DR_I),
+                    (cls.routeur, cls.distant, Interconnexion.Reseau.NP_C),
+                )
+            ]
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self) -> None:
+        self.client.logout()
+
+    def _url(self, systeme: SystemeIndustriel, parametres="") -> str:
+        return reverse("inventaire:api_parcours", kwargs={"pk": systeme.pk}) + parametres
+
+    def test_api_anonyme(self):
+        """Un utilisateur non connecté sera redirigé vers la page de login"""
+        response = self.client.get(self._url(self.routeur))
+        self.assertRedirects(response, reverse("inventaire:login") + "?next=" + self._url(self.routeur))
+
+    def test_api_parcours(self):
+        """Les systèmes atteignables de la zone consultable sont renvoyés avec leur chemin"""
+        self.client.force_login(self.user_ams)
+        response = self.client.get(self._url(self.routeur))
+        self.assertEqual(response.status_code, 200)
+        self.assertJSONEqual(
+            force_str(response.content),
+            {
+                "origine": self.routeur.pk,
+                "tronque": False,
+                "systemes": [
+                    {
+                        "pk": self.poste.pk,
+                        "nom": "poste",
+                        "localisation": "Angers - centre",
+                        "distance": 1,
+                        "chemin": [self.routeur.pk, self.poste.pk],
+                    },
+                    {
+                        "pk": self.serveur.pk,
+                        "nom": "serveur",
+                        "localisation": "Angers - centre",
+                        "distance": 2,
+                        "chemin": [self.routeur.pk, self.poste.pk, self.serveur.pk],
+                    },
+                ],
+            },
+        )
+
+    def test_api_parametres(self):
+        """La profondeur, la limite et les réseaux suivis restreignent le parcours"""
+        self.client.force_login(self.user_ams)
+        for parametres, attendus in (
+            ("?profondeur=1", [self.poste.pk]),
+            ("?limite=1", [self.poste.pk]),
+            (f"?reseau={Interconnexion.Reseau.NP_C}", [self.poste.pk]),
+            (
+                f"?reseau={Interconnexion.Reseau.NP_C}&reseau={Interconnexion.Reseau.DR_I}",
+                [self.poste.pk, self.serveur.pk],
+            ),
+            ("?profondeur=0", []),
+        ):
+            with self.subTest(parametres=parametres):
+                response = self.client.get(self._url(self.routeur, parametres))
+                self.assertEqual([k["pk"] for k in response.json()["systemes"]], attendus)
+        self.assertTrue(self.client.get(self._url(self.routeur, "?limite=1")).json()["tronque"])
+
+    def test_api_origine_hors_zone(self):
+        """Un système d'une zone non consultable ne peut pas être l'origine d'un parcours"""
+        self.client.force_login(self.user_ams)
+        response = self.client.get(self._url(self.distant))
+        self.assertEqual(response.status_code, 404)
+
+
+@tag("views", "views-api", "views-api-graphe")
+class ApiGrapheViewTest(TestCase):
+    """Classe de test de la vue d'api d'export du graphe des interconnexions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # utilisateur pouvant consulter les zones AMS et RVC
+        cls.user_ams_rvc = User.objects.create_user(
+            username="ams-rvc",
+            password="ams-rvc123",
+        )
+        cls.user_ams_rvc.user_permissions.add(Permission.objects.get(codename="consult_AMS"))
+        cls.user_ams_rvc.user_permissions.add(Permission.objects.get(codename="consult_RVC"))
+        domaine = DomaineMetier.objects.create(nom="énergie électrique", code="EE")
+        angers, rennes, cherbourg = [
+            Localisation.objects.create(
+                zone_usid=zone,
+                nom_ville=ville,
+                nom_quartier="centre",
+                protection=Localisation.Protection.TM,
+                sensibilite=Localisation.Sensibilite.MOINDRE,
+            )
+            for zone, ville in ((ZoneUsid.AMS, "Angers"), (ZoneUsid.RVC, "Rennes"), (ZoneUsid.CBG, "Cherbourg"))
+        ]
+        cls.routeur, cls.poste, cls.corbeille, cls.distant = [
+            SystemeIndustriel.objects.create(
+                localisation=localisation,
+                nom=nom,
+                environnement=SystemeIndustriel.Environnement.AUTRE,
+                domaine_metier=domaine,
+                fiche_corbeille=corbeille,
+            )
+            for localisation, nom, corbeille in (
+                (angers, "routeur", False),
+                (rennes, "poste", False),
+                (angers, "ancien poste", True),
+                (cherbourg, "distant", False),
+            )
+        ]
+        Interconnexion.objects.relie(
+            [
+                Interconnexion(
+                    systeme_from=cls.poste,
+                    systeme_to=source,
+                    type_reseau=Interconnexion.Reseau.NP_C,
+                    type_liaison=Interconnexion.Liaison.FIL,
+                    protocole="modbus",
+                )
+                for source in (cls.routeur, cls.corbeille, cls.distant)
+            ]
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self) -> None:
+        self.client.logout()
+
+    def test_api_anonyme(self):
+        """Un utilisateur non connecté sera redirigé vers la page de login"""
+        response = self.client.get(reverse("inventaire:api_graphe"))
+        self.assertRedirects(response, reverse("inventaire:login") + "?next=" + reverse("inventaire:api_graphe"))
+
+    def test_api_ndjson(self):
+        """Le graphe des zones consultables est envoyé en flux, un objet par ligne et un lien par paire"""
+        self.client.force_login(self.user_ams_rvc)
+        response = self.client.get(reverse("inventaire:api_graphe"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lignes = [loads(k) for k in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(
+            lignes,
+            [
+                {
+                    "type": "noeud",
+                    "id": self.routeur.pk,
+                    "nom": "routeur",
+                    "criticite": self.routeur.indice_criticite,
+                    "domaine": "énergie électrique",
+                    "localisation": {"zone_usid": "AMS", "ville": "Angers", "quartier": "centre", "zone_quartier": ""},
+                },
+                {
+                    "type": "noeud",
+                    "id": self.poste.pk,
+                    "nom": "poste",
+                    "criticite": self.poste.indice_criticite,
+                    "domaine": "énergie électrique",
+                    "localisation": {"zone_usid": "RVC", "ville": "Rennes", "quartier": "centre", "zone_quartier": ""},
+                },
+                {
+                    "type": "lien",
+                    "source": self.routeur.pk,
+                    "cible": self.poste.pk,
+                    "type_reseau": "réseau connecté NP (type internet)",
+                    "type_liaison": "filaire",
+                    "protocole": "modbus",
+                },
+            ],
+        )
+
+    def test_api_json(self):
+        """Le format json produit un unique document, restreint aux zones demandées et consultables"""
+        self.client.force_login(self.user_ams_rvc)
+        response = self.client.get(reverse("inventaire:api_graphe") + "?format=json&usid=AMS&usid=CBG")
+        self.assertEqual(response["Content-Type"], "application/json")
+        graphe = loads(b"".join(response.streaming_content))
+        self.assertEqual([k["nom"] for k in graphe["noeuds"]], ["routeur"])
+        self.assertEqual(graphe["liens"], [])
+
+    def test_api_parametres_invalides(self):
+        """Des paramètres invalides donnent un graphe vide"""
+        self.client.force_login(self.user_ams_rvc)
+        response = self.client.get(reverse("inventaire:api_graphe") + "?format=xml")
+        self.assertEqual(b"".join(response.streaming_content), b"")
@@ -3,6 +3,7 @@
 import logging
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase, tag
 from django.urls import reverse
 
@@ -71,6 +72,9 @@ class HomeView(TestCase):
             password="lambda123",
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
@@ -100,6 +104,9 @@ class CompteView(TestCase):
             password="lambda123",
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
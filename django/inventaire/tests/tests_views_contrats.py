@@ -4,7 +4,8 @@ import logging
 from datetime import date
 
 from django.contrib.auth.models import User, Permission
-from django.test import TestCase, tag
+from django.core.cache import cache
+from django.test import TestCase, override_settings, tag
 from django.urls import reverse
 
 from inventaire.models import (
@@ -101,6 +102,9 @@ class ContratsRechercheViewTest(TestCase):
             est_actif=True,
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
@@ -137,6 +141,21 @@ class ContratsRechercheViewTest(TestCase):
             ContratMaintenance.objects.filter(pk__in=[1, 2, 4, 6]).order_by("zone_usid", "numero_marche"),
         )
 
+    @override_settings(PAGINATION_CURSEUR=True)
+    def test_recherche_pagination_curseur(self):
+        """Un utilisateur parcourt les contrats avec la pagination par curseur"""
+        cache.clear()
+        self.client.force_login(self.user_admin)
+        response = self.client.get(reverse("inventaire:contrats_recherche"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["page_obj"].total, 4)
+        self.assertFalse(response.context["page_obj"].has_previous())
+        self.assertFalse(response.context["page_obj"].has_next())
+        self.assertQuerySetEqual(
+            response.context["tous_contrats"],
+            ContratMaintenance.objects.filter(pk__in=[1, 2, 4, 6]).order_by("zone_usid", "numero_marche"),
+        )
+
     def test_recherche_filtre_invalid(self):
         """Un utilisateur filtre de manière invalide les contrats"""
         self.client.force_login(self.user_admin)
@@ -253,6 +272,9 @@ class ContratsCreationViewTest(TestCase):
             est_actif=True,
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
@@ -331,6 +353,9 @@ class ContratsModificationViewTest(TestCase):
             est_actif=True,
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
@@ -409,6 +434,7 @@ class ContratsSuppressionViewTest(TestCase):
         )
 
     def setUp(self) -> None:
+        cache.clear()
         # Un système sur la zone AMS
         ContratMaintenance.objects.create(
             pk=1,
@@ -535,6 +561,9 @@ class SystemesDetailsViewTest(TestCase):
             domaine_metier=DomaineMetier.objects.get(pk=1),
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
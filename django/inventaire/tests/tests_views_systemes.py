@@ -2,11 +2,17 @@
 
 import logging
 from datetime import date
+from io import StringIO
 
 from django.contrib.auth.models import User, Permission
-from django.test import TestCase, tag
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from inventaire.management.commands.compare_recherche import SCENARIOS
 from inventaire.models import (
     ContratMaintenance,
     DomaineMetier,
@@ -19,6 +25,8 @@ from inventaire.models import (
     SystemeIndustriel,
     ZoneUsid,
 )
+from inventaire.pagination import encode_curseur
+from inventaire.views import SystemesRechercheView
 
 
 logger = logging.getLogger(__name__)
@@ -170,6 +178,9 @@ class SystemesRechercheViewTest(TestCase):
             nombre=3,
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
@@ -298,6 +309,45 @@ class SystemesRechercheViewTest(TestCase):
             SystemeIndustriel.objects.filter(pk=2),
         )
 
+    def test_recherche_filtre_S2I_criticite(self):
+        """Un utilisateur filtre les systèmes par criticité minimale"""
+        self.client.force_login(self.user_admin)
+        response = self.client.get(reverse("inventaire:systemes_recherche") + "?s_criticite=1")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue("is_paginated" in response.context)
+        self.assertQuerySetEqual(
+            response.context["tous_sys_indus"],
+            SystemeIndustriel.objects.filter(indice_criticite__gte=1, fiche_corbeille=False).order_by(
+                "localisation__zone_usid", "nom"
+            ),
+        )
+        self.assertNotIn(SystemeIndustriel.objects.get(pk=2), response.context["tous_sys_indus"])
+
+    def test_recherche_nombre_requetes(self):
+        """Le nombre de requêtes d'une page de résultats ne dépend pas du nombre de systèmes affichés"""
+        self.client.force_login(self.user_admin)
+        with CaptureQueriesContext(connection) as requetes_initiales:
+            response = self.client.get(reverse("inventaire:systemes_recherche"))
+        self.assertEqual(len(response.context["tous_sys_indus"]), 3)
+        # remplit une page complète avec des localisations et domaines métiers tous différents
+        for k in range(60):
+            SystemeIndustriel.objects.create(
+                localisation=Localisation.objects.create(
+                    zone_usid=ZoneUsid.AMS,
+                    nom_ville="Angers",
+                    nom_quartier=f"Quartier {k}",
+                    protection=Localisation.Protection.TM,
+                    sensibilite=Localisation.Sensibilite.MOINDRE,
+                ),
+                nom=f"Système {k}",
+                environnement=SystemeIndustriel.Environnement.AUTRE,
+                domaine_metier=DomaineMetier.objects.create(code=f"D{k}", nom=f"Domaine {k}", coeff_criticite=1),
+            )
+        with CaptureQueriesContext(connection) as requetes_page_pleine:
+            response = self.client.get(reverse("inventaire:systemes_recherche"))
+        self.assertEqual(len(response.context["tous_sys_indus"]), 50)
+        self.assertEqual(len(requetes_page_pleine), len(requetes_initiales))
+
     def test_recherche_filtre_ordinateur_fonction(self):
         """Un utilisateur filtre les systèmes par fonction des ordinateurs/serveurs du S2I"""
         self.client.force_login(self.user_admin)
@@ -331,6 +381,102 @@ class SystemesRechercheViewTest(TestCase):
             SystemeIndustriel.objects.filter(pk=2),
         )
 
+    @override_settings(PAGINATION_CURSEUR=True)
+    def test_recherche_pagination_curseur(self):
+        """Un utilisateur parcourt les résultats page par page avec la pagination par curseur"""
+        cache.clear()
+        for k in range(120):
+            SystemeIndustriel.objects.create(
+                localisation=Localisation.objects.get(pk=1 + k % 3),
+                nom=f"Système {k:03d}",
+                environnement=SystemeIndustriel.Environnement.AUTRE,
+                domaine_metier=DomaineMetier.objects.get(pk=1),
+            )
+        attendu = list(
+            SystemeIndustriel.objects.filter(fiche_corbeille=False)
+            .order_by(*SystemesRechercheView.ordre_curseur)
+            .values_list("pk", flat=True)
+        )
+        self.client.force_login(self.user_admin)
+        # parcours en avant
+        pages, url = [], reverse("inventaire:systemes_recherche")
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context["page_obj"].total, 123)
+            pages.append([k.pk for k in response.context["tous_sys_indus"]])
+            curseur = response.context["page_obj"].curseur_suivant
+            url = reverse("inventaire:systemes_recherche") + f"?apres={curseur}" if curseur else None
+        self.assertEqual([len(k) for k in pages], [50, 50, 23])
+        self.assertEqual(sum(pages, []), attendu)
+        # parcours en arrière depuis la dernière page
+        precedent = response.context["page_obj"].curseur_precedent
+        response = self.client.get(reverse("inventaire:systemes_recherche") + f"?avant={precedent}")
+        self.assertEqual([k.pk for k in response.context["tous_sys_indus"]], pages[1])
+        self.assertTrue(response.context["page_obj"].has_previous())
+        self.assertTrue(response.context["page_obj"].has_next())
+
+    @override_settings(PAGINATION_CURSEUR=True)
+    def test_recherche_pagination_curseur_invalide(self):
+        """Un curseur invalide renvoie vers la première page"""
+        cache.clear()
+        self.client.force_login(self.user_admin)
+        response = self.client.get(reverse("inventaire:systemes_recherche") + "?apres=n'importe quoi")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context["page_obj"].has_previous())
+        self.assertQuerySetEqual(
+            response.context["tous_sys_indus"],
+            SystemeIndustriel.objects.filter(pk__in=[1, 2, 3]).order_by("localisation__zone_usid"),
+        )
+
+    @override_settings(PAGINATION_CURSEUR=True)
+    def test_recherche_pagination_curseur_modifie(self):
+        """Un curseur bien formé mais dont les valeurs ne correspondent pas aux champs de tri renvoie la première page"""
+        cache.clear()
+        self.client.force_login(self.user_admin)
+        taille = len(SystemesRechercheView.ordre_curseur)
+        for valeurs in (
+            ["AMS"] * taille,
+            [None] * taille,
+            [{"a": 1}] * taille,
+            ["AMS"] * (taille - 1) + [[1]],
+        ):
+            with self.subTest(valeurs=valeurs):
+                response = self.client.get(
+                    reverse("inventaire:systemes_recherche") + f"?apres={encode_curseur(valeurs)}"
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.context["page_obj"].has_previous())
+                self.assertEqual(len(response.context["tous_sys_indus"]), 3)
+
+    def test_recherche_filtre_sans_doublons(self):
+        """Un système dont plusieurs matériels et licences correspondent aux filtres n'apparait qu'une fois"""
+        MaterielOrdinateur.objects.create(
+            systeme=SystemeIndustriel.objects.get(pk=1),
+            fonction=MaterielOrdinateur.Fonction.SUPER,
+            marque="extreme serveur",
+            modele="Xtrem pro",
+            os_famille=MaterielOrdinateur.FamilleOs.WIN_S_22,
+        )
+        LicenceLogiciel.objects.create(
+            systeme=SystemeIndustriel.objects.get(pk=1),
+            editeur="ankamou",
+            logiciel="fodus pro",
+            version="5678",
+            licence="987654321",
+            date_fin=date(2027, 1, 1),
+        )
+        self.client.force_login(self.user_admin)
+        response = self.client.get(
+            reverse("inventaire:systemes_recherche") + "?o_marque_modele=extreme&l_editeur_logiciel=ankamou"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["paginator"].count, 1)
+        self.assertQuerySetEqual(
+            response.context["tous_sys_indus"],
+            SystemeIndustriel.objects.filter(pk=1),
+        )
+
     def test_recherche_filtre_ordinateur_modele(self):
         """Un utilisateur filtre les systèmes par modèle des ordinateurs/serveurs du S2I"""
         self.client.force_login(self.user_admin)
@@ -421,6 +567,33 @@ class SystemesRechercheViewTest(TestCase):
             SystemeIndustriel.objects.filter(pk=3),
         )
 
+    def test_recherche_jointures(self):
+        """Les filtres par jointures dédoublonnées donnent les mêmes systèmes que les sous-requêtes de la vue"""
+        criteres = {"s_metier": [2], "e_marque_modele": "buster", "l_fin": date(2025, 3, 6)}
+        for critere, valeur in criteres.items():
+            self.assertQuerySetEqual(
+                SystemeIndustriel.objects.recherche({critere: valeur}, jointures=True).distinct().order_by("pk"),
+                SystemeIndustriel.objects.recherche({critere: valeur}).order_by("pk"),
+            )
+
+
+@tag("commandes", "commandes-compare-recherche")
+class CompareRechercheTest(TestCase):
+    """Classe de test de la commande de comparaison des stratégies de recherche"""
+
+    def test_refus_hors_debug(self):
+        """La commande écrivant dans la base de donnée, elle refuse de tourner hors DEBUG sans '--force'"""
+        with self.assertRaises(CommandError):
+            call_command("compare_recherche", genere=10, stdout=StringIO())
+
+    def test_comparaison(self):
+        """Les scénarios sont mesurés sur un petit jeu de données, supprimé à la fin de la commande"""
+        sortie = StringIO()
+        call_command("compare_recherche", genere=20, repetitions=1, force=True, stdout=sortie)
+        self.assertEqual(sortie.getvalue().count("jointures + DISTINCT :"), len(SCENARIOS))
+        self.assertEqual(sortie.getvalue().count("EXISTS :"), len(SCENARIOS))
+        self.assertFalse(SystemeIndustriel.objects.exists())
+
 
 @tag("views", "views-systemes", "views-systemes-creation")
 class SystemesCreationViewTest(TestCase):
@@ -487,6 +660,9 @@ class SystemesCreationViewTest(TestCase):
         )
         SystemeIndustriel.objects.get(pk=1).fonctions_metiers.add(FonctionsMetier.objects.get(pk=1))
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
@@ -729,6 +905,9 @@ class SystemesModificationViewTest(TestCase):
             date_fin=date(2077, 7, 7),
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
@@ -918,6 +1097,7 @@ class SystemesSuppressionViewTest(TestCase):
         )
 
     def setUp(self) -> None:
+        cache.clear()
         # Un système sur la zone AMS
         SystemeIndustriel.objects.create(
             pk=1,
@@ -1118,6 +1298,9 @@ class SystemesDetailsViewTest(TestCase):
             domaine_metier=DomaineMetier.objects.get(pk=2),
         )
 
+    def setUp(self):
+        cache.clear()
+
     def tearDown(self) -> None:
         self.client.logout()
 
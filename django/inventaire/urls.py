@@ -32,6 +32,7 @@ urlpatterns = [
 
     # l'import des systèmes via fichiers excel (fonctionnalité temporaire)
     path("import", views.ImporteExcelView.as_view(), name="import_excel"),
+    path("import/lot", views.ImporteLotExcelView.as_view(), name="import_excel_lot"),
     path("import/<str:task_id>", views.ImporteExcelResultView.as_view(), name="import_excel_resultat"),
 
     # les chemins d'API pour les requêtes AJAX
@@ -39,6 +40,8 @@ urlpatterns = [
     path("api/quartiers", views.ApiQuartierView.as_view(), name="api_quartiers"),
     path("api/zones", views.ApiZoneView.as_view(), name="api_zones"),
     path("api/fonctions", views.ApiFonctionsMetierView.as_view(), name="api_fonctions"),
+    path("api/systemes/<int:pk>/parcours", views.ApiParcoursView.as_view(), name="api_parcours"),
+    path("api/graphe", views.ApiGrapheView.as_view(), name="api_graphe"),
     path("api/import/<str:task_id>", views.ApiImportExcelView.as_view(), name="api_import"),
 
     # chemin pour la carto
@@ -1,12 +1,24 @@
 """Définition de diverses fonctions utiles pour l'inventaire"""
 
+import logging
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
 from enum import IntEnum
+from functools import partial
 
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
 from django.core.management import call_command
+from django.db import transaction
+from django.db.models import Q
 from pydantic import BaseModel
 
 from inventaire.models import ZoneUsid
 
+logger = logging.getLogger(__name__)
+
 
 class DomainesMetiersOfficiels:
     """Les domaines métiers et leurs fonctions sont fixés par une note et énumérés ici"""
@@ -166,17 +178,117 @@ class ModeRestriction(IntEnum):
     MODIFICATION = 1
 
 
+class ZonesUtilisateur:
+    """Les zones qu'un utilisateur peut consulter et modifier, résolues en une seule requête"""
+
+    def __init__(self, consultation: list, modification: list):
+        """Initialisation de l'objet"""
+        self.consultation = consultation
+        self.modification = modification
+
+    @classmethod
+    def depuis_utilisateur(cls, user) -> "ZonesUtilisateur":
+        """Calcule les deux listes de zones à partir des permissions 'consult_' et 'modif_' de l'utilisateur
+
+        Les permissions directes et celles héritées des groupes sont obtenues par une unique requête.
+        Un super-utilisateur actif a accès à toutes les zones, un utilisateur inactif ou anonyme à aucune.
+        """
+        if not user.is_active or user.is_anonymous:
+            codes = set()
+        elif user.is_superuser:
+            codes = {f"{droit}_{k.value}" for k in ZoneUsid for droit in ("consult", "modif")}
+        else:
+            codes = set(
+                Permission.objects.filter(
+                    Q(user=user) | Q(group__user=user),
+                    content_type__app_label="inventaire",
+                    codename__in=[f"{droit}_{k.value}" for k in ZoneUsid for droit in ("consult", "modif")],
+                ).values_list("codename", flat=True)
+            )
+        return cls(
+            consultation=[k.value for k in ZoneUsid if f"consult_{k.value}" in codes],
+            modification=[k.value for k in ZoneUsid if f"modif_{k.value}" in codes],
+        )
+
+
+def _clef_cache_zones(pk) -> str:
+    """La clef du cache partagé contenant les zones d'un utilisateur"""
+    return f"inventaire:zones:{pk}"
+
+
+def zones_utilisateur(user) -> ZonesUtilisateur:
+    """Renvoi les zones consultables et modifiables de l'utilisateur
+
+    Le résultat est mémorisé sur l'objet utilisateur (comme le fait django pour ses permissions), ainsi toutes
+    les vues, formulaires et API traitant une même requête réutilisent le même calcul. Entre deux requêtes,
+    il est conservé dans le cache partagé et invalidé par les signaux de 'inventaire.signals'.
+    """
+    try:
+        return user._zones_cache
+    except AttributeError:
+        pass
+
+    if user.pk is None:  # utilisateur anonyme, rien à conserver
+        user._zones_cache = ZonesUtilisateur.depuis_utilisateur(user)
+        return user._zones_cache
+
+    en_cache = cache.get(_clef_cache_zones(user.pk))
+    if en_cache is None:
+        zones = ZonesUtilisateur.depuis_utilisateur(user)
+        cache.set(
+            _clef_cache_zones(user.pk),
+            (zones.consultation, zones.modification),
+            settings.CACHE_ZONES_DUREE,
+        )
+        logger.debug("zones de l'utilisateur '%s' résolues" % user)
+    else:
+        zones = ZonesUtilisateur(consultation=en_cache[0], modification=en_cache[1])
+    user._zones_cache = zones
+    return zones
+
+
+def invalide_zones_utilisateurs(pks) -> None:
+    """Supprime du cache partagé les zones des utilisateurs dont les droits ont changé
+
+    La suppression est faite une fois la transaction validée : une requête concurrente lisant encore les anciens
+    droits avant la validation les remettrait sinon en cache pour toute sa durée de vie.
+    """
+    clefs = [_clef_cache_zones(pk) for pk in pks]
+    if clefs:
+        transaction.on_commit(partial(cache.delete_many, clefs))
+        logger.debug("zones invalidées pour %s utilisateur(s)" % len(clefs))
+
+
+# les invalidations faites par les signaux, suspendues pendant les opérations en masse
+_invalidations_differees = ContextVar("invalidations_differees", default=False)
+
+
+@contextmanager
+def invalidations_differees() -> Iterator[None]:
+    """Suspend les invalidations des statistiques et des cartographies faites par les signaux, instance par instance
+
+    L'appelant (l'import excel notamment) les fait lui-même, une seule fois pour toutes les instances concernées.
+    """
+    jeton = _invalidations_differees.set(True)
+    try:
+        yield
+    finally:
+        _invalidations_differees.reset(jeton)
+
+
+def invalidations_suspendues() -> bool:
+    """Vrai à l'intérieur de 'invalidations_differees'"""
+    return _invalidations_differees.get()
+
+
 def restreint_zone(user, mode: ModeRestriction) -> list:
-    """Renvoi la liste des zones que l'utilisateur peut consulter"""
-    zone = []
-    for k in ZoneUsid:
-        if mode is ModeRestriction.CONSULTATION:
-            if user.has_perm(f"inventaire.consult_{k.value}"):
-                zone.append(k.value)
-        elif mode is ModeRestriction.MODIFICATION:
-            if user.has_perm(f"inventaire.modif_{k.value}"):
-                zone.append(k.value)
-    return zone
+    """Renvoi la liste des zones que l'utilisateur peut consulter ou modifier"""
+    zones = zones_utilisateur(user)
+    if mode is ModeRestriction.CONSULTATION:
+        return list(zones.consultation)
+    elif mode is ModeRestriction.MODIFICATION:
+        return list(zones.modification)
+    return []
 
 
 class CeleryResultStatus(IntEnum):
@@ -193,6 +305,13 @@ class CeleryResultMessageType(IntEnum):
     ERROR = 2
 
 
+class PolitiqueImport(IntEnum):
+    """Comportement d'un import en cas de lignes en erreur"""
+
+    GARDE_VALIDES = 0  # les lignes valides sont enregistrées
+    ANNULE = 1  # rien n'est enregistré
+
+
 class CeleryResult(BaseModel):
     status: CeleryResultStatus
     messages: list[tuple[CeleryResultMessageType, str]]
@@ -1,9 +1,6 @@
 """Définition des vues publiques de l'inventaire"""
 
 import logging
-from base64 import b64encode
-from io import BytesIO
-from json import dumps
 from subprocess import call
 
 from celery.result import AsyncResult
@@ -12,9 +9,8 @@ from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.views import LoginView as BaseLoginView
-from django.db.models import Case, CharField, Count, Value, When, Q
-from django.http import JsonResponse, HttpResponseRedirect
-from django.shortcuts import render
+from django.http import JsonResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
 from django.views import generic
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
@@ -29,13 +25,18 @@ from inventaire.forms import (
     ContratMaintenanceRechercheForm,
     ContratMaintenanceModificationForm,
     ImporteExcelForm,
+    ImporteLotExcelForm,
     ApiListeVillesForm,
     ApiListeQuartiersForm,
     ApiListeZoneForm,
     ApiListeFonctionsMetierForm,
+    ApiParcoursForm,
+    ApiGrapheForm,
     InterconnexionFormset,
     CartoForm,
 )
+from inventaire.cartographie import dessin_site
+from inventaire.graphe import FORMAT_NDJSON, exporte_graphe
 from inventaire.models import (
     ContratMaintenance,
     DomaineMetier,
@@ -47,13 +48,18 @@ from inventaire.models import (
     MaterielOrdinateur,
     SystemeIndustriel,
 )
+from inventaire.pagination import PaginationCurseurMixin
+from inventaire.parcours import atteignables
+from inventaire.statistiques import statistiques_accueil
+from inventaire.stockage import enregistre_fichier_import, enregistre_lot_import
 from inventaire.tasks import importe_excel
+from inventaire.tasks.importe_excel import ETAT_PROGRESSION
+from inventaire.tasks.importe_lot import avancement_lot, lance_import_lot
 from inventaire.utils import (
-    restreint_zone,
-    ModeRestriction,
     CeleryResult,
     CeleryResultStatus,
     CeleryResultMessageType,
+    PolitiqueImport,
 )
 
 logger = logging.getLogger(__name__)
@@ -88,59 +94,9 @@ class HomeView(LoginRequiredMixin, generic.View):
     template_name = "inventaire/accueil.html"
     menu_actif = "accueil"
 
-    def _graph_domaine_metier(self) -> tuple[list, list]:
-        """Récupère les données pour le graphique de répartition des domaines métiers"""
-        query = (
-            DomaineMetier.objects.filter(systemes__localisation__zone_usid__in=self.zones_consultables)
-            .annotate(nb=Count("systemes"))
-            .values("nom", "nb")
-        )
-        label = [k["nom"] for k in query]
-        data = [k["nb"] for k in query]
-        return label, data
-
-    def _graph_nom_ville(self) -> tuple[list, list]:
-        """Récupère les données pour le graphique de répartition par ville"""
-        query = (
-            Localisation.objects.filter(zone_usid__in=self.zones_consultables)
-            .values("nom_ville")
-            .annotate(nb=Count("systemes"))
-            .order_by("nom_ville")
-        )
-        label = [k["nom_ville"] for k in query]
-        data = [k["nb"] for k in query]
-        return label, data
-
-    def _graph_homologation_classe(self) -> tuple[list, list]:
-        """Récupère les données pour le graphique de répartition des homologations"""
-        homologations = [(k.value, k.label) for k in SystemeIndustriel.ClasseHomologation]
-        whens = [When(homologation_classe=k[0], then=Value(k[1])) for k in homologations]
-        query = (
-            SystemeIndustriel.objects.filter(localisation__zone_usid__in=self.zones_consultables)
-            .values("homologation_classe")
-            .annotate(nb=Count("homologation_classe"))
-            .annotate(humain_homologation=Case(*whens, output_field=CharField()))
-            .order_by("homologation_classe")
-        )
-
-        label = [k["humain_homologation"] for k in query]
-        data = [k["nb"] for k in query]
-        return label, data
-
     def get(self, request):
-        # nombre de S2I et de contrats total pour les zones consultables
-        self.zones_consultables = restreint_zone(request.user, ModeRestriction.CONSULTATION)
-        nb_systeme_total = SystemeIndustriel.objects.filter(localisation__zone_usid__in=self.zones_consultables).count()
-        nb_contrat_total = ContratMaintenance.objects.filter(zone_usid__in=self.zones_consultables).count()
-
-        # les données pour les graphiques
-        stat = {}
-        stat_domaine_metier = self._graph_domaine_metier()
-        stat["pie_domaine_metier"] = {"label": stat_domaine_metier[0], "data": stat_domaine_metier[1]}
-        stat_nom_ville = self._graph_nom_ville()
-        stat["pie_nom_ville"] = {"label": stat_nom_ville[0], "data": stat_nom_ville[1]}
-        stat_homologation = self._graph_homologation_classe()
-        stat["pie_homologation_classe"] = {"label": stat_homologation[0], "data": stat_homologation[1]}
+        # nombre de S2I et de contrats et données pour les graphiques, pour les zones consultables
+        statistiques = statistiques_accueil(request.zones.consultation)
 
         return render(
             request,
@@ -148,9 +104,9 @@ class HomeView(LoginRequiredMixin, generic.View):
             {
                 "user": request.user,
                 "actif": self.menu_actif,
-                "total_systemes": nb_systeme_total,
-                "total_contrats": nb_contrat_total,
-                "stat": stat,
+                "total_systemes": statistiques["total_systemes"],
+                "total_contrats": statistiques["total_contrats"],
+                "stat": statistiques["stat"],
             },
         )
 
@@ -165,8 +121,8 @@ class CompteView(LoginRequiredMixin, generic.View):
         contexte = {
             "actif": self.menu_actif,
             "user": request.user,
-            "zones_consultation": restreint_zone(request.user, ModeRestriction.CONSULTATION),
-            "zones_modification": restreint_zone(request.user, ModeRestriction.MODIFICATION),
+            "zones_consultation": request.zones.consultation,
+            "zones_modification": request.zones.modification,
             "groupes_fct": request.user.groups.values_list("name", flat=True),
         }
 
@@ -174,13 +130,21 @@ class CompteView(LoginRequiredMixin, generic.View):
 
 
 # les systèmes industriels
-class SystemesRechercheView(LoginRequiredMixin, generic.ListView):
+class SystemesRechercheView(LoginRequiredMixin, PaginationCurseurMixin, generic.ListView):
     """Page de recherche des systèmes industriels"""
 
     template_name = "inventaire/systemes_recherche.html"
     menu_actif = "systemes"
     context_object_name = "tous_sys_indus"
     paginate_by = 50
+    ordre_curseur = (
+        "localisation__zone_usid",
+        "localisation__nom_ville",
+        "localisation__nom_quartier",
+        "localisation__zone_quartier",
+        "nom",
+        "pk",
+    )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -189,69 +153,24 @@ class SystemesRechercheView(LoginRequiredMixin, generic.ListView):
     def get_queryset(self):
         # restreint les systèmes par rapport aux droits de l'utilisateur
         query = SystemeIndustriel.objects.filter(
-            localisation__zone_usid__in=restreint_zone(self.request.user, ModeRestriction.CONSULTATION),
+            localisation__zone_usid__in=self.request.zones.consultation,
             fiche_corbeille=False,
         )
         self._form = SystemeIndustrielRechercheForm(self.request.GET, user=self.request.user)
         if not self._form.is_valid():
             messages.add_message(self.request, messages.WARNING, "La recherche contient des paramètres invalides")
         else:
-            # par la table de localisation
-            if self._form.cleaned_data["z_usid"]:
-                query = query.filter(localisation__zone_usid__in=self._form.cleaned_data["z_usid"])
-            if self._form.cleaned_data["z_ville"]:
-                query = query.filter(localisation__nom_ville__in=self._form.cleaned_data["z_ville"])
-            if self._form.cleaned_data["z_quartier"]:
-                query = query.filter(localisation__nom_quartier__in=self._form.cleaned_data["z_quartier"])
-            # par la table des systèmes industriels
-            if self._form.cleaned_data["s_nom"]:
-                query = query.filter(nom__icontains=self._form.cleaned_data["s_nom"])
-            if self._form.cleaned_data["s_metier"]:
-                query = query.filter(domaine_metier__in=self._form.cleaned_data["s_metier"])
-            if self._form.cleaned_data["s_classe"]:
-                query = query.filter(homologation_classe__in=self._form.cleaned_data["s_classe"])
-            if self._form.cleaned_data["s_fin"]:
-                query = query.filter(homologation_fin__lt=self._form.cleaned_data["s_fin"])
-            # par la table des ordinateurs et serveurs
-            if self._form.cleaned_data["o_fonction"]:
-                query = query.filter(materiels_it__fonction__in=self._form.cleaned_data["o_fonction"])
-            if self._form.cleaned_data["o_famille"]:
-                query = query.filter(materiels_it__os_famille__in=self._form.cleaned_data["o_famille"])
-            if self._form.cleaned_data["o_marque_modele"]:
-                query = query.filter(
-                    Q(materiels_it__marque__icontains=self._form.cleaned_data["o_marque_modele"])
-                    | Q(materiels_it__modele__icontains=self._form.cleaned_data["o_marque_modele"])
-                )
-            if self._form.cleaned_data["e_type"]:
-                query = query.filter(materiels_ot__type__in=self._form.cleaned_data["e_type"])
-            if self._form.cleaned_data["e_marque_modele"]:
-                query = query.filter(
-                    Q(materiels_ot__marque__icontains=self._form.cleaned_data["e_marque_modele"])
-                    | Q(materiels_ot__modele__icontains=self._form.cleaned_data["e_marque_modele"])
-                )
-            # par la table des licences de logiciels
-            if self._form.cleaned_data["l_editeur_logiciel"]:
-                query = query.filter(
-                    Q(licences__editeur__icontains=self._form.cleaned_data["l_editeur_logiciel"])
-                    | Q(licences__logiciel__icontains=self._form.cleaned_data["l_editeur_logiciel"])
-                )
-            if self._form.cleaned_data["l_fin"]:
-                query = query.filter(licences__date_fin__lt=self._form.cleaned_data["l_fin"])
-
-        # trie et renvoi les systèmes
-        return query.order_by(
-            "localisation__zone_usid",
-            "localisation__nom_ville",
-            "localisation__nom_quartier",
-            "localisation__zone_quartier",
-            "nom",
-        ).distinct()
+            query = query.recherche(self._form.cleaned_data)
+
+        # trie et renvoi les systèmes, avec la localisation et le domaine métier affichés dans les résultats
+        # (seules des relations uniques sont jointes : pas de doublons, donc pas besoin de 'distinct')
+        return query.select_related("localisation", "domaine_metier").order_by(*self.ordre_curseur)
 
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
         data["actif"] = self.menu_actif
         data["recherche_systemes_form"] = self._form
-        data["droit_modification"] = restreint_zone(self.request.user, ModeRestriction.MODIFICATION) != []
+        data["droit_modification"] = self.request.zones.modification != []
         return data
 
 
@@ -264,7 +183,7 @@ class SystemesDetailsView(LoginRequiredMixin, generic.DetailView):
 
     def get_queryset(self):
         return SystemeIndustriel.objects.filter(
-            localisation__zone_usid__in=restreint_zone(self.request.user, ModeRestriction.CONSULTATION),
+            localisation__zone_usid__in=self.request.zones.consultation,
             fiche_corbeille=False,
         )  # permet de restreindre aux seuls systèmes dans la zone, car affichera un 404 sinon
 
@@ -281,9 +200,7 @@ class SystemesDetailsView(LoginRequiredMixin, generic.DetailView):
             "type", "marque", "modele"
         )
         data["licences"] = LicenceLogiciel.objects.filter(systeme=self.kwargs["pk"]).order_by("editeur", "logiciel")
-        data["droit_modification"] = self.object.localisation.zone_usid in restreint_zone(
-            self.request.user, ModeRestriction.MODIFICATION
-        )
+        data["droit_modification"] = self.object.localisation.zone_usid in self.request.zones.modification
         return data
 
 
@@ -376,7 +293,7 @@ class SystemesModificationView(LoginRequiredMixin, UpdateView):
 
     def get_queryset(self):
         return SystemeIndustriel.objects.filter(
-            localisation__zone_usid__in=restreint_zone(self.request.user, ModeRestriction.MODIFICATION),
+            localisation__zone_usid__in=self.request.zones.modification,
             fiche_corbeille=False,
         )  # permet de restreindre aux seuls systèmes dans la zone, car affichera un 404 sinon
 
@@ -473,7 +390,7 @@ class SystemesSuppressionView(LoginRequiredMixin, DeleteView):
 
     def get_queryset(self):
         return SystemeIndustriel.objects.filter(
-            localisation__zone_usid__in=restreint_zone(self.request.user, ModeRestriction.CONSULTATION),
+            localisation__zone_usid__in=self.request.zones.consultation,
             fiche_corbeille=False,
         )  # permet de restreindre aux seuls systèmes dans la zone, car affichera un 404 sinon
 
@@ -494,13 +411,14 @@ class SystemesSuppressionView(LoginRequiredMixin, DeleteView):
 
 
 # les contrats de maintenance
-class ContratRechercheView(LoginRequiredMixin, generic.ListView):
+class ContratRechercheView(LoginRequiredMixin, PaginationCurseurMixin, generic.ListView):
     """Page de recherche des contrats de maintenance"""
 
     template_name = "inventaire/contrats_recherche.html"
     menu_actif = "contrats"
     context_object_name = "tous_contrats"
     paginate_by = 50
+    ordre_curseur = ("zone_usid", "numero_marche", "pk")
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -509,7 +427,7 @@ class ContratRechercheView(LoginRequiredMixin, generic.ListView):
     def get_queryset(self):
         # restreint les contrats par rapport aux droits de l'utilisateur
         query = ContratMaintenance.objects.filter(
-            zone_usid__in=restreint_zone(self.request.user, ModeRestriction.CONSULTATION),
+            zone_usid__in=self.request.zones.consultation,
             fiche_corbeille=False,
         )
         self._form = ContratMaintenanceRechercheForm(self.request.GET, user=self.request.user)
@@ -530,17 +448,14 @@ class ContratRechercheView(LoginRequiredMixin, generic.ListView):
             if not self._form.cleaned_data["est_actif"]:  # vaut True si la case est cochée
                 query = query.filter(est_actif=True)
 
-        # trie et renvoi les systèmes
-        return query.order_by(
-            "zone_usid",
-            "numero_marche",
-        ).distinct()
+        # trie et renvoi les contrats (aucune jointure : pas de doublons)
+        return query.order_by(*self.ordre_curseur)
 
     def get_context_data(self, **kwargs):
         data = super().get_context_data(**kwargs)
         data["actif"] = self.menu_actif
         data["recherche_contrats_form"] = self._form
-        data["droit_modification"] = restreint_zone(self.request.user, ModeRestriction.MODIFICATION) != []
+        data["droit_modification"] = self.request.zones.modification != []
         return data
 
 
@@ -553,7 +468,7 @@ class ContratsDetailsView(LoginRequiredMixin, generic.DetailView):
 
     def get_queryset(self):
         return ContratMaintenance.objects.filter(
-            zone_usid__in=restreint_zone(self.request.user, ModeRestriction.CONSULTATION),
+            zone_usid__in=self.request.zones.consultation,
             fiche_corbeille=False,
         )  # permet de restreindre aux seuls contrats dans la zone, car affichera un 404 sinon
 
@@ -563,9 +478,7 @@ class ContratsDetailsView(LoginRequiredMixin, generic.DetailView):
         data["tous_systemes_lies"] = SystemeIndustriel.objects.filter(
             contrat_mcs=self.kwargs["pk"], fiche_corbeille=False
         )
-        data["droit_modification"] = self.object.zone_usid in restreint_zone(
-            self.request.user, ModeRestriction.MODIFICATION
-        )
+        data["droit_modification"] = self.object.zone_usid in self.request.zones.modification
         return data
 
 
@@ -618,7 +531,7 @@ class ContratsModificationView(LoginRequiredMixin, UpdateView):
 
     def get_queryset(self):
         return ContratMaintenance.objects.filter(
-            zone_usid__in=restreint_zone(self.request.user, ModeRestriction.MODIFICATION),
+            zone_usid__in=self.request.zones.modification,
             fiche_corbeille=False,
         )  # permet de restreindre aux seuls systèmes dans la zone, car affichera un 404 sinon
 
@@ -661,7 +574,7 @@ class ContratsSuppressionView(LoginRequiredMixin, DeleteView):
 
     def get_queryset(self):
         return ContratMaintenance.objects.filter(
-            zone_usid__in=restreint_zone(self.request.user, ModeRestriction.MODIFICATION),
+            zone_usid__in=self.request.zones.modification,
             fiche_corbeille=False,
         )  # permet de restreindre aux seuls systèmes dans la zone, car affichera un 404 sinon
 
@@ -685,42 +598,67 @@ class ContratsSuppressionView(LoginRequiredMixin, DeleteView):
 class ImporteExcelView(LoginRequiredMixin, generic.View):
     template_name = "inventaire/importe_excel.html"
     menu_actif = "import"
+    form_class = ImporteExcelForm
+    titre = "Import de fichier excel"
 
     def get(self, request):
         contexte = {
             "actif": self.menu_actif,
-            "form": ImporteExcelForm(),
+            "titre": self.titre,
+            "form": self.form_class(),
         }
         return render(request, self.template_name, contexte)
 
     def post(self, request):
         contexte = {
             "actif": self.menu_actif,
+            "titre": self.titre,
         }
-        mon_form = ImporteExcelForm(request.POST, request.FILES)
-        if not mon_form.is_valid():
+        mon_form = self.form_class(request.POST, request.FILES)
+        task = None
+        if mon_form.is_valid():
+            try:
+                task = self.lance_import(mon_form.cleaned_data)
+            except ValueError as e:
+                mon_form.add_error("fichier", str(e))
+
+        if task is None:
             messages.add_message(self.request, messages.ERROR, "Impossible de lancer l'importation")
             contexte["form"] = mon_form
             return render(request, self.template_name, contexte)
 
-        else:
-            # chargement du fichier en mémoire
-            with BytesIO() as f:
-                for chunk in request.FILES["fichier"].chunks():
-                    f.write(chunk)
-                f.seek(0)
-                encoded_excel = b64encode(f.read())
-            # lancement de la tache asynchrone
-            task = importe_excel.delay(
-                mon_form.cleaned_data["zone"],
-                encoded_excel,
-                verbosity=0,
-                nettoie=mon_form.cleaned_data["nettoie"],
-            )
-
         # renvoi la réponse
         return HttpResponseRedirect(reverse("inventaire:import_excel_resultat", args=[task.id]))
 
+    @staticmethod
+    def options_import(donnees: dict) -> dict:
+        """Les options de la tâche d'import choisies dans le formulaire"""
+        return {
+            "verbosity": 0,
+            "nettoie": donnees["nettoie"],
+            "politique": PolitiqueImport.ANNULE if donnees["annule_si_erreur"] else PolitiqueImport.GARDE_VALIDES,
+            "dry_run": donnees["dry_run"],
+            "differentiel": donnees["differentiel"],
+        }
+
+    def lance_import(self, donnees: dict) -> AsyncResult:
+        # écriture du fichier dans le dossier partagé avec celery, seul son nom est transmis à la tâche
+        nom_fichier = enregistre_fichier_import(self.request.FILES["fichier"].chunks())
+        # lancement de la tache asynchrone
+        return importe_excel.delay(donnees["zone"], nom_fichier, **self.options_import(donnees))
+
+
+class ImporteLotExcelView(ImporteExcelView):
+    """Import d'une archive zip contenant un fichier excel par zone, chaque zone est importée par sa propre tâche"""
+
+    form_class = ImporteLotExcelForm
+    titre = "Import d'un lot de fichiers excel"
+
+    def lance_import(self, donnees: dict) -> AsyncResult:
+        # la zone de chaque fichier est déduite de son nom, une erreur est levée si elle est inconnue
+        fichiers = enregistre_lot_import(self.request.FILES["fichier"])
+        return lance_import_lot(fichiers, settings.IMPORT_LOT_CONCURRENCE, **self.options_import(donnees))
+
 
 class ImporteExcelResultView(LoginRequiredMixin, generic.View):
     template_name = "inventaire/importe_excel_resultat.html"
@@ -728,7 +666,14 @@ class ImporteExcelResultView(LoginRequiredMixin, generic.View):
 
     def get(self, request, task_id):
         task = AsyncResult(task_id)
-        contexte = {"state": task.state, "state_str": "", "task_id": task_id, "result": None}
+        contexte = {
+            "state": task.state,
+            "state_str": "",
+            "task_id": task_id,
+            "result": None,
+            "avancement": avancement_lot(task_id),
+            "progression": None,
+        }
         match task.state:
             case states.PENDING:
                 contexte["state_str"] = "Importation en attente"
@@ -736,13 +681,15 @@ class ImporteExcelResultView(LoginRequiredMixin, generic.View):
                 contexte["state_str"] = "Importation en attente"
             case states.STARTED:
                 contexte["state_str"] = "Importation démarrée"
+            case _ if task.state == ETAT_PROGRESSION:  # état personnalisé, un nom simple ne peut servir de motif
+                contexte["state_str"] = "Importation en cours"
+                contexte["progression"] = task.info
             case states.FAILURE:
                 contexte["state_str"] = "Importation échouée"
                 contexte["result"] = CeleryResult(
                     status=CeleryResultStatus.CRASH,
                     messages=[
-                        (CeleryResultMessageType.ERROR,
-                        "Crash inattendu, consulter les logs pour plus de détails")
+                        (CeleryResultMessageType.ERROR, "Crash inattendu, consulter les logs pour plus de détails")
                     ],
                 )
             case states.SUCCESS:
@@ -761,7 +708,7 @@ class ApiVillesView(LoginRequiredMixin, generic.View):
 
         if mon_form.is_valid():
             query = (
-                Localisation.objects.filter(zone_usid__in=restreint_zone(request.user, ModeRestriction.CONSULTATION))
+                Localisation.objects.filter(zone_usid__in=request.zones.consultation)
                 .filter(zone_usid__in=mon_form.cleaned_data["usid"])
                 .values_list("nom_ville", flat=True)
                 .distinct()
@@ -777,7 +724,7 @@ class ApiQuartierView(LoginRequiredMixin, generic.View):
         mon_form = ApiListeQuartiersForm(self.request.GET)
         if mon_form.is_valid():
             query = (
-                Localisation.objects.filter(zone_usid__in=restreint_zone(request.user, ModeRestriction.CONSULTATION))
+                Localisation.objects.filter(zone_usid__in=request.zones.consultation)
                 .filter(nom_ville__in=mon_form.cleaned_data["ville"])
                 .values_list("nom_quartier", flat=True)
                 .distinct()
@@ -793,7 +740,7 @@ class ApiZoneView(LoginRequiredMixin, generic.View):
         mon_form = ApiListeZoneForm(request.GET)
         if mon_form.is_valid():
             query = (
-                Localisation.objects.filter(zone_usid__in=restreint_zone(request.user, ModeRestriction.CONSULTATION))
+                Localisation.objects.filter(zone_usid__in=request.zones.consultation)
                 .filter(nom_quartier__in=mon_form.cleaned_data["quartier"])
                 .values_list("zone_quartier", flat=True)
                 .distinct()
@@ -818,14 +765,84 @@ class ApiFonctionsMetierView(LoginRequiredMixin, generic.View):
         return JsonResponse({"fonctions": []})
 
 
+class ApiParcoursView(LoginRequiredMixin, generic.View):
+    """Page d'accès API pour obtenir les systèmes atteignables depuis un système, et le plus court chemin vers eux
+
+    Seuls les systèmes des zones consultables sont parcourus. Les paramètres 'profondeur' et 'limite' bornent le
+    nombre de sauts et de systèmes renvoyés, 'reseau' restreint les interconnexions suivies à ces types de réseau.
+    """
+
+    def get(self, request, pk):
+        origine = get_object_or_404(
+            SystemeIndustriel,
+            pk=pk,
+            localisation__zone_usid__in=request.zones.consultation,
+            fiche_corbeille=False,
+        )
+        mon_form = ApiParcoursForm(request.GET)
+        if not mon_form.is_valid():
+            return JsonResponse({"origine": origine.pk, "tronque": False, "systemes": []})
+
+        resultat, tronque = atteignables(
+            origine.pk,
+            request.zones.consultation,
+            mon_form.cleaned_data["profondeur"],
+            mon_form.cleaned_data["limite"],
+            mon_form.cleaned_data["reseau"],
+        )
+        systemes = SystemeIndustriel.objects.select_related("localisation").in_bulk([k.pk for k in resultat])
+        return JsonResponse(
+            {
+                "origine": origine.pk,
+                "tronque": tronque,
+                "systemes": [
+                    {
+                        "pk": k.pk,
+                        "nom": systemes[k.pk].nom,
+                        "localisation": str(systemes[k.pk].localisation),
+                        "distance": k.distance,
+                        "chemin": list(k.chemin),
+                    }
+                    for k in resultat
+                ],
+            }
+        )
+
+
+class ApiGrapheView(LoginRequiredMixin, generic.View):
+    """Page d'accès API pour exporter en flux le graphe des interconnexions des zones consultables
+
+    Le paramètre 'usid' restreint l'export à certaines zones, 'format' choisit entre NDJSON (par défaut) et json.
+    """
+
+    def get(self, request):
+        mon_form = ApiGrapheForm(request.GET)
+        zones, format_export = [], FORMAT_NDJSON
+        if mon_form.is_valid():
+            zones = request.zones.consultation
+            if mon_form.cleaned_data["usid"]:
+                zones = [k for k in zones if k in mon_form.cleaned_data["usid"]]
+            format_export = mon_form.cleaned_data["format"]
+        content_type = "application/x-ndjson" if format_export == FORMAT_NDJSON else "application/json"
+        return StreamingHttpResponse(
+            exporte_graphe(zones, format_export, settings.GRAPHE_TAILLE_LOT), content_type=content_type
+        )
+
+
 class ApiImportExcelView(LoginRequiredMixin, generic.View):
     """Page d'accès API pour obtenir le status de la commande d'import excel"""
 
     def get(self, request, task_id):
         if request.user.is_staff:
             task = AsyncResult(task_id)
-            return JsonResponse({"status": task.state})
-        return JsonResponse({"status": None})
+            return JsonResponse(
+                {
+                    "status": task.state,
+                    "avancement": avancement_lot(task_id),
+                    "progression": task.info if task.state == ETAT_PROGRESSION else None,
+                }
+            )
+        return JsonResponse({"status": None, "avancement": None, "progression": None})
 
 
 # test de cartographie de site
@@ -842,139 +859,12 @@ class CartoView(LoginRequiredMixin, generic.View):
             if request.GET:  # si des paramètres GET sont présents
                 messages.add_message(self.request, messages.WARNING, "La requête contient des paramètres invalides")
         else:
-            localisation_usid = mon_form.cleaned_data["usid"]
-            localisation_ville = mon_form.cleaned_data["ville"]
-            localisation_quartier = mon_form.cleaned_data["quartier"]
-            toutes_localisations = Localisation.objects.filter(
-                zone_usid=localisation_usid, nom_ville=localisation_ville, nom_quartier=localisation_quartier
-            )
-            if toutes_localisations:
-                localisation = f"{toutes_localisations[0].get_zone_usid_display()} - {localisation_ville} - {localisation_quartier}"
-                mode = int(mon_form.cleaned_data["moteur"])
-
-                tous_systemes_locaux = set(
-                    SystemeIndustriel.objects.filter(localisation__in=toutes_localisations, fiche_corbeille=False)
-                )
-                tous_systemes_distants = set()
-                for temp_sys_local in tous_systemes_locaux:
-                    for temp_sys_connecte in temp_sys_local.systemes_connectes.all():
-                        if (
-                            temp_sys_connecte.localisation not in toutes_localisations
-                            and not temp_sys_connecte.fiche_corbeille
-                        ):
-                            tous_systemes_distants.add(temp_sys_connecte)
-                tous_systemes = {}
-                for temp_sys in tous_systemes_locaux.union(tous_systemes_distants):
-                    if temp_sys.localisation in tous_systemes:
-                        tous_systemes[temp_sys.localisation].append(temp_sys)
-                    else:
-                        tous_systemes[temp_sys.localisation] = [temp_sys]
-
-                # dessin avec GoJS
-                if mode == 1:
-                    dessin = {"class": "GraphLinksModel", "nodeDataArray": [], "linkDataArray": []}
-                    dessin["nodeDataArray"].append(
-                        {"key": "base", "text": localisation, "color": "#fcecea", "isGroup": True}
-                    )
-                    for temp_lieu in tous_systemes:
-                        if (
-                            temp_lieu.nom_ville == localisation_ville
-                            and temp_lieu.nom_quartier == localisation_quartier
-                        ):
-                            is_local = True
-                            group_color = "DarkRed"
-                            box_color = "LightCoral"
-                        else:
-                            is_local = False
-                            group_color = "RoyalBlue"
-                            box_color = "SkyBlue"
-
-                        if is_local:
-                            dessin["nodeDataArray"].append(
-                                {
-                                    "key": f"loc_{temp_lieu.pk}",
-                                    "text": str(temp_lieu),
-                                    "color": group_color,
-                                    "isGroup": True,
-                                    "group": "base",
-                                }
-                            )
-                        else:
-                            dessin["nodeDataArray"].append(
-                                {
-                                    "key": f"loc_{temp_lieu.pk}",
-                                    "text": str(temp_lieu),
-                                    "color": group_color,
-                                    "isGroup": True,
-                                }
-                            )
-                        for temp_sys in tous_systemes[temp_lieu]:
-                            dessin["nodeDataArray"].append(
-                                {
-                                    "key": temp_sys.pk,
-                                    "text": temp_sys.nom,
-                                    "color": box_color,
-                                    "group": f"loc_{temp_lieu.pk}",
-                                }
-                            )
-
-                    for i in Interconnexion.objects.filter(systeme_from__in=tous_systemes_locaux):
-                        # retire les doublons dans les interconnections des systèmes locaux entre eux
-                        if (
-                            not {"from": i.systeme_to.pk, "to": i.systeme_from.pk, "text": i.get_type_liaison_display()}
-                            in dessin["linkDataArray"]
-                        ):
-                            dessin["linkDataArray"].append(
-                                {"from": i.systeme_from.pk, "to": i.systeme_to.pk, "text": i.get_type_liaison_display()}
-                            )
-                    dessin = dumps(dessin)
-
-                # dessin avec MermaidJS
-                elif mode == 0:
-                    mermaid_local = ["graph TB", f"subgraph C[{localisation_ville} - {localisation_quartier}]"]
-                    mermaid_distant = []
-                    mermaid_liens = []
-                    mermaid_color = ["style C fill:#fcecea, stroke: DarkRed"]
-                    for temp_lieu in tous_systemes:
-                        if (
-                            temp_lieu.nom_ville == localisation_ville
-                            and temp_lieu.nom_quartier == localisation_quartier
-                        ):
-                            is_local = True
-                            group_color = "LightCoral"
-                            box_color = "MistyRose"
-                            stroke_color = "DarkRed"
-                        else:
-                            is_local = False
-                            group_color = "LightBlue"
-                            box_color = "LightCyan"
-                            stroke_color = "RoyalBlue"
-                        if is_local:
-                            mermaid_local.append(f"subgraph B{temp_lieu.pk}[{str(temp_lieu)}]")
-                        else:
-                            mermaid_distant.append(f"subgraph B{temp_lieu.pk}[{str(temp_lieu)}]")
-                        mermaid_color.append(f"style B{temp_lieu.pk} fill: {group_color}, stroke: {stroke_color}")
-                        for temp_sys in tous_systemes[temp_lieu]:
-                            if is_local:
-                                mermaid_local.append(f'A{temp_sys.pk}("{temp_sys.nom}")')
-                            else:
-                                mermaid_distant.append(f'A{temp_sys.pk}("{temp_sys.nom}")')
-                            mermaid_color.append(f"style A{temp_sys.pk} fill: {box_color}, stroke: {stroke_color}")
-                        if is_local:
-                            mermaid_local.append("end")
-                        else:
-                            mermaid_distant.append("end")
-
-                    for i in Interconnexion.objects.filter(systeme_from__in=tous_systemes_locaux):
-                        # retire les doublons dans les interconnections des systèmes locaux entre eux
-                        if (
-                            not f"A{i.systeme_to.pk} <-- {i.get_type_liaison_display()} --> A{i.systeme_from.pk}"
-                            in mermaid_liens
-                        ):
-                            mermaid_liens.append(
-                                f"A{i.systeme_from.pk} <-- {i.get_type_liaison_display()} --> A{i.systeme_to.pk}"
-                            )
-                    dessin = "\n".join(mermaid_local + ["end"] + mermaid_distant + mermaid_liens + mermaid_color)
+            site = (mon_form.cleaned_data["usid"], mon_form.cleaned_data["ville"], mon_form.cleaned_data["quartier"])
+            moteur = int(mon_form.cleaned_data["moteur"])
+            resultat = dessin_site(site, moteur)
+            if resultat is not None:
+                localisation, dessin = resultat
+                mode = moteur
 
         contexte = {
             "actif": self.menu_actif,
@@ -52,6 +52,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "inventaire.middleware.ZonesUtilisateurMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -92,6 +93,24 @@ DATABASES = {
     }
 }
 
+# Cache partagé entre les requêtes (redis en production, mémoire locale en développement)
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHE_URL = getenv("CACHE_URL")
+if CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
 
@@ -162,6 +181,19 @@ LOGGING = {
 
 MAIL_CONTACT = getenv("MAIL_CONTACT", "")
 DEMO_BANNER = getenv("DEMO_BANNER", "true").lower() == "true"
+CACHE_ZONES_DUREE = int(getenv("CACHE_ZONES_DUREE", "3600"))  # durée de vie (s) des zones d'un utilisateur en cache
+PAGINATION_CURSEUR = getenv("PAGINATION_CURSEUR", "false").lower() == "true"  # pagination par curseur des recherches
+CACHE_PAGINATION_DUREE = int(getenv("CACHE_PAGINATION_DUREE", "60"))  # durée de vie (s) du nombre de résultats en cache
+CACHE_STATISTIQUES_DUREE = int(getenv("CACHE_STATISTIQUES_DUREE", "300"))  # durée de vie (s) des statistiques en cache
+CACHE_CARTOGRAPHIE_DUREE = int(getenv("CACHE_CARTOGRAPHIE_DUREE", "3600"))  # durée de vie (s) des cartes en cache
+STATISTIQUES_DELAI_EXPIRATION = int(getenv("STATISTIQUES_DELAI_EXPIRATION", "90"))  # échéance (j) des expirations
+IMPORT_DOSSIER = Path(getenv("IMPORT_DOSSIER", BASE_DIR / "tempo"))  # dossier partagé des fichiers d'import
+IMPORT_CONSERVATION = int(getenv("IMPORT_CONSERVATION", "86400"))  # durée de conservation (s) des fichiers d'import
+IMPORT_LOT_CONCURRENCE = int(getenv("IMPORT_LOT_CONCURRENCE", "2"))  # nombre de zones importées en même temps
+IMPORT_AVANCEMENT_INTERVALLE = float(getenv("IMPORT_AVANCEMENT_INTERVALLE", "1"))  # délai (s) entre deux avancements
+PARCOURS_PROFONDEUR_MAX = int(getenv("PARCOURS_PROFONDEUR_MAX", "6"))  # nombre maximal de sauts d'un parcours
+PARCOURS_LIMITE_MAX = int(getenv("PARCOURS_LIMITE_MAX", "1000"))  # nombre maximal de systèmes d'un parcours
+GRAPHE_TAILLE_LOT = int(getenv("GRAPHE_TAILLE_LOT", "2000"))  # nombre de lignes lues par lot lors d'un export
 
 
 # celery async workers
@@ -169,3 +201,16 @@ DEMO_BANNER = getenv("DEMO_BANNER", "true").lower() == "true"
 CELERY_BROKER_URL = getenv("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = getenv("CELERY_RESULT_BACKEND")
 CELERY_TASK_TRACK_STARTED = getenv("CELERY_TASK_TRACK_STARTED", "true").lower() == "true"
+CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+CELERY_BEAT_SCHEDULE = {
+    # recalcule les statistiques précalculées de chaque zone d'USID
+    "rafraichit-statistiques": {
+        "task": "inventaire.tasks.statistiques.rafraichit_statistiques",
+        "schedule": int(getenv("STATISTIQUES_PERIODE", "900")),
+    },
+    # supprime les fichiers d'import trop anciens du dossier partagé
+    "purge-imports": {
+        "task": "inventaire.tasks.importe_excel.purge_imports",
+        "schedule": 3600,
+    },
+}